@@ -7,6 +7,8 @@ from app.db.base import get_db
 from app.models.outgoing_domain import OutgoingDomain
 from app.auth.auth import get_current_active_user
 from app.models.user import User
+from app.core.config import settings
+from app.core.response_cache import CACHE_DOMAINS, response_cache
 
 router = APIRouter(prefix="/domains", tags=["domains"])
 
@@ -47,6 +49,7 @@ async def create_domain(
     db.add(new_domain)
     await db.commit()
     await db.refresh(new_domain)
+    response_cache.invalidate(CACHE_DOMAINS)
     
     return {"success": True, "domain": new_domain.domain}
 
@@ -55,12 +58,16 @@ async def list_domains(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
+    # La lista es la misma para todos los usuarios
+    cached = response_cache.get(CACHE_DOMAINS, None)
+    if cached is not None:
+        return cached
     result = await db.execute(
         select(OutgoingDomain).where(OutgoingDomain.is_active == True)
     )
     domains = result.scalars().all()
     
-    return [
+    return response_cache.store(CACHE_DOMAINS, None, None, [
         DomainResponse(
             id=d.id,
             domain=d.domain,
@@ -69,7 +76,7 @@ async def list_domains(
             is_active=d.is_active,
             created_at=d.created_at.isoformat()
         ) for d in domains
-    ]
+    ], settings.RESPONSE_CACHE_TTL_DOMAINS)
 
 @router.delete("/{domain_id}")
 async def delete_domain(
@@ -88,5 +95,6 @@ async def delete_domain(
     
     domain.is_active = False
     await db.commit()
+    response_cache.invalidate(CACHE_DOMAINS)
     
     return {"success": True}
@@ -1,37 +1,63 @@
 import os
+import io
+import csv
 import json
+import zlib
 import logging
-import smtplib
+import aiosmtplib
+import re
+import time
+import html
 import asyncio
+import uuid
 import boto3
 import requests
-import httpx
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import update
+from sqlalchemy import delete, update, insert
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional, Dict, Any
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
+from typing import List, Optional, Dict, Any, Union
 from botocore.exceptions import ClientError
-from app.db.base import get_db
+from app.db.base import AsyncSessionLocal, get_db
 from app.models.email_log import EmailLog
+from app.models.email_open_event import EmailOpenEvent
+from app.models.email_click import EmailClick
+from app.models.email_link import EmailLink
 from app.models.mailbox import Mailbox
 from app.auth.auth import get_current_active_user
 from app.models.user import User
 from app.core.config import settings
-
-# Advanced tracking imports
-try:
-    import user_agents
-    import geoip2.database
-except ImportError:
-    user_agents = None
-    geoip2 = None
+from app.core.http_client import get_provider_client, get_provider_pool_stats
+from app.core.smtp_pool import smtp_pools
+from app.core.retry import is_retryable_exception, is_retryable_status
+from app.core.rate_limit import Quota, rate_limiter
+from app.core.mime_compiler import CompiledMessage, compiled_messages
+from app.core.merge_templates import EMAIL_LOG_ID_TAG, compiled_templates, format_value, pixel_slot_index
+from app.core.click_tracking import (
+    CLICK_SIGNATURE_TAG, click_recorder, click_signature, link_tracker, parse_click_token, sign_click_links
+)
+from app.core.open_tracking import open_recorder
+from app.core.enrichment import enrich, enrichment_stats
+from app.core.open_classifier import open_classifier
+from app.core.email_stats import (
+    INTERVALS, STAT_OPENS, apply_stats, get_stats_totals, get_timeseries, naive_utc,
+    removal_deltas, series_size
+)
+from app.core.attachment_cache import attachment_cache, resolve_upload
+from app.core.response_cache import CACHE_HISTORY, CACHE_STATS, response_cache
+from app.core.pagination import (
+    decode_cursor, decode_search_cursor, encode_cursor, encode_search_cursor, history_query, next_cursor
+)
+from app.core.email_search import parse_search, search_query
+from app.core.log_archive import find_archived, list_archives, parse_month, read_archive_page
+from app.core.email_bulk import bulk_conditions, bulk_delete, bulk_requeue, failed_by_mailbox
+from app.core.email_queue import (
+    STATUS_PENDING, STATUS_SENDING, STATUS_SENT, STATUS_FAILED,
+    complete_email_logs, get_queue_depth, lease_deadline, default_worker_id, hold_leases
+)
 
 BASE_URL = settings.EMAIL_PLATFORM_API_URL
 
@@ -40,15 +66,27 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/emails", tags=["emails"])
 
-def add_tracking_pixel(html_body: str, email_log_id: int) -> str:
+# Marcador que SendGrid sustituye por el id del log en cada personalization
+SENDGRID_TRACKING_TAG = EMAIL_LOG_ID_TAG
+SENDGRID_PERSONALIZATION_FIELD = re.compile(r"personalizations\.(\d+)")
+
+def sendgrid_field_tag(name: str) -> str:
+    return f"-field.{name}-"
+
+def sendgrid_html_field_tag(name: str) -> str:
+    # En HTML el valor va escapado, así que lleva su propio tag
+    return f"-field.{name}.html-"
+
+def tracking_pixel_html(email_log_id: Union[int, str]) -> str:
+    pixel_url = f"{BASE_URL}/emails/track/open/{email_log_id}.png"
+    return f'<img src="{pixel_url}" width="1" height="1" style="display:none;" />'
+
+def add_tracking_pixel(html_body: str, email_log_id: Union[int, str]) -> str:
     if html_body:
         pixel_url = f"{BASE_URL}/emails/track/open/{email_log_id}.png"
-        tracking_pixel = f'<img src="{pixel_url}" width="1" height="1" style="display:none;" />'
         logger.info(f"🔍 Agregando pixel de tracking: {pixel_url}")
-        if "</body>" in html_body:
-            html_body = html_body.replace("</body>", f"{tracking_pixel}</body>")
-        else:
-            html_body += tracking_pixel
+        slot = pixel_slot_index(html_body)
+        html_body = html_body[:slot] + tracking_pixel_html(email_log_id) + html_body[slot:]
         logger.info(f"✅ Pixel agregado correctamente")
     else:
         logger.warning(f"⚠️ No hay HTML body para agregar pixel al email {email_log_id}")
@@ -64,6 +102,28 @@ class EmailSend(BaseModel):
     cc: Optional[List[EmailStr]] = None
     bcc: Optional[List[EmailStr]] = None
     attachments: Optional[List[str]] = None
+    # Valores para los campos {{...}} del asunto y cuerpos
+    fields: Optional[Dict[str, Any]] = None
+
+class EmailBatchItem(BaseModel):
+    to: EmailStr
+    subject: Optional[str] = None
+    body: Optional[str] = None
+    html_body: Optional[str] = None
+    fields: Optional[Dict[str, Any]] = None
+
+class EmailBatchSend(BaseModel):
+    subject: str
+    body: str
+    html_body: Optional[str] = None
+    mailbox_id: Optional[int] = None
+    recipients: Optional[List[EmailStr]] = None
+    messages: Optional[List[EmailBatchItem]] = None
+    cc: Optional[List[EmailStr]] = None
+    bcc: Optional[List[EmailStr]] = None
+    attachments: Optional[List[str]] = None
+    concurrency: Optional[int] = None
+    enqueue: bool = False
 
 class EmailResponse(BaseModel):
     id: int
@@ -78,12 +138,99 @@ class EmailResponse(BaseModel):
     open_count: Optional[int] = 0
     last_opened_at: Optional[str] = None
     tracking_data: Optional[Dict[str, Any]] = None
+    click_count: Optional[int] = 0
+
+class EmailHistoryItem(BaseModel):
+    """
+    Item de /history y /archive/{month}: solo trae los campos pedidos con
+    `fields` (id siempre) y tracking_data salvo con include_tracking=false
+    """
+    id: int
+    to_email: Optional[str] = None
+    from_email: Optional[str] = None
+    subject: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[str] = None
+    error_message: Optional[str] = None
+    mailbox_id: Optional[int] = None
+    opened_at: Optional[str] = None
+    open_count: Optional[int] = None
+    last_opened_at: Optional[str] = None
+    tracking_data: Optional[Dict[str, Any]] = None
+    click_count: Optional[int] = None
+
+class EmailDetail(EmailResponse):
+    body: Optional[str] = None
+    html_body: Optional[str] = None
+    last_clicked_at: Optional[str] = None
+    opens: List[Dict[str, Any]] = []
+    clicks: List[Dict[str, Any]] = []
+    archived: bool = False  # Leído del archivo en disco (LOG_RETENTION_DAYS)
+
+# Columnas de EmailResponse, en su orden: el historial selecciona solo estas
+# (nunca body ni html_body) y tracking_data solo si se pide
+HISTORY_FIELDS = {
+    "id": EmailLog.id,
+    "to_email": EmailLog.to_email,
+    "from_email": EmailLog.from_email,
+    "subject": EmailLog.subject,
+    "status": EmailLog.status,
+    "created_at": EmailLog.created_at,
+    "error_message": EmailLog.error_message,
+    "mailbox_id": EmailLog.mailbox_id,
+    "opened_at": EmailLog.opened_at,
+    "open_count": EmailLog.open_count,
+    "last_opened_at": EmailLog.last_opened_at,
+    "tracking_data": EmailLog.tracking_data,
+    "click_count": EmailLog.click_count
+}
+
+def history_fields(fields: Optional[str], include_tracking: bool) -> List[str]:
+    """Campos pedidos con `fields=a,b`, en el orden de EmailResponse; id siempre va"""
+    if fields:
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = requested - set(HISTORY_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(sorted(unknown))}")
+        requested.add("id")
+    else:
+        requested = set(HISTORY_FIELDS)
+    if not include_tracking:
+        requested.discard("tracking_data")
+    return [name for name in HISTORY_FIELDS if name in requested]
+
+def history_item(row: Any, names: List[str]) -> Dict[str, Any]:
+    item = {}
+    for name in names:
+        value = getattr(row, name)
+        item[name] = value.isoformat() if isinstance(value, datetime) else value
+    return item
+
+class BulkSelection(BaseModel):
+    """Logs de una operación masiva: por ids, por filtros o ambos"""
+    ids: Optional[List[int]] = None
+    status: Optional[str] = None
+    mailbox_id: Optional[int] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+
+    def is_empty(self) -> bool:
+        return not self.ids and not any(
+            value is not None for value in (self.status, self.mailbox_id, self.created_from, self.created_to)
+        )
 
 class EmailStats(BaseModel):
     total_sent: int
     total_failed: int
     success_rate: float
     last_24h: int
+    # Emails abiertos y aperturas según su origen: personas, proxies de
+    # imágenes y bots/escáneres
+    unique_opens: int = 0
+    total_opens: int = 0
+    human_opens: int = 0
+    proxy_opens: int = 0
+    bot_opens: int = 0
 
 PROVIDER_CONFIGS = {
     'gmail': {
@@ -109,7 +256,9 @@ class EmailSender:
                            body: str, html_body: Optional[str] = None,
                            cc: Optional[List[str]] = None, 
                            bcc: Optional[List[str]] = None,
-                           attachments: Optional[List[str]] = None) -> Dict[str, Any]:
+                           attachments: Optional[List[str]] = None,
+                           email_log_id: Optional[int] = None,
+                           personalized: bool = False) -> Dict[str, Any]:
         try:
             settings = json.loads(mailbox.settings)
             provider_lower = mailbox.provider.lower()
@@ -131,50 +280,45 @@ class EmailSender:
             logger.info(f"🔄 Enviando desde: {mailbox.email}")
 
             from_name = mailbox.name or "Marketing ONIXU"
-            msg = MIMEMultipart('alternative')
-            msg['From'] = f"{from_name} <{mailbox.email}>"
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            msg['Reply-To'] = mailbox.email
-            if cc:
-                msg['Cc'] = ', '.join(cc)
-            if bcc:
-                msg['Bcc'] = ', '.join(bcc)
-            if attachments:
-                for file_path in attachments:
-                    if os.path.exists(file_path):
-                        with open(file_path, "rb") as attachment:
-                            part = MIMEBase('application', 'octet-stream')
-                            part.set_payload(attachment.read())
-                            encoders.encode_base64(part)
-                            part.add_header(
-                                'Content-Disposition',
-                                f'attachment; filename={os.path.basename(file_path)}'
-                            )
-                            msg.attach(part)
-            msg.attach(MIMEText(body, 'plain', 'utf-8'))
-            if html_body:
-                msg.attach(MIMEText(html_body, 'html', 'utf-8'))
-            server = smtplib.SMTP(smtp_host, smtp_port)
-            if use_tls:
-                server.starttls()
-            server.login(username, password)
-            result = server.send_message(msg, to_addrs=[to_email] + (cc or []) + (bcc or []))
-            server.quit()
+            # El MIME compartido de la campaña se compila una vez; aquí solo
+            # se parchean el To y el pixel de este destinatario. Un cuerpo
+            # personalizado es único y no se guarda en el cache
+            message_args = (
+                f"{from_name} <{mailbox.email}>", mailbox.email, subject, body,
+                html_body, cc, attachments
+            )
+            if not personalized:
+                compiled = await compiled_messages.get(*message_args)
+            elif attachments:
+                # Los adjuntos se leen y codifican fuera del event loop
+                compiled = await asyncio.to_thread(CompiledMessage, *message_args)
+            else:
+                compiled = CompiledMessage(*message_args)
+            pixel_html = tracking_pixel_html(email_log_id) if email_log_id and html_body else ""
+            data = compiled.render(to_email, pixel_html, email_log_id)
+            # Sesión SMTP autenticada reutilizada desde el pool del mailbox
+            pool = await smtp_pools.get_pool(
+                mailbox.id, smtp_host, int(smtp_port), username, password, use_tls
+            )
+            result = await pool.send_raw(mailbox.email, [to_email] + (cc or []) + (bcc or []), data)
             logger.info(f"✅ Email SMTP enviado exitosamente")
             return {"success": True, "result": result}
-        except smtplib.SMTPAuthenticationError as e:
+        except aiosmtplib.SMTPAuthenticationError as e:
             error_msg = f"Error de autenticación SMTP: {str(e)}"
             logger.error(f"❌ {error_msg}")
-            return {"success": False, "error": error_msg}
-        except smtplib.SMTPRecipientsRefused as e:
+            return {"success": False, "error": error_msg, "retryable": False}
+        except aiosmtplib.SMTPRecipientsRefused as e:
             error_msg = f"Destinatario rechazado: {str(e)}"
             logger.error(f"❌ {error_msg}")
-            return {"success": False, "error": error_msg}
+            return {"success": False, "error": error_msg, "retryable": False}
+        except PermissionError as e:
+            error_msg = f"Adjunto no permitido: {str(e)}"
+            logger.error(f"❌ {error_msg}")
+            return {"success": False, "error": error_msg, "retryable": False}
         except Exception as e:
             error_msg = f"Error SMTP: {str(e)}"
             logger.error(f"❌ {error_msg}")
-            return {"success": False, "error": error_msg}
+            return {"success": False, "error": error_msg, "retryable": is_retryable_exception(e)}
 
     @staticmethod
     async def send_via_sendgrid_api(mailbox: Mailbox, to_email: str, subject: str, 
@@ -217,113 +361,415 @@ class EmailSender:
             if html_body:
                 data["content"].append({"type": "text/html", "value": html_body})
             
-            # Enviar usando httpx
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
+            # Enviar usando el cliente httpx compartido (keep-alive / HTTP2)
+            client = get_provider_client()
+            response = await client.post(
+                "https://api.sendgrid.com/v3/mail/send",
+                headers={
+                    "Authorization": f"Bearer {api_key}",
+                    "Content-Type": "application/json"
+                },
+                json=data
+            )
+            
+            if response.status_code in [200, 202]:
+                logger.info(f"✅ Email SendGrid API enviado exitosamente")
+                return {"success": True, "status_code": response.status_code}
+            else:
+                error_msg = f"SendGrid API error: {response.status_code} - {response.text}"
+                logger.error(f"❌ {error_msg}")
+                return {
+                    "success": False,
+                    "error": error_msg,
+                    "retryable": is_retryable_status(response.status_code)
+                }
+                    
+        except Exception as e:
+            error_msg = f"Error SendGrid API: {str(e)}"
+            logger.error(f"❌ {error_msg}")
+            return {"success": False, "error": error_msg}
+
+    @staticmethod
+    async def send_batch_via_sendgrid_api(mailbox: Mailbox, recipients: List[Dict[str, Any]],
+                                          subject: str, body: str,
+                                          html_body: Optional[str] = None,
+                                          cc: Optional[List[str]] = None,
+                                          bcc: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Enviar hasta 1000 destinatarios con el mismo contenido en una sola llamada.
+        Cada destinatario es {"email_log_id", "to_email", "fields"}; el resultado
+        trae un {"email_log_id", "success", "error"} por destinatario. Con
+        "fields" el contenido es una plantilla: sus campos viajan como
+        substitutions de cada personalization.
+        """
+        settings_data = json.loads(mailbox.settings)
+        api_key = settings_data.get('sendgrid_api_key') or os.getenv('SENDGRID_API_KEY')
+        if not api_key:
+            return [
+                {"email_log_id": r["email_log_id"], "success": False,
+                 "error": "Error SendGrid API: SendGrid API key no configurada", "retryable": False}
+                for r in recipients
+            ]
+        if html_body and settings.CLICK_TRACKING_ENABLED:
+            # Los enlaces llevan el marcador del id; SendGrid lo sustituye
+            html_body = await link_tracker.rewrite(html_body)
+        templated = any(r.get("fields") is not None for r in recipients)
+        subject_template = body_template = html_template = None
+        if templated:
+            subject_template = compiled_templates.get(subject)
+            if body:
+                body_template = compiled_templates.get(body)
+                body = body_template.render_tags(sendgrid_field_tag)
+            if html_body:
+                # Un solo pixel con el marcador; SendGrid pone el id de cada log
+                html_template = compiled_templates.get(html_body, is_html=True)
+                html_body = html_template.render_tags(
+                    sendgrid_html_field_tag, tracking_pixel_html(SENDGRID_TRACKING_TAG)
+                )
+        elif html_body:
+            # Un solo pixel con el marcador; SendGrid pone el id de cada log
+            html_body = add_tracking_pixel(html_body, SENDGRID_TRACKING_TAG)
+        content = []
+        if body:
+            content.append({"type": "text/plain", "value": body})
+        if html_body:
+            content.append({"type": "text/html", "value": html_body})
+
+        results: Dict[int, Dict[str, Any]] = {}
+        pending = list(recipients)
+        # Un 400 de SendGrid rechaza la petición entera: se quitan los
+        # destinatarios señalados y se reintenta una vez con el resto
+        for attempt in range(2):
+            if not pending:
+                break
+            personalizations = []
+            for r in pending:
+                personalization = {
+                    "to": [{"email": r["to_email"]}],
+                    "subject": subject,
+                    "substitutions": {
+                        SENDGRID_TRACKING_TAG: str(r["email_log_id"]),
+                        CLICK_SIGNATURE_TAG: click_signature(r["email_log_id"])
+                    },
+                    "custom_args": {"email_log_id": str(r["email_log_id"])}
+                }
+                if templated:
+                    fields = r.get("fields") or {}
+                    personalization["subject"] = subject_template.render(fields)
+                    substitutions = personalization["substitutions"]
+                    for name in body_template.fields if body_template else []:
+                        substitutions[sendgrid_field_tag(name)] = format_value(fields.get(name))
+                    for name in html_template.fields if html_template else []:
+                        substitutions[sendgrid_html_field_tag(name)] = html.escape(format_value(fields.get(name)))
+                if cc:
+                    personalization["cc"] = [{"email": email} for email in cc]
+                if bcc:
+                    personalization["bcc"] = [{"email": email} for email in bcc]
+                personalizations.append(personalization)
+            data = {
+                "personalizations": personalizations,
+                "from": {"email": mailbox.email, "name": mailbox.name or "ONIXU Marketing"},
+                "content": content
+            }
+            logger.info(f"🔄 SendGrid lote: {len(pending)} destinatarios desde {mailbox.email}")
+            try:
+                response = await get_provider_client().post(
                     "https://api.sendgrid.com/v3/mail/send",
                     headers={
                         "Authorization": f"Bearer {api_key}",
                         "Content-Type": "application/json"
                     },
-                    json=data,
-                    timeout=30
+                    json=data
                 )
-                
-                if response.status_code in [200, 202]:
-                    logger.info(f"✅ Email SendGrid API enviado exitosamente")
-                    return {"success": True, "status_code": response.status_code}
-                else:
-                    error_msg = f"SendGrid API error: {response.status_code} - {response.text}"
-                    logger.error(f"❌ {error_msg}")
-                    return {"success": False, "error": error_msg}
-                    
-        except Exception as e:
-            error_msg = f"Error SendGrid API: {str(e)}"
+            except Exception as e:
+                error_msg = f"Error SendGrid API: {str(e)}"
+                logger.error(f"❌ {error_msg}")
+                for r in pending:
+                    results[r["email_log_id"]] = {
+                        "email_log_id": r["email_log_id"], "success": False,
+                        "error": error_msg, "retryable": True
+                    }
+                break
+            if response.status_code in [200, 202]:
+                logger.info(f"✅ Lote SendGrid aceptado ({len(pending)} emails)")
+                for r in pending:
+                    results[r["email_log_id"]] = {
+                        "email_log_id": r["email_log_id"], "success": True, "error": None
+                    }
+                break
+            error_msg = f"SendGrid API error: {response.status_code} - {response.text}"
             logger.error(f"❌ {error_msg}")
-            return {"success": False, "error": error_msg}
+            rejected: Dict[int, str] = {}
+            if 400 <= response.status_code < 500 and attempt == 0:
+                try:
+                    errors = response.json().get("errors", [])
+                except Exception:
+                    errors = []
+                for error in errors:
+                    match = SENDGRID_PERSONALIZATION_FIELD.match(error.get("field") or "")
+                    if match and int(match.group(1)) < len(pending):
+                        rejected[int(match.group(1))] = error.get("message", error_msg)
+            if not rejected:
+                retryable = is_retryable_status(response.status_code)
+                for r in pending:
+                    results[r["email_log_id"]] = {
+                        "email_log_id": r["email_log_id"], "success": False,
+                        "error": error_msg, "retryable": retryable
+                    }
+                break
+            for index, message in rejected.items():
+                r = pending[index]
+                results[r["email_log_id"]] = {
+                    "email_log_id": r["email_log_id"], "success": False,
+                    "error": f"SendGrid API error: {message}", "retryable": False
+                }
+            pending = [r for i, r in enumerate(pending) if i not in rejected]
+        return [results[r["email_log_id"]] for r in recipients if r["email_log_id"] in results]
+
+
+def uses_sendgrid_api(mailbox: Mailbox) -> bool:
+    if mailbox.provider.lower() not in ['gmail', 'outlook', 'yahoo', 'smtp', 'sendgrid']:
+        return False
+    # Un mailbox SMTP puede optar por entregar por su propio servidor
+    try:
+        transport = json.loads(mailbox.settings or "{}").get("transport")
+    except Exception:
+        transport = None
+    return not (transport == "smtp" and mailbox.provider.lower() != 'sendgrid')
+
+
+def delivery_provider(mailbox: Mailbox) -> str:
+    """Proveedor que realmente entrega los emails del mailbox"""
+    return "sendgrid" if uses_sendgrid_api(mailbox) else mailbox.provider.lower()
+
+def check_attachments(attachments: Optional[List[str]]):
+    """Los adjuntos solo pueden ser archivos de uploads/"""
+    outside = [path for path in attachments or [] if resolve_upload(path) is None]
+    if outside:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Adjuntos fuera de {settings.UPLOADS_DIR}: {', '.join(outside)}"
+        )
 
+def send_quotas(user_id: int, mailbox: Mailbox) -> List[Quota]:
+    """Cuotas por usuario, mailbox y proveedor que consume cada envío"""
+    provider = delivery_provider(mailbox)
+    try:
+        mailbox_limit = json.loads(mailbox.settings or "{}").get("daily_limit")
+    except Exception:
+        mailbox_limit = None
+    if mailbox_limit is None:
+        mailbox_limit = settings.RATE_LIMIT_MAILBOX_DAILY.get(provider, 0)
+    return [
+        Quota(f"user:{user_id}", settings.RATE_LIMIT_USER_PER_HOUR, 3600, "usuario"),
+        Quota(f"mailbox:{mailbox.id}", int(mailbox_limit), 86400, f"mailbox {mailbox.email}"),
+        Quota(f"provider:{provider}", settings.RATE_LIMIT_PROVIDER_PER_MINUTE.get(provider, 0), 60, f"proveedor {provider}")
+    ]
 
-async def send_email_background(
+async def deliver_email(
+    mailbox: Mailbox,
     to_email: str,
     subject: str,
     body: str,
-    mailbox: Mailbox,
-    user_id: int,
-    db: AsyncSession,
     html_body: Optional[str] = None,
     cc: Optional[List[str]] = None,
     bcc: Optional[List[str]] = None,
     attachments: Optional[List[str]] = None,
-    retry_count: int = 0
-):
-    email_log = EmailLog(
-        to_email=to_email,
-        from_email=mailbox.email,
-        subject=subject,
-        body=body,
-        sent_by=user_id,
-        mailbox_id=mailbox.id,
-        status="pending"
+    email_log_id: Optional[int] = None,
+    fields: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Enviar un email ya registrado por el proveedor del mailbox. Con `fields`
+    el asunto y los cuerpos son plantillas que se renderizan aquí.
+    """
+    sender = EmailSender()
+    provider_lower = mailbox.provider.lower()
+    if html_body and email_log_id and settings.CLICK_TRACKING_ENABLED:
+        # Reescritura cacheada por contenido; el id se pone más abajo
+        html_body = await link_tracker.rewrite(html_body)
+    if fields is not None:
+        subject = compiled_templates.get(subject).render(fields)
+        body = compiled_templates.get(body).render(fields) if body else body
+    if uses_sendgrid_api(mailbox):
+        # Usar SendGrid API para todos los casos (más rápido que SMTP)
+        if html_body and fields is not None:
+            # El pixel va en el slot de la plantilla compilada
+            pixel_html = tracking_pixel_html(email_log_id) if email_log_id else ""
+            html_body = compiled_templates.get(html_body, is_html=True).render(fields, pixel_html)
+        elif html_body and email_log_id:
+            html_body = add_tracking_pixel(html_body, email_log_id)
+        if html_body and email_log_id:
+            html_body = sign_click_links(html_body, email_log_id)
+        return await sender.send_via_sendgrid_api(
+            mailbox, to_email, subject, body, html_body, cc, bcc
+        )
+    elif provider_lower in ['gmail', 'outlook', 'yahoo', 'smtp']:
+        # El pixel y el id de los enlaces los pone el mensaje compilado
+        if html_body and fields is not None:
+            html_body = compiled_templates.get(html_body, is_html=True).render(fields)
+        return await sender.send_via_smtp(
+            mailbox, to_email, subject, body, html_body, cc, bcc, attachments, email_log_id,
+            personalized=fields is not None
+        )
+    elif provider_lower == 'ses':
+        return await sender.send_via_ses(
+            mailbox, to_email, subject, body, html_body
+        )
+    elif provider_lower == 'mailgun':
+        return await sender.send_via_mailgun(
+            mailbox, to_email, subject, body, html_body
+        )
+    raise Exception(f"Proveedor {mailbox.provider} no soportado")
+
+async def insert_email_logs(
+    db: AsyncSession,
+    mailbox: Mailbox,
+    user_id: int,
+    rows: List[Dict[str, Any]],
+    send_options: Optional[Dict[str, Any]] = None,
+    status: str = STATUS_PENDING,
+    locked_by: Optional[str] = None
+) -> List[int]:
+    """Insertar todos los logs de un lote con un INSERT multi-fila ... RETURNING"""
+    if not rows:
+        return []
+    # Los logs que se envían en línea nacen reservados para que la cola no los tome
+    locked_until = lease_deadline() if locked_by else None
+    values = [
+        {
+            "to_email": row["to_email"],
+            "from_email": mailbox.email,
+            "subject": row["subject"],
+            "body": row["body"],
+            "html_body": row.get("html_body"),
+            "send_options": (
+                {**(send_options or {}), "fields": row["fields"]}
+                if row.get("fields") is not None else send_options
+            ),
+            "sent_by": user_id,
+            "mailbox_id": mailbox.id,
+            "status": status,
+            "attempts": 1 if locked_by else 0,
+            "locked_by": locked_by,
+            "locked_until": locked_until
+        } for row in rows
+    ]
+    result = await db.execute(
+        insert(EmailLog).returning(EmailLog.id, sort_by_parameter_order=True),
+        values
     )
-    db.add(email_log)
+    ids = list(result.scalars().all())
     await db.commit()
-    await db.refresh(email_log)
-    if html_body:
-        html_body = add_tracking_pixel(html_body, email_log.id)
-        logger.info(f"📧 Enviando email con HTML y pixel de tracking")
-    else:
-        logger.warning(f"⚠️ Email {email_log.id} enviado solo como texto plano - NO TRACKING")
+    response_cache.invalidate_emails([user_id])
+    return ids
+
+async def publish_email_logs(ids: List[int]):
+    """Con EMAIL_DISPATCH_BACKEND=celery, publicar los logs pendientes en el broker"""
+    if settings.EMAIL_DISPATCH_BACKEND != "celery" or not ids:
+        return
+    from app.workers.email_worker import enqueue_email_logs
     try:
-        logger.info(f"🚀 ENVIANDO EMAIL (Intento {retry_count + 1}/3):")
-        logger.info(f"   Desde: {mailbox.email}")
-        logger.info(f"   Hacia: {to_email}")
-        logger.info(f"   Proveedor: {mailbox.provider}")
-        if not mailbox.is_verified:
-            logger.warning(f"⚠️ Mailbox {mailbox.email} no está verificado")
-        sender = EmailSender()
-        provider_lower = mailbox.provider.lower()
-        if provider_lower in ['gmail', 'outlook', 'yahoo', 'smtp'] or mailbox.provider.lower() == 'sendgrid':
-            # Usar SendGrid API para todos los casos (más rápido que SMTP)
-            result = await sender.send_via_sendgrid_api(
-                mailbox, to_email, subject, body, html_body, cc, bcc
-            )
-        elif provider_lower == 'ses':
-            result = await sender.send_via_ses(
-                mailbox, to_email, subject, body, html_body
-            )
-        elif provider_lower == 'mailgun':
-            result = await sender.send_via_mailgun(
-                mailbox, to_email, subject, body, html_body
-            )
-        else:
-            raise Exception(f"Proveedor {mailbox.provider} no soportado")
-        if result['success']:
-            email_log.status = "sent"
-            logger.info("🎉 EMAIL ENVIADO EXITOSAMENTE")
-        else:
-            raise Exception(result['error'])
+        # La publicación en el broker es bloqueante: fuera del event loop
+        chunks = await asyncio.to_thread(enqueue_email_logs, ids)
+        logger.info(f"📤 {len(ids)} emails publicados en Celery ({chunks} tareas)")
     except Exception as e:
-        error_msg = str(e)
-        logger.error(f"❌ Error enviando email: {error_msg}")
-        if retry_count < 2:
-            logger.info(f"🔄 Reintentando en 30 segundos...")
-            await asyncio.sleep(30)
-            return await send_email_background(
-                to_email, subject, body, mailbox, user_id, db, 
-                html_body, cc, bcc, attachments, retry_count + 1
+        # Los logs siguen en pending: los recoge el worker de cola como huérfanos
+        logger.error(f"❌ Error publicando en Celery: {str(e)}")
+
+async def dispatch_email_batch(
+    mailbox: Mailbox,
+    jobs: List[Dict[str, Any]],
+    concurrency: int
+) -> List[Dict[str, Any]]:
+    """
+    Enviar los emails de un lote con un número acotado de workers concurrentes.
+    Cada job debe tener email_log_id, to_email, subject, body y html_body.
+    """
+    if uses_sendgrid_api(mailbox):
+        return await dispatch_sendgrid_batch(mailbox, jobs, concurrency)
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    outcomes: List[Dict[str, Any]] = []
+
+    async def worker():
+        while True:
+            try:
+                job = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                result = await deliver_email(
+                    mailbox, job["to_email"], job["subject"], job["body"], job.get("html_body"),
+                    job.get("cc"), job.get("bcc"), job.get("attachments"), job["email_log_id"],
+                    job.get("fields")
+                )
+            except Exception as e:
+                result = {"success": False, "error": str(e), "retryable": is_retryable_exception(e)}
+            outcomes.append({
+                "id": job["email_log_id"],
+                "status": "sent" if result["success"] else "failed",
+                "error_message": None if result["success"] else result.get("error"),
+                "retryable": result.get("retryable", True)
+            })
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(jobs))))]
+    await asyncio.gather(*workers)
+    return outcomes
+
+async def dispatch_sendgrid_batch(
+    mailbox: Mailbox,
+    jobs: List[Dict[str, Any]],
+    concurrency: int
+) -> List[Dict[str, Any]]:
+    """
+    Agrupar los jobs con el mismo asunto y cuerpo en llamadas de hasta
+    SENDGRID_MAX_PERSONALIZATIONS destinatarios.
+    """
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for job in jobs:
+        key = (
+            job["subject"], job["body"], job.get("html_body"),
+            tuple(job.get("cc") or ()), tuple(job.get("bcc") or ()),
+            job.get("fields") is not None
+        )
+        groups.setdefault(key, []).append(job)
+    size = settings.SENDGRID_MAX_PERSONALIZATIONS
+    chunks = [
+        (key, group[i:i + size])
+        for key, group in groups.items()
+        for i in range(0, len(group), size)
+    ]
+    logger.info(f"📦 {len(jobs)} emails agrupados en {len(chunks)} llamadas a SendGrid")
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def send_chunk(key, chunk):
+        subject, body, html_body, cc, bcc, _ = key
+        async with semaphore:
+            return await EmailSender.send_batch_via_sendgrid_api(
+                mailbox,
+                [
+                    {"email_log_id": job["email_log_id"], "to_email": job["to_email"], "fields": job.get("fields")}
+                    for job in chunk
+                ],
+                subject, body, html_body, list(cc) or None, list(bcc) or None
             )
-        else:
-            email_log.status = "failed"
-            email_log.error_message = error_msg
-    db.add(email_log)
-    await db.commit()
-    logger.info(f"💾 Log guardado con status: {email_log.status}")
+
+    chunk_results = await asyncio.gather(*(send_chunk(key, chunk) for key, chunk in chunks))
+    return [
+        {
+            "id": r["email_log_id"],
+            "status": "sent" if r["success"] else "failed",
+            "error_message": r["error"],
+            "retryable": r.get("retryable", True)
+        }
+        for results in chunk_results for r in results
+    ]
 
 @router.get("/track/open/{email_id}.png")
 async def track_email_open(
     email_id: int,
-    request: Request,
-    db: AsyncSession = Depends(get_db)
+    request: Request
 ):
     transparent_gif = (
         b'GIF89a\x01\x00\x01\x00\x80\x00\x00\xff\xff\xff'
@@ -343,53 +789,12 @@ async def track_email_open(
             "opened_at": datetime.utcnow().isoformat(),
             "timestamp": datetime.utcnow().timestamp()
         }
-        if user_agents:
-            ua = user_agents.parse(user_agent_string)
-            tracking_data.update({
-                "browser": ua.browser.family,
-                "browser_version": ua.browser.version_string,
-                "os": ua.os.family,
-                "os_version": ua.os.version_string,
-                "device": ua.device.family,
-                "is_mobile": ua.is_mobile,
-                "is_tablet": ua.is_tablet,
-                "is_pc": ua.is_pc
-            })
-
-        result = await db.execute(select(EmailLog).where(EmailLog.id == email_id))
-        log = result.scalar_one_or_none()
-        if log:
-            if not log.opened_at:
-                log.opened_at = datetime.utcnow()
-                log.open_count = 1
-                log.last_opened_at = log.opened_at
-                log.tracking_data = tracking_data
-                logger.info(f"✅ Email {email_id} PRIMERA APERTURA")
-            else:
-                log.open_count = (log.open_count or 0) + 1
-                log.last_opened_at = datetime.utcnow()
-                td = log.tracking_data
-                if td is None:
-                    td = {"opens": []}
-                elif isinstance(td, str):
-                    try:
-                        td = json.loads(td)
-                    except Exception:
-                        td = {"opens": []}
-                if "opens" not in td:
-                    td["opens"] = []
-                td["opens"].append(tracking_data)
-                log.tracking_data = td
-                logger.info(f"🔄 Email {email_id} apertura #{log.open_count}")
-            await db.commit()
-        else:
-            logger.warning(f"❌ Email log {email_id} no encontrado")
+        if not settings.TRACKING_ENRICH_IN_BACKGROUND:
+            enrich(tracking_data)
+        # Se encola en memoria; el flusher actualiza email_logs en lotes
+        open_recorder.record(email_id, tracking_data)
     except Exception as e:
         logger.error(f"💥 Error tracking email {email_id}: {str(e)}")
-        try:
-            await db.rollback()
-        except:
-            pass
     return Response(
         content=transparent_gif,
         media_type="image/gif",
@@ -397,10 +802,28 @@ async def track_email_open(
         headers={"Cache-Control": "no-cache"}
     )
 
+@router.get("/track/click/{token}")
+async def track_email_click(token: str, request: Request):
+    # Sin sesión de base en el camino del redirect: la URL sale de memoria y
+    # el click se guarda en segundo plano
+    parsed = parse_click_token(token)
+    if parsed is None:
+        raise HTTPException(status_code=404, detail="Enlace no encontrado")
+    email_log_id, url_hash, signed = parsed
+    url = await link_tracker.resolve(url_hash)
+    if url is None:
+        raise HTTPException(status_code=404, detail="Enlace no encontrado")
+    if signed:
+        click_recorder.record(
+            email_log_id, url_hash,
+            getattr(request.client, 'host', None),
+            request.headers.get("user-agent")
+        )
+    return RedirectResponse(url, status_code=302, headers={"Cache-Control": "no-cache"})
+
 @router.post("/send")
 async def send_email(
     email_data: EmailSend,
-    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -432,26 +855,207 @@ async def send_email(
         )
     if email_data.html_body:
         email_data.html_body = email_data.html_body.strip()
+    check_attachments(email_data.attachments)
     logger.info(f"📫 Usando mailbox: {mailbox.email} ({mailbox.provider})")
-    background_tasks.add_task(
-        send_email_background,
-        email_data.to,
-        email_data.subject,
-        email_data.body,
-        mailbox,
-        current_user.id,
-        db,
-        email_data.html_body,
-        email_data.cc,
-        email_data.bcc,
-        email_data.attachments
+    await rate_limiter.check(send_quotas(current_user.id, mailbox))
+    # Queda en email_logs como pending; lo envía el worker de la cola
+    ids = await insert_email_logs(
+        db, mailbox, current_user.id,
+        [{
+            "to_email": email_data.to,
+            "subject": email_data.subject,
+            "body": email_data.body,
+            "html_body": email_data.html_body,
+            "fields": email_data.fields
+        }],
+        send_options={
+            "cc": email_data.cc,
+            "bcc": email_data.bcc,
+            "attachments": email_data.attachments
+        }
     )
+    await publish_email_logs(ids)
     return {
         "success": True,
         "message": "Email agregado a cola de procesamiento",
-        "mailbox_used": mailbox.email
+        "mailbox_used": mailbox.email,
+        "email_id": ids[0]
+    }
+
+@router.post("/send-batch")
+async def send_email_batch(
+    batch: EmailBatchSend,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    started = time.perf_counter()
+    items = [
+        EmailBatchItem(to=recipient) for recipient in (batch.recipients or [])
+    ] + list(batch.messages or [])
+    logger.info(f"📨 Nuevo lote de {len(items)} emails desde: {current_user.username}")
+    if not items:
+        raise HTTPException(status_code=400, detail="El lote no tiene destinatarios")
+    if len(items) > settings.EMAIL_BATCH_MAX_RECIPIENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El lote excede el máximo de {settings.EMAIL_BATCH_MAX_RECIPIENTS} destinatarios"
+        )
+    if not batch.subject.strip():
+        raise HTTPException(status_code=400, detail="El asunto es obligatorio")
+    if not batch.body.strip() and not batch.html_body:
+        raise HTTPException(status_code=400, detail="El cuerpo del email es obligatorio")
+    check_attachments(batch.attachments)
+    if batch.mailbox_id:
+        result = await db.execute(
+            select(Mailbox).where(
+                Mailbox.id == batch.mailbox_id,
+                Mailbox.owner_id == current_user.id
+            )
+        )
+        mailbox = result.scalar_one_or_none()
+    else:
+        result = await db.execute(
+            select(Mailbox).where(
+                Mailbox.owner_id == current_user.id,
+                Mailbox.is_verified == True
+            ).limit(1)
+        )
+        mailbox = result.scalars().first()
+    if not mailbox:
+        raise HTTPException(
+            status_code=400,
+            detail="No hay buzones disponibles o verificados"
+        )
+    logger.info(f"📫 Usando mailbox: {mailbox.email} ({mailbox.provider})")
+    await rate_limiter.check(send_quotas(current_user.id, mailbox), cost=len(items))
+
+    # Si algún destinatario trae campos el lote entero es plantilla: a los
+    # demás los campos que falten les quedan vacíos
+    templated = any(item.fields is not None for item in items)
+    rows = []
+    for item in items:
+        html_body = item.html_body if item.html_body is not None else batch.html_body
+        rows.append({
+            "to_email": item.to,
+            "subject": item.subject or batch.subject,
+            "body": item.body if item.body is not None else batch.body,
+            "html_body": html_body.strip() if html_body else None,
+            "fields": (item.fields or {}) if templated else None
+        })
+
+    send_options = {"cc": batch.cc, "bcc": batch.bcc, "attachments": batch.attachments}
+    insert_started = time.perf_counter()
+    # Reserva propia de esta petición: solo ella puede guardar el resultado
+    worker_id = f"api:{default_worker_id()}:{uuid.uuid4().hex[:8]}"
+    if batch.enqueue:
+        ids = await insert_email_logs(db, mailbox, current_user.id, rows, send_options)
+    else:
+        ids = await insert_email_logs(
+            db, mailbox, current_user.id, rows, send_options,
+            status=STATUS_SENDING, locked_by=worker_id
+        )
+    insert_seconds = time.perf_counter() - insert_started
+    logger.info(f"💾 {len(ids)} logs insertados en {insert_seconds * 1000:.1f} ms")
+    if batch.enqueue:
+        await publish_email_logs(ids)
+        return {
+            "success": True,
+            "message": "Lote agregado a cola de procesamiento",
+            "mailbox_used": mailbox.email,
+            "total": len(ids),
+            "queued": len(ids),
+            "metrics": {
+                "insert_ms": round(insert_seconds * 1000, 2),
+                "inserts_per_second": round(len(ids) / insert_seconds, 2) if insert_seconds > 0 else None
+            }
+        }
+
+    jobs = [
+        {
+            "email_log_id": email_log_id,
+            "to_email": row["to_email"],
+            "subject": row["subject"],
+            "body": row["body"],
+            "html_body": row["html_body"],
+            "cc": batch.cc,
+            "bcc": batch.bcc,
+            "attachments": batch.attachments,
+            "fields": row["fields"]
+        } for email_log_id, row in zip(ids, rows)
+    ]
+    concurrency = min(
+        batch.concurrency or settings.EMAIL_BATCH_CONCURRENCY,
+        settings.EMAIL_BATCH_MAX_CONCURRENCY
+    )
+    dispatch_started = time.perf_counter()
+    async with hold_leases(worker_id):
+        outcomes = await dispatch_email_batch(mailbox, jobs, concurrency)
+    dispatch_seconds = time.perf_counter() - dispatch_started
+
+    # Los fallidos con intentos restantes vuelven a la cola para reintento
+    saved = await complete_email_logs(db, worker_id, outcomes, {email_log_id: 1 for email_log_id in ids})
+    total_seconds = time.perf_counter() - started
+
+    sent = sum(1 for o in saved if o["status"] == STATUS_SENT)
+    retrying = [o["id"] for o in saved if o["status"] == STATUS_PENDING]
+    failed_ids = [o["id"] for o in saved if o["status"] == STATUS_FAILED]
+    logger.info(f"🎉 Lote terminado: {sent} enviados, {len(retrying)} en reintento, {len(failed_ids)} fallidos")
+    return {
+        "success": True,
+        "mailbox_used": mailbox.email,
+        "total": len(ids),
+        "sent": sent,
+        "failed": len(failed_ids),
+        "failed_ids": failed_ids,
+        "retrying": len(retrying),
+        "retrying_ids": retrying,
+        "metrics": {
+            "concurrency": concurrency,
+            "insert_ms": round(insert_seconds * 1000, 2),
+            "dispatch_ms": round(dispatch_seconds * 1000, 2),
+            "total_ms": round(total_seconds * 1000, 2),
+            "emails_per_second": round(len(ids) / dispatch_seconds, 2) if dispatch_seconds > 0 else None
+        }
+    }
+
+@router.get("/queue")
+async def queue_depth(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    return {
+        "user": await get_queue_depth(db, current_user.id),
+        "global": await get_queue_depth(db),
+        "tracking": {
+            "opens": open_recorder.stats(),
+            "clicks": click_recorder.stats(),
+            "enrichment": enrichment_stats(),
+            "classification": open_classifier.stats()
+        }
+    }
+
+@router.get("/providers/pool")
+async def provider_pool_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    return get_provider_pool_stats()
+
+@router.get("/providers/smtp-pool")
+async def smtp_pool_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    return {
+        "pools": smtp_pools.stats(),
+        "attachment_cache": attachment_cache.stats()
     }
 
+@router.get("/cache")
+async def response_cache_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Aciertos, fallos e invalidaciones del cache de lecturas del dashboard"""
+    return response_cache.stats()
+
 @router.get("/debug/tracking/{email_id}")
 async def debug_tracking(
     email_id: int,
@@ -468,6 +1072,12 @@ async def debug_tracking(
     if not log:
         raise HTTPException(status_code=404, detail="Email no encontrado")
     pixel_url = f"{BASE_URL}/emails/track/open/{email_id}.png"
+    events = await db.execute(
+        select(EmailOpenEvent)
+        .where(EmailOpenEvent.email_log_id == email_id)
+        .order_by(EmailOpenEvent.opened_at.desc())
+        .limit(20)
+    )
     return {
         "email_id": email_id,
         "status": log.status,
@@ -478,81 +1088,378 @@ async def debug_tracking(
         "has_tracking": log.opened_at is not None,
         "open_count": log.open_count,
         "last_opened_at": log.last_opened_at,
-        "tracking_data": log.tracking_data
+        "tracking_data": log.tracking_data,
+        "recent_opens": [
+            {
+                "opened_at": event.opened_at,
+                "ip": event.ip,
+                "user_agent": event.user_agent,
+                "classification": event.classification,
+                **(event.data or {})
+            } for event in events.scalars().all()
+        ],
+        "click_count": log.click_count,
+        "last_clicked_at": log.last_clicked_at
     }
 
-@router.get("/history", response_model=List[EmailResponse])
+@router.get("/history", response_model=List[EmailHistoryItem], response_model_exclude_unset=True)
 async def get_email_history(
     limit: int = 50,
     offset: int = 0,
     status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include_tracking: bool = True,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
+    """
+    Historial del más reciente al más antiguo. Cada página trae en
+    X-Next-Cursor el cursor de la siguiente; con `cursor` se ignora `offset`.
+    `fields=a,b` e `include_tracking=false` reducen las columnas leídas; el
+    detalle completo de un email está en /history/{email_id}.
+    """
+    position = None
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    names = history_fields(fields, include_tracking)
+    params = (limit, offset, status, cursor, tuple(names))
+    cached = response_cache.get(CACHE_HISTORY, current_user.id, params)
+    if cached is not None:
+        return cached
     try:
-        query = select(EmailLog).where(EmailLog.sent_by == current_user.id)
-        if status:
-            query = query.where(EmailLog.status == status)
-        query = query.order_by(EmailLog.created_at.desc()).offset(offset).limit(limit)
-        result = await db.execute(query)
-        emails = result.scalars().all()
-        return [
-            EmailResponse(
-                id=e.id,
-                to_email=e.to_email,
-                from_email=e.from_email,
-                subject=e.subject,
-                status=e.status,
-                created_at=e.created_at.isoformat(),
-                error_message=e.error_message,
-                mailbox_id=e.mailbox_id,
-                opened_at=e.opened_at.isoformat() if e.opened_at else None,
-                open_count=e.open_count,
-                last_opened_at=e.last_opened_at.isoformat() if e.last_opened_at else None,
-                tracking_data=e.tracking_data
-            ) for e in emails
-        ]
+        # created_at siempre se lee: lo necesita el cursor
+        columns = [HISTORY_FIELDS[name] for name in names if name != "created_at"] + [EmailLog.created_at]
+        result = await db.execute(history_query(current_user.id, limit, status, position, offset, columns))
+        rows = result.all()
+        following = next_cursor(rows, limit)
+        return response_cache.store(
+            CACHE_HISTORY, current_user.id, params,
+            [history_item(row, names) for row in rows],
+            settings.RESPONSE_CACHE_TTL_HISTORY,
+            {"X-Next-Cursor": following} if following else None
+        )
     except Exception as e:
         logger.error(f"Error en get_email_history: {str(e)}")
         return []
 
-@router.get("/stats", response_model=EmailStats)
-async def get_email_stats(
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv")
+}
+
+def export_chunk(rows: List[Any], names: List[str], format: str) -> str:
+    """Un lote de filas como NDJSON o CSV (tracking_data va como JSON)"""
+    items = [history_item(row, names) for row in rows]
+    if format == "ndjson":
+        return "".join(json.dumps(item, ensure_ascii=False, default=str) + "\n" for item in items)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for item in items:
+        writer.writerow([
+            json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+            for value in item.values()
+        ])
+    return out.getvalue()
+
+async def stream_export(user_id: int, names: List[str], format: str, status: Optional[str],
+                        position: Optional[tuple], compress: bool):
+    """
+    Filas desde un cursor del servidor, de EXPORT_BATCH_SIZE en
+    EXPORT_BATCH_SIZE: en memoria nunca hay más de un lote.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # 31: formato gzip
+
+    def encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    if format == "csv":
+        header = io.StringIO()
+        csv.writer(header).writerow(names)
+        yield encode(header.getvalue())
+    columns = [HISTORY_FIELDS[name] for name in names]
+    exported = 0
+    try:
+        # Sesión propia: vive lo que dure el stream, no lo que dure el endpoint
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(
+                history_query(user_id, None, status, position, columns=columns)
+                .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+            )
+            async for rows in result.partitions():
+                exported += len(rows)
+                chunk = encode(export_chunk(rows, names, format))
+                if chunk:
+                    yield chunk
+    except Exception as e:
+        logger.error(f"💥 Error exportando logs del usuario {user_id} tras {exported} filas: {str(e)}")
+        raise
+    if compressor:
+        yield compressor.flush()
+    logger.info(f"📤 {exported} logs exportados ({format}) para el usuario {user_id}")
+
+@router.get("/export")
+async def export_email_logs(
+    format: str = "ndjson",
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include_tracking: bool = True,
+    gzip: bool = False,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Exportar el historial completo (mismos filtros que /history) como NDJSON
+    o CSV en streaming. Con gzip=true se comprime al vuelo.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {format} (ndjson o csv)")
+    position = None
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    names = history_fields(fields, include_tracking)
+    media_type, extension = EXPORT_FORMATS[format]
+    headers = {"Content-Disposition": f'attachment; filename="email_logs.{extension}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        stream_export(current_user.id, names, format, status, position, gzip),
+        media_type=media_type,
+        headers=headers
+    )
+
+@router.get("/search")
+async def search_email_logs(
+    q: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include_tracking: bool = False,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
+    """
+    Buscar en asunto, destinatario y remitente: `factura to:@acme.com`,
+    `from:billing`, `subject:"pago pendiente"`. Resultados por relevancia y
+    luego por fecha; el cursor de la página siguiente va en X-Next-Cursor.
+    """
+    terms = parse_search(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="La búsqueda no tiene términos")
+    position = None
+    if cursor:
+        position = decode_search_cursor(cursor)
+        if position is None:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    names = history_fields(fields, include_tracking)
     try:
-        sent_result = await db.execute(
-            select(EmailLog).where(
-                EmailLog.sent_by == current_user.id,
-                EmailLog.status == 'sent'
-            )
+        columns = [HISTORY_FIELDS[name] for name in names if name != "created_at"] + [EmailLog.created_at]
+        dialect = db.get_bind().dialect.name
+        result = await db.execute(search_query(dialect, current_user.id, terms, limit, position, columns))
+        rows = result.all()
+    except Exception as e:
+        logger.error(f"Error en search_email_logs: {str(e)}")
+        return []
+    headers = {}
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        headers["X-Next-Cursor"] = encode_search_cursor(last.rank, last.created_at, last.id)
+    return JSONResponse(
+        content=[{**history_item(row, names), "rank": row.rank} for row in rows],
+        headers=headers
+    )
+
+@router.get("/archive")
+async def get_archived_months(current_user: User = Depends(get_current_active_user)):
+    """Meses archivados que tienen logs del usuario, del más reciente al más antiguo"""
+    manifests = await asyncio.to_thread(list_archives)
+    user = str(current_user.id)
+    return [
+        {"month": manifest["month"], "rows": manifest["users"][user], "archived_at": manifest.get("archived_at")}
+        for manifest in manifests if user in manifest.get("users", {})
+    ]
+
+@router.get("/archive/{month}", response_model=List[EmailHistoryItem], response_model_exclude_unset=True)
+async def get_archived_history(
+    month: str,
+    limit: int = 50,
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    include_tracking: bool = True,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Historial de un mes archivado (YYYY-MM), con los mismos campos, filtros y
+    cursor que /history. Se lee del archivo en disco al pedirlo.
+    """
+    start = parse_month(month)
+    if start is None:
+        raise HTTPException(status_code=400, detail="Mes inválido (YYYY-MM)")
+    if not any(manifest["month"] == month for manifest in await asyncio.to_thread(list_archives)):
+        raise HTTPException(status_code=404, detail="Mes no archivado")
+    position = None
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+    names = history_fields(fields, include_tracking)
+    items = await asyncio.to_thread(read_archive_page, start, current_user.id, limit, position, status)
+    headers = {}
+    if items and len(items) == limit:
+        last = items[-1]
+        headers["X-Next-Cursor"] = encode_cursor(datetime.fromisoformat(last["created_at"]), last["id"])
+    return JSONResponse(content=[{name: item.get(name) for name in names} for item in items], headers=headers)
+
+@router.get("/history/{email_id}", response_model=EmailDetail)
+async def get_email_detail(
+    email_id: int,
+    events_limit: int = 100,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Un email con cuerpo, tracking_data y sus aperturas y clicks más recientes"""
+    result = await db.execute(
+        select(EmailLog).where(
+            EmailLog.id == email_id,
+            EmailLog.sent_by == current_user.id
         )
-        total_sent = len(sent_result.scalars().all())
-        failed_result = await db.execute(
-            select(EmailLog).where(
-                EmailLog.sent_by == current_user.id,
-                EmailLog.status == 'failed'
-            )
+    )
+    log = result.scalar_one_or_none()
+    if not log:
+        # Meses ya archivados: se busca en disco por rango de ids
+        archived = await asyncio.to_thread(find_archived, email_id, current_user.id)
+        if archived is None:
+            raise HTTPException(status_code=404, detail="Email no encontrado")
+        return EmailDetail(
+            **{name: archived.get(name) for name in HISTORY_FIELDS},
+            body=archived.get("body"),
+            html_body=archived.get("html_body"),
+            last_clicked_at=archived.get("last_clicked_at"),
+            opens=archived.get("opens", [])[:events_limit],
+            clicks=archived.get("clicks", [])[:events_limit],
+            archived=True
         )
-        total_failed = len(failed_result.scalars().all())
-        yesterday = datetime.now() - timedelta(days=1)
-        last_24h_result = await db.execute(
-            select(EmailLog).where(
-                EmailLog.sent_by == current_user.id,
-                EmailLog.status == 'sent',
-                EmailLog.created_at >= yesterday
-            )
+    opens = await db.execute(
+        select(EmailOpenEvent)
+        .where(EmailOpenEvent.email_log_id == email_id)
+        .order_by(EmailOpenEvent.opened_at.desc())
+        .limit(events_limit)
+    )
+    clicks = await db.execute(
+        select(EmailClick.clicked_at, EmailClick.ip, EmailClick.user_agent, EmailLink.url)
+        .outerjoin(EmailLink, EmailLink.url_hash == EmailClick.url_hash)
+        .where(EmailClick.email_log_id == email_id)
+        .order_by(EmailClick.clicked_at.desc())
+        .limit(events_limit)
+    )
+    return EmailDetail(
+        **history_item(log, list(HISTORY_FIELDS)),
+        body=log.body,
+        html_body=log.html_body,
+        last_clicked_at=log.last_clicked_at.isoformat() if log.last_clicked_at else None,
+        opens=[
+            {
+                "opened_at": event.opened_at.isoformat(),
+                "ip": event.ip,
+                "user_agent": event.user_agent,
+                "referrer": event.referrer,
+                "language": event.language,
+                "classification": event.classification,
+                **(event.data or {})
+            } for event in opens.scalars().all()
+        ],
+        clicks=[
+            {
+                "clicked_at": click.clicked_at.isoformat(),
+                "url": click.url,
+                "ip": click.ip,
+                "user_agent": click.user_agent
+            } for click in clicks.all()
+        ]
+    )
+
+@router.post("/history/delete")
+async def bulk_delete_email_logs(
+    selection: BulkSelection,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Borrar los logs seleccionados (nunca los que están en envío) con sus aperturas y clicks"""
+    if selection.is_empty():
+        raise HTTPException(status_code=400, detail="Indique ids o al menos un filtro")
+    conditions = bulk_conditions(current_user.id, **selection.model_dump())
+    started = time.perf_counter()
+    deleted = await bulk_delete(db, current_user.id, conditions)
+    logger.info(f"🗑️ {deleted} logs borrados en {(time.perf_counter() - started) * 1000:.1f} ms")
+    return {"success": True, "deleted": deleted}
+
+@router.post("/history/resend")
+async def bulk_resend_email_logs(
+    selection: BulkSelection,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Devolver a la cola los logs fallidos seleccionados: los envían los
+    workers de cola (o Celery) como cualquier lote encolado. Cada mailbox
+    consume sus cuotas de envío antes de reencolarse; si una se agota
+    responde 429 y los mailboxes ya reencolados quedan en la cola.
+    """
+    if selection.is_empty():
+        raise HTTPException(status_code=400, detail="Indique ids o al menos un filtro")
+    if selection.status not in (None, STATUS_FAILED):
+        raise HTTPException(status_code=400, detail="Solo se pueden reenviar emails fallidos")
+    conditions = bulk_conditions(current_user.id, **selection.model_dump())
+    counts = await failed_by_mailbox(db, conditions)
+    result = await db.execute(
+        select(Mailbox).where(Mailbox.id.in_([m for m in counts if m is not None]))
+    )
+    mailboxes = {mailbox.id: mailbox for mailbox in result.scalars().all()}
+    requeued = 0
+    for mailbox_id, count in counts.items():
+        mailbox = mailboxes.get(mailbox_id)
+        if mailbox is None:
+            # Sin mailbox no hay con qué enviarlos: se quedan en failed
+            logger.warning(f"⚠️ {count} emails fallidos sin mailbox {mailbox_id}: no se reenvían")
+            continue
+        await rate_limiter.check(send_quotas(current_user.id, mailbox), cost=count)
+        requeued += await bulk_requeue(
+            db, current_user.id, conditions + [EmailLog.mailbox_id == mailbox_id],
+            on_chunk=publish_email_logs
         )
-        last_24h = len(last_24h_result.scalars().all())
-        total_emails = total_sent + total_failed
-        success_rate = (total_sent / total_emails * 100) if total_emails > 0 else 0
-        return EmailStats(
-            total_sent=total_sent,
-            total_failed=total_failed,
+    logger.info(f"🔁 {requeued} emails fallidos devueltos a la cola")
+    return {"success": True, "requeued": requeued}
+
+@router.get("/stats", response_model=EmailStats)
+async def get_email_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    cached = response_cache.get(CACHE_STATS, current_user.id)
+    if cached is not None:
+        return cached
+    try:
+        # Una sola consulta sobre email_stats_hourly, no sobre email_logs
+        totals = await get_stats_totals(db, current_user.id)
+        total_emails = totals["sent"] + totals["failed"]
+        success_rate = (totals["sent"] / total_emails * 100) if total_emails > 0 else 0
+        return response_cache.store(CACHE_STATS, current_user.id, None, EmailStats(
+            total_sent=totals["sent"],
+            total_failed=totals["failed"],
             success_rate=round(success_rate, 2),
-            last_24h=last_24h
-        )
+            last_24h=totals["last_24h"],
+            unique_opens=totals["opened"],
+            total_opens=sum(totals[status] for status in STAT_OPENS),
+            human_opens=totals["open_human"],
+            proxy_opens=totals["open_proxy"],
+            bot_opens=totals["open_bot"]
+        ), settings.RESPONSE_CACHE_TTL_STATS)
     except Exception as e:
         logger.error(f"Error en get_email_stats: {str(e)}")
         return EmailStats(
@@ -562,6 +1469,36 @@ async def get_email_stats(
             last_24h=0
         )
 
+@router.get("/stats/timeseries")
+async def get_email_stats_timeseries(
+    interval: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    mailbox_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Series de enviados, fallidos y abiertos por hora o por día"""
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Intervalo no soportado: {interval} (hour o day)")
+    # Clave con los parámetros tal como llegan: sin end la ventana se mueve,
+    # pero el TTL es menor que una hora
+    params = ("timeseries", interval, start, end, mailbox_id)
+    cached = response_cache.get(CACHE_STATS, current_user.id, params)
+    if cached is not None:
+        return cached
+    end = naive_utc(end) if end else datetime.utcnow()
+    start = naive_utc(start) if start else end - (timedelta(hours=23) if interval == "hour" else timedelta(days=29))
+    if start > end:
+        raise HTTPException(status_code=400, detail="start debe ser anterior a end")
+    if series_size(start, end, interval) > settings.STATS_TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Rango demasiado grande: máximo {settings.STATS_TIMESERIES_MAX_BUCKETS} intervalos"
+        )
+    series = await get_timeseries(db, current_user.id, start, end, interval, mailbox_id)
+    return response_cache.store(CACHE_STATS, current_user.id, params, series, settings.RESPONSE_CACHE_TTL_STATS)
+
 @router.delete("/history/{email_id}")
 async def delete_email_log(
     email_id: int,
@@ -577,21 +1514,11 @@ async def delete_email_log(
     email_log = result.scalar_one_or_none()
     if not email_log:
         raise HTTPException(status_code=404, detail="Email no encontrado")
+    await apply_stats(db, await removal_deltas(db, [email_log]))
+    # Sin FK en cascada cuando email_logs está particionada
+    await db.execute(delete(EmailOpenEvent).where(EmailOpenEvent.email_log_id == email_id))
+    await db.execute(delete(EmailClick).where(EmailClick.email_log_id == email_id))
     await db.delete(email_log)
     await db.commit()
+    response_cache.invalidate_emails([current_user.id])
     return {"success": True, "message": "Log eliminado"}
-
-async def check_rate_limit(user_id: int, db: AsyncSession, limit: int = 100):
-    one_hour_ago = datetime.now() - timedelta(hours=1)
-    result = await db.execute(
-        select(EmailLog).where(
-            EmailLog.sent_by == user_id,
-            EmailLog.created_at >= one_hour_ago
-        )
-    )
-    recent_emails = result.scalars().all()
-    if len(recent_emails) >= limit:
-        raise HTTPException(
-            status_code=429, 
-            detail=f"Límite de {limit} emails por hora excedido"
-        )
@@ -7,14 +7,23 @@ from app.models.mailbox import Mailbox
 from app.schemas.mailbox import MailboxCreate  # asegúrate de tener este schema
 from sqlalchemy import select
 from fastapi import HTTPException, Path
+from app.core.config import settings
+from app.core.response_cache import CACHE_MAILBOXES, response_cache
 
 router = APIRouter(prefix="/mailboxes", tags=["mailboxes"])
 
 @router.get("/", response_model=List[MailboxOut])
 async def get_mailboxes(db: AsyncSession = Depends(get_db)):
+    cached = response_cache.get(CACHE_MAILBOXES, None)
+    if cached is not None:
+        return cached
     result = await db.execute(select(Mailbox))
     mailboxes = result.scalars().all()
-    return mailboxes
+    return response_cache.store(
+        CACHE_MAILBOXES, None, None,
+        [MailboxOut.model_validate(mailbox, from_attributes=True) for mailbox in mailboxes],
+        settings.RESPONSE_CACHE_TTL_MAILBOXES
+    )
 
 @router.post("/", response_model=MailboxOut)
 async def create_mailbox(data: MailboxCreate, db: AsyncSession = Depends(get_db)):
@@ -22,6 +31,7 @@ async def create_mailbox(data: MailboxCreate, db: AsyncSession = Depends(get_db)
     db.add(mailbox)
     await db.commit()
     await db.refresh(mailbox)
+    response_cache.invalidate(CACHE_MAILBOXES)
     return mailbox
 
 @router.post("/{mailbox_id}/verify")
@@ -31,5 +41,6 @@ async def verify_mailbox(mailbox_id: int = Path(...), db: AsyncSession = Depends
         raise HTTPException(status_code=404, detail="Mailbox not found")
     mailbox.is_verified = True
     await db.commit()
+    response_cache.invalidate(CACHE_MAILBOXES)
     await db.refresh(mailbox)
     return {"message": "Mailbox verified", "id": mailbox.id}
\ No newline at end of file
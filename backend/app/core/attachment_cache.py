@@ -0,0 +1,155 @@
+import os
+import mmap
+import base64
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 57 bytes de entrada por línea base64 de 76; se leen bloques de 1024 líneas
+BASE64_LINE_BYTES = 57
+READ_CHUNK_BYTES = BASE64_LINE_BYTES * 1024
+ENCODED_SUFFIX = ".b64"
+
+EncodedPart = Union[bytes, mmap.mmap]
+
+def encode_file_base64(source_path: str, target_path: str) -> Tuple[str, int]:
+    """
+    Codificar un archivo a base64 (líneas CRLF de 76 caracteres) bloque a
+    bloque, calculando su sha256 en la misma pasada. Devuelve (hash, bytes escritos).
+    """
+    digest = hashlib.sha256()
+    written = 0
+    with open(source_path, "rb") as source, open(target_path, "wb") as target:
+        while True:
+            chunk = source.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+            encoded = base64.encodebytes(chunk).replace(b"\n", b"\r\n")
+            target.write(encoded)
+            written += len(encoded)
+    return digest.hexdigest(), written
+
+def resolve_upload(file_path: str) -> Optional[Path]:
+    """Ruta real del adjunto (con symlinks resueltos) si está dentro de UPLOADS_DIR"""
+    path = Path(file_path).resolve()
+    return path if path.is_relative_to(Path(settings.UPLOADS_DIR).resolve()) else None
+
+class AttachmentCache:
+    """
+    Cuerpos base64 de adjuntos en disco, por hash de contenido, mapeados en
+    memoria. Un archivo se codifica una vez aunque se envíe a miles de
+    destinatarios; se expulsa por LRU cuando se supera el presupuesto de bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # hash de contenido -> (tamaño codificado, mapeo en memoria o None
+        # si aún no se abrió en este proceso)
+        self._entries: "OrderedDict[str, Tuple[int, Optional[EncodedPart]]]" = OrderedDict()
+        # (ruta, mtime, tamaño) -> hash de contenido
+        self._index: Dict[Tuple[str, int, int], str] = {}
+        self._lock = threading.Lock()
+        self._ready = False
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _ensure_directory(self):
+        if self._ready:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Archivos de ejecuciones anteriores: cuentan para el presupuesto y
+        # se reutilizan si el contenido coincide
+        existing = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(ENCODED_SUFFIX):
+                stat = os.stat(path)
+                existing.append((stat.st_mtime, name[:-len(ENCODED_SUFFIX)], stat.st_size))
+            elif name.endswith(".tmp"):
+                os.remove(path)
+        for _, content_hash, size in sorted(existing):
+            self._entries[content_hash] = (size, None)
+            self.total_bytes += size
+        self._ready = True
+
+    def _encoded_path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, f"{content_hash}{ENCODED_SUFFIX}")
+
+    def _map(self, content_hash: str) -> EncodedPart:
+        with open(self._encoded_path(content_hash), "rb") as encoded:
+            if os.fstat(encoded.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(encoded.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            content_hash, (size, _) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            # Los mensajes compilados que aún tengan el mapeo lo siguen
+            # pudiendo leer: el archivo se libera al soltar el último mapeo
+            try:
+                os.remove(self._encoded_path(content_hash))
+            except OSError:
+                pass
+            self._index = {k: v for k, v in self._index.items() if v != content_hash}
+
+    def get(self, file_path: str) -> EncodedPart:
+        """Cuerpo base64 del adjunto, codificándolo solo si su contenido es nuevo"""
+        # La ruta viene del cuerpo de la petición: nada fuera de uploads/
+        path = resolve_upload(file_path)
+        if path is None:
+            raise PermissionError(f"Adjunto fuera de {settings.UPLOADS_DIR}: {file_path}")
+        file_path = str(path)
+        stat = os.stat(file_path)
+        key = (file_path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            self._ensure_directory()
+            content_hash = self._index.get(key)
+            entry = self._entries.get(content_hash) if content_hash else None
+            if entry is None or entry[1] is None:
+                # Ruta nueva o modificada: hash y codificación en una sola lectura
+                temp_path = os.path.join(self.directory, f"{os.getpid()}-{threading.get_ident()}.tmp")
+                content_hash, size = encode_file_base64(file_path, temp_path)
+                self._index[key] = content_hash
+                entry = self._entries.get(content_hash)
+                if entry is None:
+                    self.misses += 1
+                    os.replace(temp_path, self._encoded_path(content_hash))
+                    entry = (size, self._map(content_hash))
+                    self.total_bytes += size
+                    logger.info(f"📎 Adjunto {os.path.basename(file_path)} codificado ({size} bytes)")
+                else:
+                    # Mismo contenido con otra ruta, mtime o de una ejecución anterior
+                    os.remove(temp_path)
+                    self.hits += 1
+                    if entry[1] is None:
+                        entry = (entry[0], self._map(content_hash))
+                self._entries[content_hash] = entry
+            else:
+                self.hits += 1
+            self._entries.move_to_end(content_hash)
+            self._evict()
+            return entry[1]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+attachment_cache = AttachmentCache(settings.ATTACHMENT_CACHE_DIR, settings.ATTACHMENT_CACHE_MAX_BYTES)
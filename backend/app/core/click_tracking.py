@@ -0,0 +1,213 @@
+import re
+import hmac
+import html
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select, insert, update, bindparam
+from sqlalchemy.exc import IntegrityError
+from app.core.config import settings
+from app.core.merge_templates import EMAIL_LOG_ID_TAG
+from app.core.write_behind import WriteBehindBuffer
+from app.core.response_cache import response_cache
+from app.db.base import AsyncSessionLocal
+from app.models.email_click import EmailClick
+from app.models.email_link import EmailLink
+from app.models.email_log import EmailLog
+
+logger = logging.getLogger(__name__)
+
+CLICK_PATH = "/emails/track/click/"
+# Marcador de la firma del id del log en los enlaces de click; se reemplaza
+# por destinatario junto a EMAIL_LOG_ID_TAG
+CLICK_SIGNATURE_TAG = "-click_signature-"
+LINK_HREF = re.compile(r"""(<a\b[^>]*?\bhref\s*=\s*)(["'])(.*?)\2""", re.IGNORECASE | re.DOTALL)
+
+def link_hash(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+
+def click_signature(email_log_id: Any) -> str:
+    """HMAC del id del log con SECRET_KEY: sin ella no se puede forjar un click ajeno"""
+    message = f"click:{email_log_id}".encode("utf-8")
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), message, hashlib.sha256).hexdigest()[:16]
+
+def click_token(email_log_id: Any, url_hash: str, signature: str) -> str:
+    return f"{email_log_id}.{url_hash}.{signature}"
+
+def parse_click_token(token: str) -> Optional[Tuple[int, str, bool]]:
+    """
+    (email_log_id, url_hash, firmado). Los tokens sin firma de correos ya
+    enviados siguen redirigiendo, pero su click no se registra.
+    """
+    email_log_id, _, rest = token.partition(".")
+    url_hash, _, signature = rest.partition(".")
+    if not email_log_id.isdigit() or len(url_hash) != 16:
+        return None
+    signed = hmac.compare_digest(signature, click_signature(email_log_id))
+    return int(email_log_id), url_hash, signed
+
+def sign_click_links(html_body: str, email_log_id: Any) -> str:
+    """Rellenar el id del log y su firma en los enlaces de click del destinatario"""
+    return html_body.replace(EMAIL_LOG_ID_TAG, str(email_log_id)).replace(
+        CLICK_SIGNATURE_TAG, click_signature(email_log_id)
+    )
+
+def is_trackable(url: str) -> bool:
+    """Solo enlaces http(s) fijos: no los que ya son de tracking ni los que llevan campos"""
+    if not url.lower().startswith(("http://", "https://")):
+        return False
+    if settings.EMAIL_PLATFORM_API_URL and url.startswith(settings.EMAIL_PLATFORM_API_URL + "/emails/track/"):
+        return False
+    return "{{" not in url and EMAIL_LOG_ID_TAG not in url and "-field." not in url
+
+class LinkTracker:
+    """
+    Mapa hash -> URL en memoria, respaldado en email_links para que cualquier
+    proceso pueda resolver un click. El HTML reescrito se cachea por contenido.
+    """
+
+    def __init__(self, max_urls: int, max_rewrites: int):
+        self.max_urls = max_urls
+        self.max_rewrites = max_rewrites
+        self._urls: "OrderedDict[str, str]" = OrderedDict()
+        self._rewritten: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, url_hash: str, url: str):
+        self._urls[url_hash] = url
+        self._urls.move_to_end(url_hash)
+        while len(self._urls) > self.max_urls:
+            self._urls.popitem(last=False)
+
+    async def register(self, urls: Dict[str, str]):
+        """Guardar en email_links las URLs que este proceso todavía no conoce"""
+        missing = {url_hash: url for url_hash, url in urls.items() if url_hash not in self._urls}
+        if missing:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(EmailLink.url_hash).where(EmailLink.url_hash.in_(list(missing)))
+                )
+                existing = set(result.scalars().all())
+                new_links = [
+                    {"url_hash": url_hash, "url": url}
+                    for url_hash, url in missing.items() if url_hash not in existing
+                ]
+                if new_links:
+                    try:
+                        await db.execute(insert(EmailLink), new_links)
+                        await db.commit()
+                    except IntegrityError:
+                        # Otro proceso registró la misma URL al mismo tiempo
+                        await db.rollback()
+        for url_hash, url in urls.items():
+            self._remember(url_hash, url)
+
+    async def rewrite(self, html_body: str) -> str:
+        """
+        Apuntar los enlaces del HTML a /emails/track/click/. El token lleva
+        EMAIL_LOG_ID_TAG en lugar del id, que se pone por destinatario.
+        """
+        key = hashlib.sha256(html_body.encode("utf-8")).hexdigest()
+        rewritten = self._rewritten.get(key)
+        if rewritten is not None:
+            self._rewritten.move_to_end(key)
+            return rewritten
+        urls: Dict[str, str] = {}
+
+        def replace(match):
+            url = html.unescape(match.group(3).strip())
+            if not is_trackable(url):
+                return match.group(0)
+            url_hash = link_hash(url)
+            urls[url_hash] = url
+            tracked = f"{settings.EMAIL_PLATFORM_API_URL}{CLICK_PATH}{click_token(EMAIL_LOG_ID_TAG, url_hash, CLICK_SIGNATURE_TAG)}"
+            return f"{match.group(1)}{match.group(2)}{tracked}{match.group(2)}"
+
+        rewritten = LINK_HREF.sub(replace, html_body)
+        await self.register(urls)
+        self._rewritten[key] = rewritten
+        while len(self._rewritten) > self.max_rewrites:
+            self._rewritten.popitem(last=False)
+        return rewritten
+
+    async def resolve(self, url_hash: str) -> Optional[str]:
+        """URL de un hash: desde memoria; solo el primer click de una URL desconocida lee la base"""
+        url = self._urls.get(url_hash)
+        if url is not None:
+            self.hits += 1
+            return url
+        self.misses += 1
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(EmailLink.url).where(EmailLink.url_hash == url_hash))
+            url = result.scalar_one_or_none()
+        if url is not None:
+            self._remember(url_hash, url)
+        return url
+
+link_tracker = LinkTracker(settings.CLICK_URL_CACHE_SIZE, settings.CLICK_REWRITE_CACHE_SIZE)
+
+class ClickRecorder(WriteBehindBuffer):
+    """
+    Clicks en memoria; el flusher los guarda en lotes (email_clicks y
+    contadores de email_logs) para que el redirect no espere a la base.
+    """
+
+    name = "clicks"
+
+    def record(self, email_log_id: int, url_hash: str, ip: Optional[str], user_agent: Optional[str]):
+        self.add({
+            "email_log_id": email_log_id,
+            "url_hash": url_hash,
+            "clicked_at": datetime.utcnow(),
+            "ip": ip,
+            "user_agent": user_agent
+        })
+
+    async def flush(self, events: List[Dict[str, Any]]) -> int:
+        counts: Dict[int, List[Any]] = {}
+        for event in events:
+            count = counts.setdefault(event["email_log_id"], [0, event["clicked_at"]])
+            count[0] += 1
+            count[1] = max(count[1], event["clicked_at"])
+        table = EmailLog.__table__
+        async with AsyncSessionLocal() as db:
+            existing = await db.execute(
+                select(EmailLog.id, EmailLog.sent_by).where(EmailLog.id.in_(list(counts)))
+            )
+            owners = dict(existing.all())
+            known = set(owners)
+            events = [event for event in events if event["email_log_id"] in known]
+            if not events:
+                return 0
+            await db.execute(insert(EmailClick), events)
+            await db.execute(
+                update(table)
+                .where(table.c.id == bindparam("b_id"))
+                .values(
+                    click_count=table.c.click_count + bindparam("b_count"),
+                    last_clicked_at=bindparam("b_last")
+                ),
+                [
+                    {"b_id": email_log_id, "b_count": count, "b_last": last}
+                    for email_log_id, (count, last) in counts.items() if email_log_id in known
+                ]
+            )
+            await db.commit()
+        response_cache.invalidate_emails(owners.values())
+        return len(events)
+
+click_recorder = ClickRecorder(
+    settings.CLICK_EVENTS_MAX_PENDING, settings.CLICK_FLUSH_INTERVAL, settings.CLICK_FLUSH_BATCH
+)
+
+async def start_click_recorder():
+    click_recorder.start()
+    print("✅ Registro de clicks iniciado")
+
+async def stop_click_recorder():
+    """Detener el flusher y guardar los clicks que queden en memoria"""
+    await click_recorder.stop()
+    print("❌ Registro de clicks detenido")
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import Optional, Dict
 
 class Settings(BaseSettings):
     # Información general
@@ -29,6 +29,113 @@ class Settings(BaseSettings):
     # ✅ Variable para tracking de emails
     EMAIL_PLATFORM_API_URL: str = "http://localhost:8000"
 
+    # Envíos masivos
+    EMAIL_BATCH_MAX_RECIPIENTS: int = 50000
+    EMAIL_BATCH_CONCURRENCY: int = 20
+    EMAIL_BATCH_MAX_CONCURRENCY: int = 100
+
+    # Cola persistente de envío (email_logs en pending)
+    EMAIL_QUEUE_BATCH_SIZE: int = 200
+    EMAIL_QUEUE_POLL_INTERVAL: float = 2.0
+    EMAIL_QUEUE_LEASE_SECONDS: float = 300.0
+    EMAIL_QUEUE_MAX_ATTEMPTS: int = 3
+    EMAIL_QUEUE_EMBEDDED_WORKERS: int = 1
+    EMAIL_QUEUE_SHUTDOWN_TIMEOUT: float = 10.0
+
+    # Cómo se despachan los emails encolados: "queue" (workers que leen
+    # email_logs) o "celery" (la API publica chunks en el broker)
+    EMAIL_DISPATCH_BACKEND: str = "queue"
+    CELERY_BROKER_URL: str = "redis://localhost:6379/0"
+    CELERY_PREFETCH_MULTIPLIER: int = 1
+    CELERY_EMAIL_CHUNK_SIZE: int = 500
+    # Con Celery, los workers de cola solo recogen pendientes huérfanos
+    CELERY_ORPHAN_GRACE_SECONDS: float = 600.0
+
+    # Reintentos: backoff exponencial con jitter
+    EMAIL_RETRY_BASE_DELAY: float = 30.0
+    EMAIL_RETRY_MULTIPLIER: float = 2.0
+    EMAIL_RETRY_MAX_DELAY: float = 3600.0
+    EMAIL_RETRY_JITTER: float = 0.2
+
+    # Cliente HTTP compartido para APIs de proveedores (SendGrid, etc.)
+    PROVIDER_HTTP_MAX_CONNECTIONS: int = 100
+    PROVIDER_HTTP_MAX_KEEPALIVE: int = 20
+    PROVIDER_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    PROVIDER_HTTP_TIMEOUT: float = 30.0
+    PROVIDER_HTTP2: bool = True
+    SENDGRID_MAX_PERSONALIZATIONS: int = 1000
+
+    # Rate limiting de envíos (0 = sin límite)
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" o "redis" para varios procesos
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/1"
+    RATE_LIMIT_REDIS_PREFIX: str = "ratelimit:"
+    RATE_LIMIT_USER_PER_HOUR: int = 20000
+    # Cupo diario por mailbox según el proveedor que realmente entrega
+    RATE_LIMIT_MAILBOX_DAILY: Dict[str, int] = {
+        "gmail": 500,
+        "outlook": 300,
+        "yahoo": 500,
+        "sendgrid": 0
+    }
+    RATE_LIMIT_PROVIDER_PER_MINUTE: Dict[str, int] = {
+        "sendgrid": 0
+    }
+
+    # Pool de sesiones SMTP por mailbox
+    SMTP_TIMEOUT: float = 30.0
+    SMTP_POOL_MAX_CONNECTIONS: int = 5
+    SMTP_POOL_IDLE_TIMEOUT: float = 60.0
+    SMTP_POOL_HEALTH_CHECK_INTERVAL: float = 15.0
+    SMTP_POOL_MAX_MESSAGES_PER_CONNECTION: int = 100
+    # Mensajes de campaña compilados (MIME serializado una vez por contenido)
+    MIME_COMPILED_CACHE_SIZE: int = 32
+    # Plantillas con campos {{...}} compiladas, por hash de contenido
+    TEMPLATE_CACHE_SIZE: int = 128
+    # Aperturas: el pixel encola en memoria y un flusher guarda en lotes
+    OPEN_EVENTS_MAX_PENDING: int = 50000
+    OPEN_FLUSH_INTERVAL: float = 0.5
+    OPEN_FLUSH_BATCH: int = 1000
+    # Enriquecimiento de eventos: user-agent y GeoIP (MaxMind .mmdb)
+    TRACKING_ENRICH_IN_BACKGROUND: bool = True
+    TRACKING_UA_CACHE_SIZE: int = 1024
+    GEOIP_DATABASE_PATH: Optional[str] = None
+    GEOIP_CACHE_SIZE: int = 50000
+    # Clasificación de aperturas (human/proxy/bot): listas CIDR proxy*.txt y bot*.txt
+    OPEN_CLASSIFIER_CIDR_DIR: str = "data/ip_ranges"
+    # Tracking de clicks: reescritura de enlaces y redirect desde memoria
+    CLICK_TRACKING_ENABLED: bool = True
+    CLICK_URL_CACHE_SIZE: int = 10000
+    CLICK_REWRITE_CACHE_SIZE: int = 64
+    CLICK_EVENTS_MAX_PENDING: int = 10000
+    CLICK_FLUSH_INTERVAL: float = 0.5
+    CLICK_FLUSH_BATCH: int = 500
+    # Adjuntos: solo se envían archivos de UPLOADS_DIR. Se cachean codificados
+    # en base64, por hash de contenido (fuera de uploads/, que se sirve como
+    # estático)
+    UPLOADS_DIR: str = "uploads"
+    ATTACHMENT_CACHE_DIR: str = ".cache/attachments"
+    ATTACHMENT_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    # Estadísticas: máximo de intervalos por serie en /emails/stats/timeseries
+    STATS_TIMESERIES_MAX_BUCKETS: int = 2000
+    # Cache en proceso de las lecturas del dashboard (TTL en segundos)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    RESPONSE_CACHE_TTL_STATS: float = 30.0
+    RESPONSE_CACHE_TTL_HISTORY: float = 15.0
+    RESPONSE_CACHE_TTL_MAILBOXES: float = 60.0
+    RESPONSE_CACHE_TTL_DOMAINS: float = 300.0
+    # Exportación de logs: filas por lote leídas del cursor del servidor
+    EXPORT_BATCH_SIZE: int = 1000
+    # Borrado y reenvío masivo: filas por sentencia (y por transacción)
+    EMAIL_BULK_CHUNK_SIZE: int = 1000
+    # Retención de email_logs: particiones mensuales (Postgres) y meses viejos
+    # archivados en disco como JSONL comprimido (0 días = sin archivar)
+    LOG_RETENTION_DAYS: int = 0
+    LOG_ARCHIVE_DIR: str = "data/archive"
+    LOG_ARCHIVE_INTERVAL: float = 6 * 3600.0
+    LOG_PARTITIONS_AHEAD: int = 3
+    LOG_ARCHIVE_EMBEDDED: bool = True
+
     # ✅ Solo usar model_config (NO class Config)
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -0,0 +1,127 @@
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.email_queue import STATUS_FAILED, STATUS_PENDING, STATUS_SENDING
+from app.core.email_stats import StatsDelta, add_stat, apply_stats, removal_deltas
+from app.core.response_cache import response_cache
+from app.models.email_log import EmailLog
+from app.models.email_open_event import EmailOpenEvent
+from app.models.email_click import EmailClick
+
+def bulk_conditions(user_id: int, ids: Optional[List[int]] = None, status: Optional[str] = None,
+                    mailbox_id: Optional[int] = None, created_from: Optional[datetime] = None,
+                    created_to: Optional[datetime] = None) -> List[Any]:
+    """
+    Condiciones de una operación masiva: siempre del usuario y nunca sobre
+    logs en envío (los tiene reservados un worker)
+    """
+    conditions = [EmailLog.sent_by == user_id, EmailLog.status != STATUS_SENDING]
+    if ids is not None:
+        conditions.append(EmailLog.id.in_(ids))
+    if status:
+        conditions.append(EmailLog.status == status)
+    if mailbox_id is not None:
+        conditions.append(EmailLog.mailbox_id == mailbox_id)
+    if created_from is not None:
+        conditions.append(EmailLog.created_at >= created_from)
+    if created_to is not None:
+        conditions.append(EmailLog.created_at < created_to)
+    return conditions
+
+def _chunk(conditions: List[Any], chunk_size: int):
+    return select(EmailLog.id).where(*conditions).limit(chunk_size)
+
+async def bulk_delete(db: AsyncSession, user_id: int, conditions: List[Any],
+                      chunk_size: Optional[int] = None) -> int:
+    """
+    Borrar por lotes: se bloquea un lote con SELECT ... LIMIT n FOR UPDATE,
+    se resta del rollup (aperturas incluidas, antes de que el ON DELETE
+    CASCADE se las lleve) y se borran aperturas, clicks y logs, todo en la
+    misma transacción. Cada lote se confirma por separado: las
+    transacciones y los locks quedan acotados.
+    """
+    chunk_size = chunk_size or settings.EMAIL_BULK_CHUNK_SIZE
+    deleted = 0
+    while True:
+        result = await db.execute(
+            select(
+                EmailLog.id, EmailLog.sent_by, EmailLog.mailbox_id, EmailLog.status,
+                EmailLog.created_at, EmailLog.opened_at
+            )
+            .where(*conditions)
+            .limit(chunk_size)
+            .with_for_update()
+        )
+        rows = result.all()
+        if rows:
+            ids = [row.id for row in rows]
+            await apply_stats(db, await removal_deltas(db, rows))
+            await db.execute(delete(EmailOpenEvent).where(EmailOpenEvent.email_log_id.in_(ids)))
+            await db.execute(delete(EmailClick).where(EmailClick.email_log_id.in_(ids)))
+            await db.execute(
+                delete(EmailLog).where(EmailLog.id.in_(ids))
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+        deleted += len(rows)
+        if len(rows) < chunk_size:
+            break
+    response_cache.invalidate_emails([user_id])
+    return deleted
+
+async def failed_by_mailbox(db: AsyncSession, conditions: List[Any]) -> Dict[Optional[int], int]:
+    """Cuántos logs fallidos de la selección hay por mailbox (para cobrar las cuotas)"""
+    result = await db.execute(
+        select(EmailLog.mailbox_id, func.count())
+        .where(*conditions, EmailLog.status == STATUS_FAILED)
+        .group_by(EmailLog.mailbox_id)
+    )
+    return dict(result.all())
+
+async def bulk_requeue(db: AsyncSession, user_id: int, conditions: List[Any],
+                       chunk_size: Optional[int] = None,
+                       on_chunk: Optional[Callable[[List[int]], Awaitable[Any]]] = None) -> int:
+    """
+    Devolver logs fallidos a la cola (pending, intentos a cero) por lotes con
+    un UPDATE ... RETURNING. El lote se bloquea (saltando las filas que otra
+    operación ya tiene) y el UPDATE repite las condiciones: solo se resta del
+    rollup lo que seguía en failed. El sent o failed del nuevo intento lo
+    suma complete_email_logs. `on_chunk` recibe los ids de cada lote ya
+    confirmado (p. ej. para publicarlos en Celery).
+    """
+    chunk_size = chunk_size or settings.EMAIL_BULK_CHUNK_SIZE
+    conditions = conditions + [EmailLog.status == STATUS_FAILED]
+    requeued = 0
+    while True:
+        result = await db.execute(
+            update(EmailLog)
+            .where(
+                EmailLog.id.in_(_chunk(conditions, chunk_size).with_for_update(skip_locked=True)),
+                *conditions
+            )
+            .values(
+                status=STATUS_PENDING,
+                attempts=0,
+                error_message=None,
+                next_attempt_at=None,
+                locked_by=None,
+                locked_until=None
+            )
+            .returning(EmailLog.id, EmailLog.sent_by, EmailLog.mailbox_id, EmailLog.created_at)
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+        deltas = StatsDelta()
+        for row in rows:
+            add_stat(deltas, row.sent_by, row.mailbox_id, STATUS_FAILED, row.created_at, -1)
+        await apply_stats(db, deltas)
+        await db.commit()
+        requeued += len(rows)
+        if rows and on_chunk is not None:
+            await on_chunk([row.id for row in rows])
+        if len(rows) < chunk_size:
+            break
+    response_cache.invalidate_emails([user_id])
+    return requeued
@@ -0,0 +1,285 @@
+import os
+import socket
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.retry import backoff_delay
+from app.core.email_stats import apply_stats, terminal_stats
+from app.core.response_cache import response_cache
+from app.db.base import AsyncSessionLocal
+from app.models.email_log import EmailLog
+
+logger = logging.getLogger(__name__)
+
+# Estados de la cola persistente sobre email_logs
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def lease_deadline(seconds: Optional[float] = None) -> datetime:
+    return utcnow() + timedelta(seconds=seconds or settings.EMAIL_QUEUE_LEASE_SECONDS)
+
+def claimable(now: datetime, grace_seconds: float = 0):
+    # Pendientes ya vencidos, o en envío con el lease expirado (worker caído)
+    pending = and_(
+        EmailLog.status == STATUS_PENDING,
+        or_(EmailLog.next_attempt_at.is_(None), EmailLog.next_attempt_at <= now)
+    )
+    if grace_seconds:
+        # Solo los que nadie despachó en `grace_seconds` (p. ej. mensaje de Celery perdido)
+        pending = and_(
+            pending,
+            func.coalesce(EmailLog.next_attempt_at, EmailLog.created_at)
+            <= now - timedelta(seconds=grace_seconds)
+        )
+    return or_(
+        pending,
+        and_(
+            EmailLog.status == STATUS_SENDING,
+            EmailLog.locked_until < now,
+            EmailLog.attempts < settings.EMAIL_QUEUE_MAX_ATTEMPTS
+        )
+    )
+
+async def claim_email_logs(db: AsyncSession, worker_id: str, limit: int,
+                           ids: Optional[List[int]] = None,
+                           grace_seconds: float = 0) -> List[Dict[str, Any]]:
+    """
+    Reservar hasta `limit` emails con SELECT ... FOR UPDATE SKIP LOCKED, de modo
+    que varios workers (o procesos) nunca tomen el mismo log. Con `ids` solo
+    se reservan esos logs (tareas de Celery).
+    """
+    now = utcnow()
+    candidates = select(EmailLog.id).where(claimable(now, grace_seconds))
+    if ids is not None:
+        candidates = candidates.where(EmailLog.id.in_(ids))
+    candidates = (
+        candidates
+        .order_by(EmailLog.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(EmailLog)
+        .where(EmailLog.id.in_(candidates))
+        .values(
+            status=STATUS_SENDING,
+            locked_by=worker_id,
+            locked_until=lease_deadline(),
+            attempts=EmailLog.attempts + 1
+        )
+        .returning(
+            EmailLog.id, EmailLog.mailbox_id, EmailLog.sent_by, EmailLog.to_email,
+            EmailLog.subject, EmailLog.body, EmailLog.html_body,
+            EmailLog.send_options, EmailLog.attempts
+        )
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    await db.commit()
+    claimed = []
+    for row in sorted(rows, key=lambda r: r.id):
+        options = row.send_options or {}
+        claimed.append({
+            "email_log_id": row.id,
+            "mailbox_id": row.mailbox_id,
+            "sent_by": row.sent_by,
+            "to_email": row.to_email,
+            "subject": row.subject,
+            "body": row.body or "",
+            "html_body": row.html_body,
+            "cc": options.get("cc"),
+            "bcc": options.get("bcc"),
+            "attachments": options.get("attachments"),
+            "fields": options.get("fields"),
+            "attempts": row.attempts
+        })
+    return claimed
+
+async def renew_leases(db: AsyncSession, worker_id: str) -> int:
+    """Extender el lease de todos los logs que `worker_id` tiene en envío"""
+    result = await db.execute(
+        update(EmailLog)
+        .where(EmailLog.status == STATUS_SENDING, EmailLog.locked_by == worker_id)
+        .values(locked_until=lease_deadline())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+async def _renew_leases_forever(worker_id: str, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSessionLocal() as db:
+                await renew_leases(db, worker_id)
+        except Exception as e:
+            logger.error(f"❌ Error renovando leases de {worker_id}: {str(e)}")
+
+@asynccontextmanager
+async def hold_leases(worker_id: str):
+    """
+    Mantener vivos los leases mientras dura el envío de un lote: sin
+    renovación, un lote que tarda más que EMAIL_QUEUE_LEASE_SECONDS lo
+    reclamaría otro worker y se enviaría dos veces. Se renueva cada tercio
+    del lease, en su propia sesión.
+    """
+    task = asyncio.create_task(
+        _renew_leases_forever(worker_id, settings.EMAIL_QUEUE_LEASE_SECONDS / 3)
+    )
+    try:
+        yield
+    finally:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+def _chunks(ids: List[int], size: int) -> List[List[int]]:
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+async def _leased_owners(db: AsyncSession, worker_id: str,
+                         ids: List[int]) -> Dict[int, Tuple[int, int, datetime]]:
+    """
+    Bloquear los logs que siguen reservados por `worker_id`; los que otro
+    worker reclamó tras expirar el lease quedan fuera. Por lotes: asyncpg
+    no admite más de 32767 parámetros por sentencia.
+    """
+    owners = {}
+    for chunk in _chunks(ids, settings.EMAIL_BULK_CHUNK_SIZE):
+        result = await db.execute(
+            select(EmailLog.id, EmailLog.sent_by, EmailLog.mailbox_id, EmailLog.created_at)
+            .where(
+                EmailLog.id.in_(chunk),
+                EmailLog.status == STATUS_SENDING,
+                EmailLog.locked_by == worker_id
+            )
+            .with_for_update()
+        )
+        owners.update({row.id: (row.sent_by, row.mailbox_id, row.created_at) for row in result.all()})
+    return owners
+
+async def complete_email_logs(db: AsyncSession, worker_id: str, outcomes: List[Dict[str, Any]],
+                              attempts: Dict[int, int]) -> List[Dict[str, Any]]:
+    """
+    Guardar el resultado de un lote. Los fallidos transitorios con intentos
+    restantes vuelven a pending con next_attempt_at según el backoff; los
+    rechazos definitivos quedan en failed sin reintento. Solo se guardan (y
+    se devuelven) los logs que `worker_id` todavía tiene reservados.
+    """
+    if not outcomes:
+        return []
+    owners = await _leased_owners(db, worker_id, [outcome["id"] for outcome in outcomes])
+    lost = len(outcomes) - len(owners)
+    if lost:
+        logger.warning(f"⚠️ {lost} emails con el lease perdido: el resultado de {worker_id} se descarta")
+    now = utcnow()
+    rows = []
+    for outcome in outcomes:
+        if outcome["id"] not in owners:
+            continue
+        status = outcome["status"]
+        next_attempt_at = None
+        attempt = attempts.get(outcome["id"], 0)
+        if (
+            status == STATUS_FAILED
+            and outcome.get("retryable", True)
+            and attempt < settings.EMAIL_QUEUE_MAX_ATTEMPTS
+        ):
+            status = STATUS_PENDING
+            next_attempt_at = now + timedelta(seconds=backoff_delay(attempt))
+        rows.append({
+            "id": outcome["id"],
+            "status": status,
+            "error_message": outcome.get("error_message"),
+            "next_attempt_at": next_attempt_at,
+            "locked_by": None,
+            "locked_until": None
+        })
+    if rows:
+        await db.execute(update(EmailLog), rows)
+    # El rollup de estadísticas se actualiza en la misma transacción
+    await apply_stats(db, terminal_stats(rows, owners))
+    await db.commit()
+    response_cache.invalidate_emails(owner[0] for owner in owners.values())
+    return rows
+
+async def fail_expired_leases(db: AsyncSession) -> int:
+    """Marcar como failed los logs cuyo lease expiró sin intentos restantes"""
+    result = await db.execute(
+        update(EmailLog)
+        .where(
+            EmailLog.status == STATUS_SENDING,
+            EmailLog.locked_until < utcnow(),
+            EmailLog.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS
+        )
+        .values(
+            status=STATUS_FAILED,
+            error_message="Lease de envío expirado sin confirmación",
+            locked_by=None,
+            locked_until=None
+        )
+        .returning(EmailLog.id, EmailLog.sent_by, EmailLog.mailbox_id, EmailLog.created_at)
+        .execution_options(synchronize_session=False)
+    )
+    expired = result.all()
+    await apply_stats(db, terminal_stats(
+        [{"id": row.id, "status": STATUS_FAILED} for row in expired],
+        {row.id: (row.sent_by, row.mailbox_id, row.created_at) for row in expired}
+    ))
+    await db.commit()
+    response_cache.invalidate_emails(row.sent_by for row in expired)
+    return len(expired)
+
+async def get_next_retry(db: AsyncSession) -> Optional[Tuple[int, datetime]]:
+    """El reintento programado más próximo (usa ix_email_logs_queue)"""
+    result = await db.execute(
+        select(EmailLog.id, EmailLog.next_attempt_at)
+        .where(EmailLog.status == STATUS_PENDING, EmailLog.next_attempt_at > utcnow())
+        .order_by(EmailLog.next_attempt_at)
+        .limit(1)
+    )
+    row = result.first()
+    if row is None:
+        return None
+    due_at = row.next_attempt_at
+    if due_at.tzinfo is None:
+        due_at = due_at.replace(tzinfo=timezone.utc)
+    return row.id, due_at
+
+async def get_queue_depth(db: AsyncSession, user_id: Optional[int] = None) -> Dict[str, Any]:
+    """Profundidad de la cola: pendientes, en envío, leases vencidos y antigüedad"""
+    now = utcnow()
+    query = select(
+        func.count().filter(EmailLog.status == STATUS_PENDING),
+        func.count().filter(and_(
+            EmailLog.status == STATUS_PENDING,
+            or_(EmailLog.next_attempt_at.is_(None), EmailLog.next_attempt_at <= now)
+        )),
+        func.count().filter(EmailLog.status == STATUS_SENDING),
+        func.count().filter(and_(EmailLog.status == STATUS_SENDING, EmailLog.locked_until < now)),
+        func.min(EmailLog.created_at).filter(EmailLog.status == STATUS_PENDING)
+    ).where(EmailLog.status.in_([STATUS_PENDING, STATUS_SENDING]))
+    if user_id is not None:
+        query = query.where(EmailLog.sent_by == user_id)
+    pending, ready, sending, expired, oldest = (await db.execute(query)).one()
+    return {
+        "pending": pending,
+        "ready": ready,
+        "scheduled_retries": pending - ready,
+        "sending": sending,
+        "expired_leases": expired,
+        "oldest_pending_at": oldest.isoformat() if oldest else None
+    }
@@ -0,0 +1,107 @@
+import re
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from sqlalchemy import Select, and_, column, func, literal, literal_column, or_, select, table, tuple_
+from app.models.email_log import EmailLog
+
+# Campos de la búsqueda: `to:acme.com`, `from:billing`, `subject:factura`.
+# Los términos sin prefijo buscan en los tres.
+SEARCH_FIELDS = {"subject": "subject", "to": "to_email", "from": "from_email"}
+
+# Postgres: palabras del asunto con tsvector y direcciones por subcadena con
+# trigramas (ILIKE '%acme.com%' usa el índice gin_trgm_ops)
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_email_logs_subject_tsv ON email_logs USING GIN (to_tsvector('simple', subject))",
+    "CREATE INDEX IF NOT EXISTS ix_email_logs_to_trgm ON email_logs USING GIN (to_email gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_email_logs_from_trgm ON email_logs USING GIN (from_email gin_trgm_ops)",
+]
+
+# SQLite: tabla FTS5 email_logs_fts de contenido externo, sincronizada con
+# triggers (la crea la migración 0001_baseline)
+
+# Pesos bm25 por columna (subject, to_email, from_email)
+SQLITE_WEIGHTS = (10.0, 5.0, 5.0)
+
+QUERY_TOKEN = re.compile(r'(?:(\w+):)?(?:"([^"]*)"|(\S+))')
+WORD = re.compile(r"[^\W_]+")
+
+SearchTerm = Tuple[Optional[str], str]
+
+def parse_search(q: str) -> List[SearchTerm]:
+    """`invoice to:@acme.com "marzo 2024"` -> [(None, "invoice"), ("to", "@acme.com"), (None, "marzo 2024")]"""
+    terms = []
+    for match in QUERY_TOKEN.finditer(q or ""):
+        prefix, quoted, bare = match.groups()
+        value = quoted if quoted is not None else bare
+        if prefix and prefix.lower() not in SEARCH_FIELDS:
+            # `http://...` y similares: el prefijo es parte del término
+            value, prefix = f"{prefix}:{value}", None
+        value = value.strip()
+        if value and WORD.search(value):
+            terms.append((prefix.lower() if prefix else None, value))
+    return terms
+
+def _contains(field: Any, term: str):
+    escaped = term.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+    return field.ilike(f"%{escaped}%", escape="!")
+
+def _prefix_query(words: List[str], operator: str) -> str:
+    return f" {operator} ".join(f"{word}:*" for word in words)
+
+def _postgres_search(terms: List[SearchTerm], columns: Sequence[Any]) -> Select:
+    # Misma expresión que ix_email_logs_subject_tsv, con la configuración literal
+    document = func.to_tsvector(literal_column("'simple'"), EmailLog.subject)
+    conditions = []
+    rank_words = []
+    for field, term in terms:
+        words = [word.lower() for word in WORD.findall(term)]
+        subject_match = document.op("@@")(func.to_tsquery(literal_column("'simple'"), _prefix_query(words, "&")))
+        address = "@" in term or "." in term
+        if field == "subject":
+            conditions.append(subject_match)
+            rank_words += words
+        elif field in ("to", "from"):
+            conditions.append(_contains(getattr(EmailLog, SEARCH_FIELDS[field]), term))
+        elif address:
+            conditions.append(or_(_contains(EmailLog.to_email, term), _contains(EmailLog.from_email, term)))
+        else:
+            conditions.append(or_(subject_match, _contains(EmailLog.to_email, term), _contains(EmailLog.from_email, term)))
+            rank_words += words
+    rank = literal(0.0)
+    if rank_words:
+        rank = func.ts_rank(document, func.to_tsquery(literal_column("'simple'"), _prefix_query(rank_words, "|")))
+    return select(*columns, rank.label("rank")).where(and_(*conditions))
+
+def _fts_phrase(term: str) -> str:
+    # Frase de tokens con la última palabra como prefijo: "acme com"*
+    return '"' + " ".join(WORD.findall(term)) + '"*'
+
+def _sqlite_search(terms: List[SearchTerm], columns: Sequence[Any]) -> Select:
+    fts = table("email_logs_fts", column("rowid"))
+    match = " AND ".join(
+        f"{SEARCH_FIELDS[field]} : {_fts_phrase(term)}" if field else _fts_phrase(term)
+        for field, term in terms
+    )
+    # bm25 es menor cuanto más relevante; se invierte para ordenar igual que ts_rank
+    rank = -func.bm25(literal_column("email_logs_fts"), *SQLITE_WEIGHTS)
+    return (
+        select(*columns, rank.label("rank"))
+        .select_from(EmailLog.__table__.join(fts, fts.c.rowid == EmailLog.id))
+        .where(literal_column("email_logs_fts").op("MATCH")(match))
+    )
+
+def search_query(dialect: str, user_id: int, terms: List[SearchTerm], limit: int,
+                 cursor: Optional[Tuple[float, datetime, int]] = None,
+                 columns: Sequence[Any] = (EmailLog.id, EmailLog.created_at)) -> Select:
+    """
+    Resultados del usuario por relevancia y luego del más reciente al más
+    antiguo. La paginación es keyset sobre (rank, created_at, id): la página
+    siguiente empieza después de la última fila devuelta.
+    """
+    build = _postgres_search if dialect == "postgresql" else _sqlite_search
+    ranked = build(terms, columns).where(EmailLog.sent_by == user_id).subquery()
+    query = select(ranked)
+    if cursor is not None:
+        query = query.where(tuple_(ranked.c.rank, ranked.c.created_at, ranked.c.id) < cursor)
+    return query.order_by(ranked.c.rank.desc(), ranked.c.created_at.desc(), ranked.c.id.desc()).limit(limit)
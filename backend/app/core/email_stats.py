@@ -0,0 +1,148 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.email_open_event import EmailOpenEvent
+from app.models.email_stats_hourly import EmailStatsHourly
+
+# Estados del rollup: transiciones de envío y aperturas
+STAT_SENT = "sent"
+STAT_FAILED = "failed"
+STAT_OPENED = "opened"  # Emails abiertos al menos una vez
+STAT_OPENS = ("open_human", "open_proxy", "open_bot")  # Eventos de apertura por origen
+STATS = (STAT_SENT, STAT_FAILED, STAT_OPENED) + STAT_OPENS
+
+INTERVALS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+# (user_id, bucket, mailbox_id, status) -> incremento
+StatsDelta = Counter
+
+def open_stat(classification: Optional[str]) -> str:
+    return f"open_{classification or 'human'}"
+
+def naive_utc(moment: datetime) -> datetime:
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def hour_bucket(moment: Optional[datetime] = None) -> datetime:
+    """Inicio de la hora en UTC sin zona, como se guarda en email_stats_hourly"""
+    moment = datetime.utcnow() if moment is None else naive_utc(moment)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def add_stat(deltas: StatsDelta, user_id: Optional[int], mailbox_id: Optional[int],
+             status: str, moment: Optional[datetime], count: int = 1):
+    if user_id is None:
+        return
+    deltas[(user_id, hour_bucket(moment), mailbox_id or 0, status)] += count
+
+async def apply_stats(db: AsyncSession, deltas: StatsDelta):
+    """
+    Sumar los incrementos al rollup con un solo upsert por lotes, en la
+    transacción del cambio de estado. Las claves van ordenadas para que dos
+    transacciones no se bloqueen en orden cruzado.
+    """
+    rows = [
+        {"user_id": user_id, "bucket": bucket, "mailbox_id": mailbox_id, "status": status, "count": count}
+        for (user_id, bucket, mailbox_id, status), count in sorted(deltas.items()) if count
+    ]
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    statement = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(EmailStatsHourly)
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id", "bucket", "mailbox_id", "status"],
+        set_={"count": EmailStatsHourly.count + statement.excluded["count"]}
+    )
+    await db.execute(statement, rows)
+
+async def removal_deltas(db: AsyncSession, logs: Iterable[Any]) -> StatsDelta:
+    """Incrementos negativos para logs que se van a borrar"""
+    deltas = StatsDelta()
+    owners = {}
+    for log in logs:
+        owners[log.id] = (log.sent_by, log.mailbox_id)
+        if log.status in (STAT_SENT, STAT_FAILED):
+            add_stat(deltas, log.sent_by, log.mailbox_id, log.status, log.created_at, -1)
+        if log.opened_at is not None:
+            add_stat(deltas, log.sent_by, log.mailbox_id, STAT_OPENED, log.opened_at, -1)
+    if owners:
+        events = await db.execute(
+            select(EmailOpenEvent.email_log_id, EmailOpenEvent.opened_at, EmailOpenEvent.classification)
+            .where(EmailOpenEvent.email_log_id.in_(list(owners)))
+        )
+        for email_log_id, opened_at, classification in events.all():
+            user_id, mailbox_id = owners[email_log_id]
+            add_stat(deltas, user_id, mailbox_id, open_stat(classification), opened_at, -1)
+    return deltas
+
+async def get_stats_totals(db: AsyncSession, user_id: int) -> Dict[str, int]:
+    """Totales del usuario en una sola consulta sobre el rollup"""
+    since = hour_bucket(datetime.utcnow() - timedelta(hours=24))
+    columns = [
+        func.coalesce(func.sum(EmailStatsHourly.count).filter(EmailStatsHourly.status == status), 0)
+        for status in STATS
+    ]
+    columns.append(func.coalesce(func.sum(EmailStatsHourly.count).filter(
+        EmailStatsHourly.status == STAT_SENT, EmailStatsHourly.bucket >= since
+    ), 0))
+    row = (await db.execute(select(*columns).where(EmailStatsHourly.user_id == user_id))).one()
+    totals = dict(zip(STATS, row))
+    totals["last_24h"] = row[-1]
+    return totals
+
+async def get_timeseries(db: AsyncSession, user_id: int, start: datetime, end: datetime,
+                         interval: str = "hour", mailbox_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Series por intervalo desde el rollup: lee como mucho una fila por hora,
+    buzón y estado del rango, sin importar cuántos logs tenga el usuario.
+    """
+    step = INTERVALS[interval]
+    start, end = hour_bucket(start), naive_utc(end)
+    if interval == "day":
+        start = start.replace(hour=0)
+    query = (
+        select(EmailStatsHourly.bucket, EmailStatsHourly.status, func.sum(EmailStatsHourly.count))
+        .where(
+            EmailStatsHourly.user_id == user_id,
+            EmailStatsHourly.bucket >= start,
+            EmailStatsHourly.bucket < hour_bucket(end) + timedelta(hours=1)
+        )
+        .group_by(EmailStatsHourly.bucket, EmailStatsHourly.status)
+    )
+    if mailbox_id is not None:
+        query = query.where(EmailStatsHourly.mailbox_id == mailbox_id)
+    buckets: List[datetime] = []
+    moment = start
+    while moment <= end:
+        buckets.append(moment)
+        moment += step
+    positions = {bucket: i for i, bucket in enumerate(buckets)}
+    series = {status: [0] * len(buckets) for status in STATS}
+    for bucket, status, count in (await db.execute(query)).all():
+        if interval == "day":
+            bucket = bucket.replace(hour=0)
+        position = positions.get(bucket)
+        if position is not None and status in series:
+            series[status][position] += count
+    return {
+        "interval": interval,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "buckets": [bucket.isoformat() for bucket in buckets],
+        "series": series
+    }
+
+def series_size(start: datetime, end: datetime, interval: str) -> int:
+    return int((naive_utc(end) - naive_utc(start)) / INTERVALS[interval]) + 1
+
+def terminal_stats(rows: List[Dict[str, Any]], owners: Dict[int, Tuple[Any, Any, Any]]) -> StatsDelta:
+    """Incrementos de sent/failed para los logs que llegaron a un estado final"""
+    deltas = StatsDelta()
+    for row in rows:
+        if row["status"] in (STAT_SENT, STAT_FAILED) and row["id"] in owners:
+            user_id, mailbox_id, created_at = owners[row["id"]]
+            add_stat(deltas, user_id, mailbox_id, row["status"], created_at)
+    return deltas
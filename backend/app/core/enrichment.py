@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+# Advanced tracking imports
+try:
+    import user_agents
+except ImportError:
+    user_agents = None
+try:
+    import geoip2.database
+    import geoip2.errors
+    import maxminddb
+except ImportError:
+    geoip2 = None
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=settings.TRACKING_UA_CACHE_SIZE)
+def _parse_user_agent(user_agent_string: str) -> Tuple[Tuple[str, Any], ...]:
+    ua = user_agents.parse(user_agent_string)
+    return (
+        ("browser", ua.browser.family),
+        ("browser_version", ua.browser.version_string),
+        ("os", ua.os.family),
+        ("os_version", ua.os.version_string),
+        ("device", ua.device.family),
+        ("is_mobile", ua.is_mobile),
+        ("is_tablet", ua.is_tablet),
+        ("is_pc", ua.is_pc),
+        ("is_bot", ua.is_bot)
+    )
+
+def parse_user_agent(user_agent_string: Optional[str]) -> Dict[str, Any]:
+    """Datos del user-agent; unos cientos de UAs distintos cubren casi todo el tráfico"""
+    if not user_agents or not user_agent_string:
+        return {}
+    return dict(_parse_user_agent(user_agent_string))
+
+class GeoIPLookup:
+    """
+    Un solo lector MaxMind mapeado en memoria, abierto al iniciar, con cache
+    LRU por IP (también de las IPs sin resultado).
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.reader = None
+        self.is_city = False
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def open(self, path: str):
+        self.reader = geoip2.database.Reader(path, mode=maxminddb.MODE_MMAP)
+        self.is_city = "City" in self.reader.metadata().database_type
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        self._cache = OrderedDict()
+
+    def _lookup(self, ip: str) -> Dict[str, Any]:
+        try:
+            if self.is_city:
+                response = self.reader.city(ip)
+                return {
+                    "country": response.country.name,
+                    "country_code": response.country.iso_code,
+                    "city": response.city.name
+                }
+            response = self.reader.country(ip)
+            return {"country": response.country.name, "country_code": response.country.iso_code}
+        except (geoip2.errors.AddressNotFoundError, ValueError):
+            return {}
+
+    def lookup(self, ip: Optional[str]) -> Dict[str, Any]:
+        if self.reader is None or not ip:
+            return {}
+        location = self._cache.get(ip)
+        if location is not None:
+            self.hits += 1
+            self._cache.move_to_end(ip)
+            return location
+        self.misses += 1
+        location = self._lookup(ip)
+        self._cache[ip] = location
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return location
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.reader is not None,
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+geoip = GeoIPLookup(settings.GEOIP_CACHE_SIZE)
+
+def enrich(tracking_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Agregar navegador, sistema, dispositivo y ubicación a un evento de tracking"""
+    tracking_data.update(parse_user_agent(tracking_data.get("user_agent")))
+    tracking_data.update(geoip.lookup(tracking_data.get("ip")))
+    return tracking_data
+
+def enrich_many(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [enrich(tracking_data) for tracking_data in events]
+
+async def enrich_in_background(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Enriquecer un lote en un thread para no ocupar el event loop"""
+    return await asyncio.to_thread(enrich_many, events)
+
+def enrichment_stats() -> Dict[str, Any]:
+    info = _parse_user_agent.cache_info()
+    return {
+        "user_agents": {"entries": info.currsize, "hits": info.hits, "misses": info.misses},
+        "geoip": geoip.stats()
+    }
+
+async def start_enrichment():
+    """Abrir la base GeoIP si está configurada"""
+    if not settings.GEOIP_DATABASE_PATH:
+        return
+    if geoip2 is None:
+        logger.warning("⚠️ geoip2 no está instalado: tracking sin ubicación")
+        return
+    try:
+        geoip.open(settings.GEOIP_DATABASE_PATH)
+        print(f"✅ Base GeoIP abierta: {settings.GEOIP_DATABASE_PATH}")
+    except Exception as e:
+        logger.error(f"❌ No se pudo abrir la base GeoIP: {str(e)}")
+
+async def close_enrichment():
+    geoip.close()
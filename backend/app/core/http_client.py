@@ -0,0 +1,80 @@
+import httpx
+from typing import Optional, Dict, Any
+from app.core.config import settings
+
+class ProviderHTTPClient:
+    client: Optional[httpx.AsyncClient] = None
+    http2: bool = False
+    requests_sent: int = 0
+    responses_received: int = 0
+
+provider_http = ProviderHTTPClient()
+
+async def _on_request(request: httpx.Request):
+    provider_http.requests_sent += 1
+
+async def _on_response(response: httpx.Response):
+    provider_http.responses_received += 1
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.PROVIDER_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.PROVIDER_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.PROVIDER_HTTP_KEEPALIVE_EXPIRY
+    )
+    try:
+        import h2  # noqa: F401
+        http2 = settings.PROVIDER_HTTP2
+    except ImportError:
+        http2 = False
+    provider_http.http2 = http2
+    return httpx.AsyncClient(
+        limits=limits,
+        http2=http2,
+        timeout=httpx.Timeout(settings.PROVIDER_HTTP_TIMEOUT),
+        event_hooks={"request": [_on_request], "response": [_on_response]}
+    )
+
+async def start_provider_client():
+    """Crear el cliente HTTP compartido para las APIs de proveedores"""
+    if provider_http.client is None or provider_http.client.is_closed:
+        provider_http.client = _build_client()
+        print("✅ Cliente HTTP de proveedores iniciado")
+
+async def close_provider_client():
+    """Cerrar el cliente HTTP compartido"""
+    if provider_http.client and not provider_http.client.is_closed:
+        await provider_http.client.aclose()
+        print("❌ Cliente HTTP de proveedores cerrado")
+    provider_http.client = None
+
+def get_provider_client() -> httpx.AsyncClient:
+    # Scripts y workers que no pasan por el startup de FastAPI lo crean al vuelo
+    if provider_http.client is None or provider_http.client.is_closed:
+        provider_http.client = _build_client()
+    return provider_http.client
+
+def get_provider_pool_stats() -> Dict[str, Any]:
+    """Estadísticas del pool de conexiones del cliente compartido"""
+    client = provider_http.client
+    stats = {
+        "active": client is not None and not client.is_closed,
+        "http2_enabled": provider_http.http2,
+        "max_connections": settings.PROVIDER_HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": settings.PROVIDER_HTTP_MAX_KEEPALIVE,
+        "keepalive_expiry": settings.PROVIDER_HTTP_KEEPALIVE_EXPIRY,
+        "requests_sent": provider_http.requests_sent,
+        "responses_received": provider_http.responses_received,
+        "connections": 0,
+        "idle_connections": 0,
+        "http2_connections": 0
+    }
+    # httpx no expone el pool públicamente; se lee del transporte de httpcore
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    for connection in getattr(pool, "connections", []) or []:
+        stats["connections"] += 1
+        if connection.is_idle():
+            stats["idle_connections"] += 1
+        if getattr(connection, "_connection", None).__class__.__name__ == "AsyncHTTP2Connection":
+            stats["http2_connections"] += 1
+    return stats
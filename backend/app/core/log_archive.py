@@ -0,0 +1,289 @@
+import os
+import json
+import gzip
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.core.config import settings
+from app.core.email_stats import naive_utc
+from app.models.email_log import EmailLog
+from app.models.email_open_event import EmailOpenEvent
+from app.models.email_click import EmailClick
+from app.models.email_link import EmailLink
+
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock de Postgres: un solo archivador a la vez
+ARCHIVE_LOCK_ID = 0x656D6C61
+
+# Filas borradas por sentencia cuando no hay particiones (SQLite)
+DELETE_CHUNK = 5000
+
+def month_start(moment: datetime) -> datetime:
+    """Primer instante del mes en UTC"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    moment = moment.astimezone(timezone.utc)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+def month_key(month: datetime) -> str:
+    return month.strftime("%Y-%m")
+
+def parse_month(key: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(key, "%Y-%m").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def partition_name(month: datetime) -> str:
+    return f"email_logs_{month.strftime('%Y_%m')}"
+
+def archive_paths(month: datetime, directory: Optional[str] = None) -> Tuple[str, str]:
+    """(datos .jsonl.gz, manifiesto .json) de un mes"""
+    base = os.path.join(directory or settings.LOG_ARCHIVE_DIR, partition_name(month))
+    return f"{base}.jsonl.gz", f"{base}.json"
+
+# ---------------------------------------------------------------------------
+# Particiones mensuales (Postgres)
+# ---------------------------------------------------------------------------
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    result = await conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('email_logs')"
+    ))
+    return result.first() is not None
+
+async def create_partition(conn: AsyncConnection, month: datetime):
+    await conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF email_logs "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+    ))
+
+async def ensure_partitions(conn: AsyncConnection, months_ahead: Optional[int] = None) -> int:
+    """
+    Crear por adelantado las particiones del mes actual y los siguientes,
+    para que los envíos nuevos no caigan en email_logs_default.
+    """
+    if not await is_partitioned(conn):
+        return 0
+    months_ahead = settings.LOG_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    month = month_start(datetime.now(timezone.utc))
+    for _ in range(months_ahead + 1):
+        await create_partition(conn, month)
+        month = next_month(month)
+    return months_ahead + 1
+
+async def list_partitions(conn: AsyncConnection) -> List[str]:
+    result = await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('email_logs') ORDER BY c.relname"
+    ))
+    return [name for (name,) in result.all()]
+
+# ---------------------------------------------------------------------------
+# Archivo en disco: JSONL comprimido, un archivo por mes
+# ---------------------------------------------------------------------------
+
+def _value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _open_item(event: Any) -> Dict[str, Any]:
+    # Misma forma que las aperturas de /emails/history/{email_id}
+    return {
+        "opened_at": _value(event.opened_at),
+        "ip": event.ip,
+        "user_agent": event.user_agent,
+        "referrer": event.referrer,
+        "language": event.language,
+        "classification": event.classification,
+        **(event.data or {})
+    }
+
+def _click_item(click: Any) -> Dict[str, Any]:
+    return {
+        "clicked_at": _value(click.clicked_at),
+        "url": click.url,
+        "ip": click.ip,
+        "user_agent": click.user_agent
+    }
+
+async def _events(conn: AsyncConnection, ids: List[int]) -> Tuple[Dict[int, list], Dict[int, list]]:
+    opens: Dict[int, list] = {}
+    clicks: Dict[int, list] = {}
+    result = await conn.execute(
+        select(EmailOpenEvent.__table__).where(EmailOpenEvent.email_log_id.in_(ids))
+        .order_by(EmailOpenEvent.opened_at.desc())
+    )
+    for event in result.all():
+        opens.setdefault(event.email_log_id, []).append(_open_item(event))
+    result = await conn.execute(
+        select(EmailClick.email_log_id, EmailClick.clicked_at, EmailClick.ip, EmailClick.user_agent, EmailLink.url)
+        .outerjoin(EmailLink, EmailLink.url_hash == EmailClick.url_hash)
+        .where(EmailClick.email_log_id.in_(ids))
+        .order_by(EmailClick.clicked_at.desc())
+    )
+    for click in result.all():
+        clicks.setdefault(click.email_log_id, []).append(_click_item(click))
+    return opens, clicks
+
+def _month_range(month: datetime):
+    return EmailLog.created_at >= month, EmailLog.created_at < next_month(month)
+
+async def export_month(conn: AsyncConnection, month: datetime, directory: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Escribir los logs del mes, con sus aperturas y clicks, en orden de
+    historial (created_at, id descendentes). Se lee con un cursor del
+    servidor por lotes y se escribe a un temporal que se renombra al
+    terminar: un archivo a medias nunca pasa por archivado.
+    """
+    data_path, manifest_path = archive_paths(month, directory)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    temporary = f"{data_path}.tmp"
+    manifest = {"month": month_key(month), "rows": 0, "min_id": None, "max_id": None, "users": {}}
+    query = (
+        select(EmailLog.__table__)
+        .where(*_month_range(month))
+        .order_by(EmailLog.created_at.desc(), EmailLog.id.desc())
+        .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+    )
+    output = gzip.open(temporary, "wt", encoding="utf-8")
+    try:
+        result = await conn.stream(query)
+        async for rows in result.partitions():
+            ids = [row.id for row in rows]
+            opens, clicks = await _events(conn, ids)
+            lines = []
+            for row in rows:
+                item = {key: _value(value) for key, value in row._mapping.items()}
+                item["opens"] = opens.get(row.id, [])
+                item["clicks"] = clicks.get(row.id, [])
+                lines.append(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+                user = str(row.sent_by)
+                manifest["users"][user] = manifest["users"].get(user, 0) + 1
+            await asyncio.to_thread(output.writelines, lines)
+            manifest["rows"] += len(rows)
+            manifest["min_id"] = min(ids) if manifest["min_id"] is None else min(manifest["min_id"], *ids)
+            manifest["max_id"] = max(ids) if manifest["max_id"] is None else max(manifest["max_id"], *ids)
+    finally:
+        await asyncio.to_thread(output.close)
+    if not manifest["rows"]:
+        # Mes vacío (partición sin filas): no deja archivo
+        os.remove(temporary)
+        return manifest
+    manifest["archived_at"] = datetime.now(timezone.utc).isoformat()
+    manifest["bytes"] = os.path.getsize(temporary)
+    os.replace(temporary, data_path)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return manifest
+
+async def drop_month(conn: AsyncConnection, month: datetime) -> str:
+    """
+    Quitar los logs del mes de la base. Con particiones es un DROP TABLE; sin
+    ellas, DELETE por lotes. Aperturas y clicks se borran antes (con
+    particiones no hay FK en cascada). email_stats_hourly no se toca: las
+    estadísticas siguen contando los meses archivados.
+    """
+    in_month = select(EmailLog.id).where(*_month_range(month))
+    await conn.execute(delete(EmailOpenEvent).where(EmailOpenEvent.email_log_id.in_(in_month)))
+    await conn.execute(delete(EmailClick).where(EmailClick.email_log_id.in_(in_month)))
+    name = partition_name(month)
+    if await is_partitioned(conn) and name in await list_partitions(conn):
+        await conn.execute(text(f"DROP TABLE {name}"))
+        return "drop"
+    while True:
+        result = await conn.execute(delete(EmailLog).where(EmailLog.id.in_(in_month.limit(DELETE_CHUNK))))
+        if result.rowcount < DELETE_CHUNK:
+            return "delete"
+
+async def expired_months(conn: AsyncConnection, retention_days: int) -> List[datetime]:
+    """Meses enteros anteriores al corte de retención que todavía tienen logs"""
+    cutoff = month_start(datetime.now(timezone.utc) - timedelta(days=retention_days))
+    oldest = (await conn.execute(select(func.min(EmailLog.created_at)))).scalar()
+    if oldest is None:
+        return []
+    if isinstance(oldest, str):  # SQLite sin tipos
+        oldest = datetime.fromisoformat(oldest)
+    months = []
+    month = month_start(oldest)
+    while month < cutoff:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+async def archive_month(conn: AsyncConnection, month: datetime, directory: Optional[str] = None) -> Dict[str, Any]:
+    """Exportar y quitar un mes, en la transacción de `conn`"""
+    manifest = await export_month(conn, month, directory)
+    manifest["removed_by"] = await drop_month(conn, month)
+    if not manifest["rows"]:
+        return manifest
+    logger.info(
+        f"🗄️ {manifest['rows']} logs de {manifest['month']} archivados "
+        f"({manifest['bytes']} bytes, {manifest['removed_by']})"
+    )
+    return manifest
+
+# ---------------------------------------------------------------------------
+# Lectura de meses archivados
+# ---------------------------------------------------------------------------
+
+def list_archives(directory: Optional[str] = None) -> List[Dict[str, Any]]:
+    directory = directory or settings.LOG_ARCHIVE_DIR
+    if not os.path.isdir(directory):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.startswith("email_logs_") and name.endswith(".json"):
+            try:
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    manifests.append(json.load(f))
+            except Exception as e:
+                logger.warning(f"⚠️ Manifiesto de archivo ilegible {name}: {str(e)}")
+    return manifests
+
+def iter_archive(month: datetime, directory: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    data_path, _ = archive_paths(month, directory)
+    with gzip.open(data_path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def read_archive_page(month: datetime, user_id: int, limit: int,
+                      cursor: Optional[Tuple[datetime, int]] = None,
+                      status: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Página de un mes archivado para un usuario. El archivo está en orden de
+    historial, así que se lee solo hasta completar la página. Bloqueante:
+    llamar con asyncio.to_thread.
+    """
+    if cursor is not None:
+        cursor = (naive_utc(cursor[0]), cursor[1])
+    page = []
+    for item in iter_archive(month):
+        if item.get("sent_by") != user_id or (status and item.get("status") != status):
+            continue
+        if cursor is not None and (naive_utc(datetime.fromisoformat(item["created_at"])), item["id"]) >= cursor:
+            continue
+        page.append(item)
+        if len(page) >= limit:
+            break
+    return page
+
+def find_archived(email_log_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """Buscar un log archivado por id, solo en los meses cuyo rango de ids lo contiene"""
+    for manifest in list_archives():
+        if manifest.get("min_id") is None or not manifest["min_id"] <= email_log_id <= manifest["max_id"]:
+            continue
+        if str(user_id) not in manifest.get("users", {}):
+            continue
+        for item in iter_archive(parse_month(manifest["month"])):
+            if item["id"] == email_log_id:
+                return item if item.get("sent_by") == user_id else None
+    return None
@@ -0,0 +1,101 @@
+import re
+import html
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from app.core.config import settings
+
+# {{campo}} con espacios opcionales: {{ first_name }}
+MERGE_FIELD = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+BODY_CLOSE = "</body>"
+# Marcador del id del log en el HTML compartido (enlaces de click, pixel de
+# SendGrid); se reemplaza por destinatario o vía substitutions
+EMAIL_LOG_ID_TAG = "-email_log_id-"
+
+def pixel_slot_index(html_body: str) -> int:
+    """Posición del pixel de tracking: antes del primer </body> o al final"""
+    slot = html_body.find(BODY_CLOSE)
+    return len(html_body) if slot == -1 else slot
+
+def format_value(value: Any) -> str:
+    return "" if value is None else str(value)
+
+class CompiledTemplate:
+    """
+    Plantilla parseada una vez en tramos literales y campos. En HTML los
+    valores se escapan y el pixel de tracking tiene su propio slot.
+    """
+
+    def __init__(self, source: str, is_html: bool = False):
+        self.source = source
+        self.is_html = is_html
+        # Partes: str literal, o (nombre,) para un campo; None es el slot del pixel
+        parts: List[Any] = []
+        slot = pixel_slot_index(source) if is_html else None
+        position = 0
+        for match in MERGE_FIELD.finditer(source):
+            if slot is not None and slot < match.start():
+                parts.extend((source[position:slot], None))
+                position, slot = slot, None
+            parts.append(source[position:match.start()])
+            parts.append((match.group(1),))
+            position = match.end()
+        if slot is not None:
+            parts.extend((source[position:slot], None))
+            position = slot
+        parts.append(source[position:])
+        self._parts = [part for part in parts if part != ""]
+        self.fields = sorted({part[0] for part in self._parts if isinstance(part, tuple)})
+
+    def _render(self, value_for: Callable[[str], str], pixel_html: str) -> str:
+        out = []
+        for part in self._parts:
+            if part is None:
+                out.append(pixel_html)
+            elif isinstance(part, tuple):
+                out.append(value_for(part[0]))
+            else:
+                out.append(part)
+        return "".join(out)
+
+    def render(self, fields: Optional[Dict[str, Any]] = None, pixel_html: str = "") -> str:
+        """Renderizar para un destinatario; los campos que falten quedan vacíos"""
+        fields = fields or {}
+        if self.is_html:
+            return self._render(lambda name: html.escape(format_value(fields.get(name))), pixel_html)
+        return self._render(lambda name: format_value(fields.get(name)), pixel_html)
+
+    def render_many(self, rows: List[Dict[str, Any]],
+                    pixels: Optional[List[str]] = None) -> List[str]:
+        """Renderizar la misma plantilla para una lista de destinatarios"""
+        pixels = pixels or [""] * len(rows)
+        return [self.render(fields, pixel_html) for fields, pixel_html in zip(rows, pixels)]
+
+    def render_tags(self, tag_for: Callable[[str], str], pixel_html: str = "") -> str:
+        """Fuente con cada campo cambiado por un tag (substitutions de SendGrid)"""
+        return self._render(tag_for, pixel_html)
+
+class TemplateCache:
+    """LRU de plantillas compiladas, por hash del contenido"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, source: str, is_html: bool = False) -> CompiledTemplate:
+        key = f"{'html' if is_html else 'text'}:{hashlib.sha256(source.encode('utf-8')).hexdigest()}"
+        compiled = self._entries.get(key)
+        if compiled is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return compiled
+        self.misses += 1
+        compiled = CompiledTemplate(source, is_html)
+        self._entries[key] = compiled
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return compiled
+
+compiled_templates = TemplateCache(settings.TEMPLATE_CACHE_SIZE)
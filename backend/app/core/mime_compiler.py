@@ -0,0 +1,190 @@
+import os
+import asyncio
+import base64
+import hashlib
+import uuid
+from collections import OrderedDict
+from email import policy
+from email.generator import BytesGenerator
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.attachment_cache import EncodedPart, attachment_cache
+from app.core.merge_templates import EMAIL_LOG_ID_TAG, pixel_slot_index
+from app.core.click_tracking import sign_click_links
+
+CRLF = b"\r\n"
+# 57 bytes de entrada = una línea base64 de 76 caracteres
+BASE64_LINE_BYTES = 57
+
+def encode_base64_lines(data: bytes) -> bytes:
+    return base64.encodebytes(data).replace(b"\n", CRLF)
+
+def attachment_part(file_path: str, token: str) -> MIMEBase:
+    """Parte del adjunto con un marcador donde va el cuerpo base64 cacheado"""
+    part = MIMEBase('application', 'octet-stream', policy=policy.SMTP)
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.set_payload(token)
+    part.add_header(
+        'Content-Disposition',
+        f'attachment; filename={os.path.basename(file_path)}'
+    )
+    return part
+
+class CompiledMessage:
+    """
+    Mensaje de campaña serializado una sola vez. Por destinatario solo se
+    parchean el header To y la parte HTML (que lleva el pixel de tracking).
+    """
+
+    def __init__(self, from_header: str, reply_to: str, subject: str, body: str,
+                 html_body: Optional[str] = None, cc: Optional[List[str]] = None,
+                 attachments: Optional[List[str]] = None):
+        marker = uuid.uuid4().hex
+        to_token = f"to-{marker}"
+        html_token = f"html-{marker}"
+
+        alternative = MIMEMultipart('alternative', policy=policy.SMTP)
+        alternative.attach(MIMEText(body, 'plain', 'utf-8', policy=policy.SMTP))
+        if html_body is not None:
+            html_part = MIMEBase('text', 'html', charset='utf-8', policy=policy.SMTP)
+            html_part['Content-Transfer-Encoding'] = 'base64'
+            html_part.set_payload(html_token)
+            alternative.attach(html_part)
+        # Los cuerpos base64 salen del cache por hash de contenido, mapeados
+        # en memoria: el adjunto no se vuelve a leer ni a codificar
+        paths = [path for path in (attachments or []) if os.path.exists(path)]
+        encoded_attachments = [attachment_cache.get(path) for path in paths]
+        attachment_tokens = [f"att{i}-{marker}" for i in range(len(paths))]
+        parts = [attachment_part(path, token) for path, token in zip(paths, attachment_tokens)]
+        if parts:
+            msg = MIMEMultipart('mixed', policy=policy.SMTP)
+            msg.attach(alternative)
+            for part in parts:
+                msg.attach(part)
+        else:
+            msg = alternative
+        msg['From'] = from_header
+        msg['To'] = to_token
+        msg['Subject'] = subject
+        msg['Reply-To'] = reply_to
+        if cc:
+            msg['Cc'] = ', '.join(cc)
+
+        buffer = BytesIO()
+        BytesGenerator(buffer, policy=policy.SMTP).flatten(msg)
+        raw = buffer.getvalue()
+        head, rest = raw.split(to_token.encode("ascii"), 1)
+        if html_body is not None:
+            middle, rest = rest.split(html_token.encode("ascii"), 1)
+        else:
+            middle, rest = rest, b""
+        tail: List[EncodedPart] = []
+        for token, encoded in zip(attachment_tokens, encoded_attachments):
+            before, rest = rest.split(token.encode("ascii"), 1)
+            tail.extend((before, encoded))
+        tail.append(rest)
+        self._segments: Tuple[bytes, bytes] = (head, middle)
+        self._tail = tail
+        self.has_html = html_body is not None
+        self.size = len(raw) + sum(len(encoded) for encoded in encoded_attachments)
+
+        # HTML partido donde empieza lo que cambia por destinatario (el slot
+        # del pixel o el primer enlace con el id del log); el tramo anterior,
+        # alineado a líneas base64, se codifica una sola vez
+        self._html_prefix_encoded = b""
+        self._html_prefix_rest = b""
+        self._html_variable = ""
+        self._pixel_offset = 0
+        if html_body is not None:
+            slot = pixel_slot_index(html_body)
+            tag = html_body.find(EMAIL_LOG_ID_TAG)
+            start = slot if tag == -1 else min(slot, tag)
+            before = html_body[:start].encode("utf-8")
+            aligned = len(before) - len(before) % BASE64_LINE_BYTES
+            self._html_prefix_encoded = encode_base64_lines(before[:aligned])
+            self._html_prefix_rest = before[aligned:]
+            self._html_variable = html_body[start:]
+            self._pixel_offset = slot - start
+
+    def render(self, to_email: str, pixel_html: str = "",
+               email_log_id: Optional[int] = None) -> bytes:
+        """Bytes listos para DATA con el To, el pixel y los enlaces del destinatario"""
+        head, middle = self._segments
+        if not self.has_html:
+            return b"".join((head, to_email.encode("utf-8"), middle, *self._tail))
+        offset = self._pixel_offset
+        variable = self._html_variable[:offset] + pixel_html + self._html_variable[offset:]
+        if email_log_id is not None:
+            variable = sign_click_links(variable, email_log_id)
+        html_rest = encode_base64_lines(self._html_prefix_rest + variable.encode("utf-8"))
+        return b"".join((
+            head, to_email.encode("utf-8"), middle,
+            self._html_prefix_encoded, html_rest, *self._tail
+        ))
+
+class CompiledMessageCache:
+    """
+    LRU de mensajes compilados, por hash del contenido compartido. Compilar
+    lee, hashea y codifica los adjuntos: se hace en un hilo, una sola vez por
+    mensaje aunque lo pidan varios envíos a la vez.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CompiledMessage]" = OrderedDict()
+        self._compiling: Dict[str, "asyncio.Future[CompiledMessage]"] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(from_header: str, reply_to: str, subject: str, body: str,
+             html_body: Optional[str], cc: Optional[List[str]],
+             attachments: Optional[List[str]]) -> str:
+        digest = hashlib.sha256()
+        for value in (from_header, reply_to, subject, body, html_body or "", ",".join(cc or [])):
+            digest.update(value.encode("utf-8"))
+            digest.update(b"\0")
+        for path in attachments or []:
+            # Un adjunto modificado en disco invalida el mensaje compilado
+            try:
+                stat = os.stat(path)
+                digest.update(f"{path}|{stat.st_mtime_ns}|{stat.st_size}".encode("utf-8"))
+            except OSError:
+                digest.update(f"{path}|missing".encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    async def _compile(self, key: str, *args) -> CompiledMessage:
+        try:
+            compiled = await asyncio.to_thread(CompiledMessage, *args)
+        finally:
+            self._compiling.pop(key, None)
+        self._entries[key] = compiled
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return compiled
+
+    async def get(self, from_header: str, reply_to: str, subject: str, body: str,
+                  html_body: Optional[str] = None, cc: Optional[List[str]] = None,
+                  attachments: Optional[List[str]] = None) -> CompiledMessage:
+        key = self._key(from_header, reply_to, subject, body, html_body, cc, attachments)
+        compiled = self._entries.get(key)
+        if compiled is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return compiled
+        pending = self._compiling.get(key)
+        if pending is None:
+            self.misses += 1
+            pending = asyncio.ensure_future(self._compile(
+                key, from_header, reply_to, subject, body, html_body, cc, attachments
+            ))
+            self._compiling[key] = pending
+        # shield: si se cancela un envío, los demás que esperan el mismo mensaje siguen
+        return await asyncio.shield(pending)
+
+compiled_messages = CompiledMessageCache(settings.MIME_COMPILED_CACHE_SIZE)
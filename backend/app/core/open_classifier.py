@@ -0,0 +1,136 @@
+import os
+import re
+import socket
+import logging
+import ipaddress
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+OPEN_HUMAN = "human"
+OPEN_PROXY = "proxy"
+OPEN_BOT = "bot"
+
+# Firmas de user-agent: proxies de imágenes de los webmails y escáneres
+UA_SIGNATURES: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"GoogleImageProxy|ggpht\.com|YahooMailProxy|Outlook-Proxy", re.IGNORECASE), OPEN_PROXY),
+    # Apple Mail Privacy Protection precarga con un UA desnudo
+    (re.compile(r"^Mozilla/5\.0$"), OPEN_PROXY),
+    (re.compile(
+        r"bot\b|crawler|spider|scanner|preview|barracuda|mimecast|proofpoint|"
+        r"symantec|forcepoint|python-requests|curl/|wget/|go-http-client|headless",
+        re.IGNORECASE
+    ), OPEN_BOT),
+]
+
+@lru_cache(maxsize=settings.TRACKING_UA_CACHE_SIZE)
+def user_agent_label(user_agent: str) -> Optional[str]:
+    for pattern, label in UA_SIGNATURES:
+        if pattern.search(user_agent):
+            return label
+    return None
+
+class IPPrefixIndex:
+    """
+    Índice de prefijos CIDR compilado: una tabla hash por longitud de prefijo,
+    consultadas de la más específica a la menos. Una búsqueda son a lo sumo
+    tantos lookups de diccionario como longitudes distintas haya cargadas.
+    """
+
+    def __init__(self):
+        # versión IP -> [(longitud, máscara, {red: etiqueta})], de mayor a menor longitud
+        self._tables: Dict[int, List[Tuple[int, int, Dict[int, str]]]] = {4: [], 6: []}
+        self.networks = 0
+
+    def build(self, networks: List[Tuple[str, str]]):
+        by_length: Dict[Tuple[int, int], Dict[int, str]] = {}
+        count = 0
+        for cidr, label in networks:
+            try:
+                network = ipaddress.ip_network(cidr, strict=False)
+            except ValueError:
+                logger.warning(f"⚠️ Rango IP inválido ignorado: {cidr}")
+                continue
+            table = by_length.setdefault((network.version, network.prefixlen), {})
+            table[int(network.network_address)] = label
+            count += 1
+        tables: Dict[int, List[Tuple[int, int, Dict[int, str]]]] = {4: [], 6: []}
+        for (version, length), table in sorted(by_length.items(), key=lambda item: -item[0][1]):
+            bits = 32 if version == 4 else 128
+            mask = ((1 << length) - 1) << (bits - length)
+            tables[version].append((length, mask, table))
+        self._tables = tables
+        self.networks = count
+
+    def lookup(self, ip: Optional[str]) -> Optional[str]:
+        if not ip:
+            return None
+        # inet_pton es bastante más rápido que ipaddress.ip_address
+        try:
+            value, version = int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big"), 4
+        except OSError:
+            try:
+                value, version = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big"), 6
+            except OSError:
+                return None
+        for _, mask, table in self._tables[version]:
+            label = table.get(value & mask)
+            if label is not None:
+                return label
+        return None
+
+def load_cidr_files(directory: str) -> List[Tuple[str, str]]:
+    """
+    Leer listas CIDR: un rango por línea, # para comentarios. La etiqueta
+    sale del nombre del archivo: proxy*.txt o bot*.txt.
+    """
+    networks = []
+    if not os.path.isdir(directory):
+        return networks
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".txt"):
+            continue
+        label = OPEN_PROXY if name.startswith("proxy") else OPEN_BOT if name.startswith("bot") else None
+        if label is None:
+            continue
+        with open(os.path.join(directory, name)) as ranges:
+            for line in ranges:
+                cidr = line.split("#", 1)[0].strip()
+                if cidr:
+                    networks.append((cidr, label))
+    return networks
+
+class OpenClassifier:
+    def __init__(self):
+        self.index = IPPrefixIndex()
+        self.counts = {OPEN_HUMAN: 0, OPEN_PROXY: 0, OPEN_BOT: 0}
+
+    def load(self, directory: str):
+        self.index.build(load_cidr_files(directory))
+        logger.info(f"🛡️ {self.index.networks} rangos IP cargados desde {directory}")
+
+    def classify(self, ip: Optional[str], user_agent: Optional[str],
+                 is_bot: bool = False) -> str:
+        """Etiquetar una apertura como human, proxy o bot"""
+        label = OPEN_BOT if is_bot else user_agent_label(user_agent) if user_agent else None
+        if label is None:
+            label = self.index.lookup(ip) or OPEN_HUMAN
+        self.counts[label] += 1
+        return label
+
+    def classify_event(self, tracking_data: Dict[str, Any]) -> str:
+        """Clasificar un evento ya enriquecido (usa is_bot del user-agent si está)"""
+        return self.classify(
+            tracking_data.get("ip"), tracking_data.get("user_agent"), bool(tracking_data.get("is_bot"))
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {"networks": self.index.networks, **self.counts}
+
+open_classifier = OpenClassifier()
+
+async def start_open_classifier():
+    open_classifier.load(settings.OPEN_CLASSIFIER_CIDR_DIR)
+    print(f"✅ Clasificador de aperturas: {open_classifier.index.networks} rangos IP cargados")
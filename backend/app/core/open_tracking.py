@@ -0,0 +1,129 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+from sqlalchemy import JSON, bindparam, case, func, insert, select, update
+from app.core.config import settings
+from app.core.enrichment import enrich_in_background
+from app.core.open_classifier import open_classifier
+from app.core.email_stats import STAT_OPENED, StatsDelta, add_stat, apply_stats, open_stat
+from app.core.response_cache import response_cache
+from app.core.write_behind import WriteBehindBuffer
+from app.db.base import AsyncSessionLocal
+from app.models.email_log import EmailLog
+from app.models.email_open_event import EmailOpenEvent
+
+logger = logging.getLogger(__name__)
+
+def open_event_row(email_log_id: int, opened_at: datetime, tracking_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila de email_open_events a partir de los datos del pixel"""
+    data = {
+        key: value for key, value in tracking_data.items()
+        if key not in ("ip", "user_agent", "referrer", "language", "classification", "opened_at", "timestamp")
+    }
+    return {
+        "email_log_id": email_log_id,
+        "opened_at": opened_at,
+        "ip": tracking_data.get("ip"),
+        "user_agent": tracking_data.get("user_agent"),
+        "referrer": tracking_data.get("referrer"),
+        "language": tracking_data.get("language"),
+        "classification": tracking_data.get("classification"),
+        "data": data or None
+    }
+
+class OpenRecorder(WriteBehindBuffer):
+    """
+    Aperturas del pixel en memoria. Cada flush inserta los eventos en
+    email_open_events y aplica los contadores de cada email con un solo
+    UPDATE por lotes sobre email_logs.
+    """
+
+    name = "aperturas"
+
+    def record(self, email_log_id: int, tracking_data: Dict[str, Any]):
+        self.add({
+            "email_log_id": email_log_id,
+            "opened_at": datetime.utcnow(),
+            "tracking_data": tracking_data
+        })
+
+    async def flush(self, events: List[Dict[str, Any]]) -> int:
+        if settings.TRACKING_ENRICH_IN_BACKGROUND:
+            # El pixel ya respondió: user-agent y GeoIP se resuelven aquí
+            await enrich_in_background([event["tracking_data"] for event in events])
+        for event in events:
+            # Proxies de imágenes y escáneres también abren: se etiquetan aquí
+            event["tracking_data"]["classification"] = open_classifier.classify_event(event["tracking_data"])
+        summary: Dict[int, Dict[str, Any]] = {}
+        for event in events:
+            email_summary = summary.get(event["email_log_id"])
+            if email_summary is None:
+                summary[event["email_log_id"]] = {
+                    "b_id": event["email_log_id"],
+                    "b_count": 1,
+                    "b_first": event["opened_at"],
+                    "b_last": event["opened_at"],
+                    "b_data": event["tracking_data"]
+                }
+            else:
+                email_summary["b_count"] += 1
+                email_summary["b_last"] = max(email_summary["b_last"], event["opened_at"])
+        table = EmailLog.__table__
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(EmailLog.id, EmailLog.sent_by, EmailLog.mailbox_id, EmailLog.opened_at)
+                .where(EmailLog.id.in_(list(summary)))
+            )
+            owners = {row.id: row for row in result.all()}
+            known = set(owners)
+            rows = [
+                open_event_row(event["email_log_id"], event["opened_at"], event["tracking_data"])
+                for event in events if event["email_log_id"] in known
+            ]
+            if rows:
+                # Eventos append-only y contadores en un solo UPDATE por lotes;
+                # tracking_data guarda solo la primera apertura
+                await db.execute(insert(EmailOpenEvent), rows)
+                await db.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("b_id"))
+                    .values(
+                        open_count=func.coalesce(table.c.open_count, 0) + bindparam("b_count"),
+                        opened_at=func.coalesce(table.c.opened_at, bindparam("b_first")),
+                        last_opened_at=bindparam("b_last"),
+                        tracking_data=case(
+                            (table.c.opened_at.is_(None), bindparam("b_data", type_=JSON)),
+                            else_=table.c.tracking_data
+                        )
+                    ),
+                    [summary[email_log_id] for email_log_id in known]
+                )
+                # Rollup: primera apertura de cada email y eventos por origen
+                deltas = StatsDelta()
+                for email_log_id, owner in owners.items():
+                    if owner.opened_at is None:
+                        add_stat(deltas, owner.sent_by, owner.mailbox_id, STAT_OPENED, summary[email_log_id]["b_first"])
+                for row in rows:
+                    owner = owners[row["email_log_id"]]
+                    add_stat(deltas, owner.sent_by, owner.mailbox_id, open_stat(row["classification"]), row["opened_at"])
+                await apply_stats(db, deltas)
+                await db.commit()
+                response_cache.invalidate_emails(owner.sent_by for owner in owners.values())
+        missing = len(summary) - len(known)
+        if missing:
+            logger.warning(f"❌ {missing} email logs no encontrados al guardar aperturas")
+        logger.info(f"👁️ {len(rows)} aperturas guardadas en {len(known)} emails")
+        return len(rows)
+
+open_recorder = OpenRecorder(
+    settings.OPEN_EVENTS_MAX_PENDING, settings.OPEN_FLUSH_INTERVAL, settings.OPEN_FLUSH_BATCH
+)
+
+async def start_open_recorder():
+    open_recorder.start()
+    print("✅ Registro de aperturas iniciado")
+
+async def stop_open_recorder():
+    """Detener el flusher y guardar las aperturas que queden en memoria"""
+    await open_recorder.stop()
+    print("❌ Registro de aperturas detenido")
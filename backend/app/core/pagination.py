@@ -0,0 +1,61 @@
+import json
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from sqlalchemy import Select, select, tuple_
+from app.models.email_log import EmailLog
+
+def _pack(values: List[Any]) -> str:
+    raw = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _unpack(cursor: str) -> List[Any]:
+    return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+
+def encode_cursor(created_at: datetime, email_log_id: int) -> str:
+    """Cursor opaco con la posición (created_at, id) de la última fila de la página"""
+    return _pack([created_at.isoformat(), email_log_id])
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    try:
+        created_at, email_log_id = _unpack(cursor)
+        return datetime.fromisoformat(created_at), int(email_log_id)
+    except Exception:
+        return None
+
+def encode_search_cursor(rank: float, created_at: datetime, email_log_id: int) -> str:
+    """Cursor de búsqueda: la relevancia va primero en el orden"""
+    return _pack([float(rank), created_at.isoformat(), email_log_id])
+
+def decode_search_cursor(cursor: str) -> Optional[Tuple[float, datetime, int]]:
+    try:
+        rank, created_at, email_log_id = _unpack(cursor)
+        return float(rank), datetime.fromisoformat(created_at), int(email_log_id)
+    except Exception:
+        return None
+
+def next_cursor(rows: Sequence[Any], limit: int) -> Optional[str]:
+    """Cursor de la página siguiente; None si esta fue la última"""
+    if not rows or len(rows) < limit:
+        return None
+    return encode_cursor(rows[-1].created_at, rows[-1].id)
+
+def history_query(user_id: int, limit: Optional[int], status: Optional[str] = None,
+                  cursor: Optional[Tuple[datetime, int]] = None, offset: int = 0,
+                  columns: Sequence[Any] = (EmailLog,)) -> Select:
+    """
+    Página del historial de un usuario, del más reciente al más antiguo.
+    Con cursor es keyset: la condición (created_at, id) < cursor arranca en
+    el índice ix_email_logs_user_created (o el de estado), así que el costo
+    no crece con la profundidad. Sin cursor se mantiene OFFSET/LIMIT; sin
+    limit (exportación) se recorre todo desde la posición dada.
+    """
+    query = select(*columns).where(EmailLog.sent_by == user_id)
+    if status:
+        query = query.where(EmailLog.status == status)
+    if cursor is not None:
+        query = query.where(tuple_(EmailLog.created_at, EmailLog.id) < cursor)
+    elif offset:
+        query = query.offset(offset)
+    query = query.order_by(EmailLog.created_at.desc(), EmailLog.id.desc())
+    return query if limit is None else query.limit(limit)
@@ -0,0 +1,185 @@
+import math
+import time
+import logging
+from typing import Optional, List, Dict, Tuple
+from fastapi import HTTPException
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class Quota:
+    """Límite de `limit` envíos por ventana deslizante de `window` segundos"""
+
+    def __init__(self, key: str, limit: int, window: float, scope: str):
+        self.key = key
+        self.limit = limit
+        self.window = window
+        self.scope = scope
+
+def sliding_window_count(prev: float, curr: float, elapsed: float, window: float) -> float:
+    # Contador de ventana deslizante aproximado: la ventana anterior pesa
+    # lo que todavía se solapa con la ventana deslizante actual
+    return prev * max(0.0, 1 - elapsed / window) + curr
+
+def seconds_until_allowed(prev: float, curr: float, elapsed: float, window: float,
+                          limit: int, cost: int) -> float:
+    """Tiempo hasta que `cost` envíos caben en la ventana"""
+    if cost > limit:
+        return window
+    room = limit - curr - cost
+    if room >= 0 and prev > 0:
+        # Basta con que decaiga el peso de la ventana anterior
+        return max(0.0, window * (1 - room / prev) - elapsed)
+    # Hay que esperar al cambio de ventana, donde curr pasa a ser prev
+    wait = window - elapsed
+    if curr > 0 and limit - cost < curr:
+        wait += window * (1 - (limit - cost) / curr)
+    return max(0.0, wait)
+
+class MemoryRateLimitBackend:
+    """Contadores en memoria del proceso: O(1) por chequeo, sin base de datos"""
+
+    def __init__(self):
+        # key -> [inicio de la ventana actual, conteo anterior, conteo actual]
+        self._windows: Dict[str, List[float]] = {}
+
+    def _roll(self, quota: Quota, now: float) -> List[float]:
+        state = self._windows.get(quota.key)
+        start = math.floor(now / quota.window) * quota.window
+        if state is None:
+            state = [start, 0.0, 0.0]
+            self._windows[quota.key] = state
+        elif state[0] != start:
+            # Si pasó más de una ventana completa la anterior ya no cuenta
+            state[1] = state[2] if start - state[0] == quota.window else 0.0
+            state[2] = 0.0
+            state[0] = start
+        return state
+
+    async def hit(self, quotas: List[Quota], cost: int) -> Optional[Tuple[Quota, float]]:
+        now = time.time()
+        states = []
+        for quota in quotas:
+            state = self._roll(quota, now)
+            elapsed = now - state[0]
+            if sliding_window_count(state[1], state[2], elapsed, quota.window) + cost > quota.limit:
+                return quota, seconds_until_allowed(state[1], state[2], elapsed, quota.window, quota.limit, cost)
+            states.append(state)
+        # Todos los límites pasan: se consume en todos a la vez
+        for state in states:
+            state[2] += cost
+        return None
+
+    async def close(self):
+        self._windows = {}
+
+# Chequea todas las claves y solo consume si todas pasan (atómico en Redis)
+REDIS_SLIDING_WINDOW = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local n = #KEYS
+for i = 1, n do
+    local limit = tonumber(ARGV[2 + (i - 1) * 2 + 1])
+    local window = tonumber(ARGV[2 + (i - 1) * 2 + 2])
+    local start = math.floor(now / window) * window
+    local state = redis.call('HMGET', KEYS[i], 'start', 'prev', 'curr')
+    local s = tonumber(state[1]) or start
+    local prev = tonumber(state[2]) or 0
+    local curr = tonumber(state[3]) or 0
+    if s ~= start then
+        if start - s == window then prev = curr else prev = 0 end
+        curr = 0
+    end
+    local elapsed = now - start
+    local weight = 1 - elapsed / window
+    if weight < 0 then weight = 0 end
+    if prev * weight + curr + cost > limit then
+        return {i, tostring(prev), tostring(curr), tostring(elapsed)}
+    end
+end
+for i = 1, n do
+    local window = tonumber(ARGV[2 + (i - 1) * 2 + 2])
+    local start = math.floor(now / window) * window
+    local state = redis.call('HMGET', KEYS[i], 'start', 'prev', 'curr')
+    local s = tonumber(state[1]) or start
+    local prev = tonumber(state[2]) or 0
+    local curr = tonumber(state[3]) or 0
+    if s ~= start then
+        if start - s == window then prev = curr else prev = 0 end
+        curr = 0
+    end
+    redis.call('HSET', KEYS[i], 'start', start, 'prev', prev, 'curr', curr + cost)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(window * 2000))
+end
+return {0}
+"""
+
+class RedisRateLimitBackend:
+    """Contadores compartidos en Redis para despliegues con varios procesos"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis_asyncio
+        self._client = redis_asyncio.from_url(url)
+        self._script = self._client.register_script(REDIS_SLIDING_WINDOW)
+
+    async def hit(self, quotas: List[Quota], cost: int) -> Optional[Tuple[Quota, float]]:
+        args: List[float] = [time.time(), cost]
+        for quota in quotas:
+            args.extend([quota.limit, quota.window])
+        result = await self._script(
+            keys=[f"{settings.RATE_LIMIT_REDIS_PREFIX}{quota.key}" for quota in quotas],
+            args=args
+        )
+        index = int(result[0])
+        if index == 0:
+            return None
+        quota = quotas[index - 1]
+        prev, curr, elapsed = (float(v) for v in result[1:4])
+        return quota, seconds_until_allowed(prev, curr, elapsed, quota.window, quota.limit, cost)
+
+    async def close(self):
+        await self._client.aclose()
+
+class RateLimiter:
+    backend = None
+
+    async def check(self, quotas: List[Quota], cost: int = 1):
+        """Consumir `cost` envíos en todas las cuotas o lanzar 429 con Retry-After"""
+        quotas = [quota for quota in quotas if quota.limit > 0]
+        if not quotas or self.backend is None:
+            return
+        try:
+            exceeded = await self.backend.hit(quotas, cost)
+        except Exception as e:
+            # Si Redis no responde no se bloquean los envíos
+            logger.error(f"💥 Error en rate limiter: {str(e)}")
+            return
+        if exceeded:
+            quota, retry_after = exceeded
+            raise HTTPException(
+                status_code=429,
+                detail=f"Límite de {quota.limit} emails por {format_window(quota.window)} excedido ({quota.scope})",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+
+rate_limiter = RateLimiter()
+
+def format_window(window: float) -> str:
+    if window >= 86400:
+        return "día"
+    if window >= 3600:
+        return "hora"
+    return f"{int(window)} segundos"
+
+async def start_rate_limiter():
+    """Crear el backend del rate limiter según la configuración"""
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        rate_limiter.backend = RedisRateLimitBackend(settings.RATE_LIMIT_REDIS_URL)
+    else:
+        rate_limiter.backend = MemoryRateLimitBackend()
+    print(f"✅ Rate limiter iniciado ({settings.RATE_LIMIT_BACKEND})")
+
+async def close_rate_limiter():
+    if rate_limiter.backend is not None:
+        await rate_limiter.backend.close()
+        rate_limiter.backend = None
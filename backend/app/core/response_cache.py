@@ -0,0 +1,113 @@
+import json
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set, Tuple
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Vistas del dashboard cacheadas; las de email son por usuario
+CACHE_STATS = "stats"
+CACHE_HISTORY = "history"
+CACHE_MAILBOXES = "mailboxes"
+CACHE_DOMAINS = "domains"
+
+CacheKey = Tuple[str, Optional[int], Hashable]
+
+def serialize(content: Any) -> bytes:
+    """El mismo JSON que produce JSONResponse"""
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+        indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+class ResponseCache:
+    """
+    Respuestas JSON ya serializadas, por vista, usuario y parámetros, con TTL
+    y un tope de memoria (LRU por bytes). Las escrituras invalidan la vista
+    del usuario afectado; el TTL acota lo que cambie en otros procesos.
+    """
+
+    def __init__(self, max_bytes: int, enabled: bool = True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries: "OrderedDict[CacheKey, Tuple[float, bytes, Dict[str, str]]]" = OrderedDict()
+        self._scopes: Dict[Tuple[str, Optional[int]], Set[CacheKey]] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _remove(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[1])
+        scope = self._scopes.get(key[:2])
+        if scope is not None:
+            scope.discard(key)
+            if not scope:
+                del self._scopes[key[:2]]
+
+    def get(self, view: str, user_id: Optional[int], params: Hashable = None) -> Optional[Response]:
+        if not self.enabled:
+            return None
+        key = (view, user_id, params)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return Response(content=entry[1], media_type="application/json", headers={**entry[2], "X-Cache": "HIT"})
+
+    def store(self, view: str, user_id: Optional[int], params: Hashable, content: Any,
+              ttl: float, headers: Optional[Dict[str, str]] = None) -> Response:
+        """Serializar una vez, guardar y devolver la respuesta"""
+        body = serialize(content)
+        headers = headers or {}
+        if self.enabled and len(body) <= self.max_bytes:
+            key = (view, user_id, params)
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, body, headers)
+            self._scopes.setdefault(key[:2], set()).add(key)
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return Response(content=body, media_type="application/json", headers={**headers, "X-Cache": "MISS"})
+
+    def invalidate(self, view: str, user_id: Optional[int] = None):
+        """Borrar las entradas de una vista para un usuario (None: vista global)"""
+        keys = self._scopes.get((view, user_id))
+        if not keys:
+            return
+        for key in list(keys):
+            self._remove(key)
+        self.invalidations += 1
+
+    def invalidate_emails(self, user_ids: Iterable[Optional[int]]):
+        """Historial y estadísticas de los usuarios cuyos emails cambiaron"""
+        for user_id in set(user_ids):
+            if user_id is not None:
+                self.invalidate(CACHE_HISTORY, user_id)
+                self.invalidate(CACHE_STATS, user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_MAX_BYTES, settings.RESPONSE_CACHE_ENABLED)
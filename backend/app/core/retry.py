@@ -0,0 +1,82 @@
+import time
+import heapq
+import random
+import smtplib
+import aiosmtplib
+from datetime import datetime
+from typing import List, Optional, Set, Tuple
+from app.core.config import settings
+
+# Rechazos definitivos: reintentar no cambia el resultado
+PERMANENT_SMTP_ERRORS = (
+    aiosmtplib.SMTPAuthenticationError,
+    aiosmtplib.SMTPRecipientsRefused,
+    aiosmtplib.SMTPRecipientRefused,
+    aiosmtplib.SMTPSenderRefused,
+    smtplib.SMTPAuthenticationError,
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused
+)
+
+# Códigos HTTP 4xx que sí son transitorios
+RETRYABLE_HTTP_STATUS = {408, 409, 425, 429}
+
+def is_retryable_status(status_code: int) -> bool:
+    """Los 5xx y los 4xx de saturación se reintentan; el resto de 4xx es definitivo"""
+    return status_code >= 500 or status_code in RETRYABLE_HTTP_STATUS
+
+def is_retryable_exception(error: BaseException) -> bool:
+    if isinstance(error, PERMANENT_SMTP_ERRORS):
+        return False
+    code = getattr(error, "code", None) or getattr(error, "smtp_code", None)
+    if isinstance(code, int) and 500 <= code < 600:
+        # Respuesta SMTP 5xx: rechazo permanente del servidor
+        return False
+    return True
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Espera antes del intento `attempt + 1`: crecimiento exponencial con tope
+    y jitter proporcional para que los reintentos no lleguen en ráfaga.
+    """
+    delay = min(
+        settings.EMAIL_RETRY_MAX_DELAY,
+        settings.EMAIL_RETRY_BASE_DELAY * (settings.EMAIL_RETRY_MULTIPLIER ** max(0, attempt - 1))
+    )
+    jitter = delay * settings.EMAIL_RETRY_JITTER
+    return max(0.0, delay - jitter + random.random() * 2 * jitter)
+
+class RetryTimerHeap:
+    """
+    Heap de reintentos programados por este proceso. El worker duerme hasta
+    el próximo vencimiento en lugar de mantener una coroutine por reintento.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int]] = []
+        self._scheduled: Set[int] = set()
+
+    def schedule(self, email_log_id: int, due_at: datetime):
+        if email_log_id in self._scheduled:
+            return
+        # Se guarda en reloj monotónico para no depender de la hora del sistema
+        delay = max(0.0, due_at.timestamp() - time.time())
+        heapq.heappush(self._heap, (time.monotonic() + delay, email_log_id))
+        self._scheduled.add(email_log_id)
+
+    def pop_due(self) -> List[int]:
+        now = time.monotonic()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            email_log_id = heapq.heappop(self._heap)[1]
+            self._scheduled.discard(email_log_id)
+            due.append(email_log_id)
+        return due
+
+    def seconds_until_next(self) -> Optional[float]:
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._heap)
@@ -0,0 +1,225 @@
+import time
+import asyncio
+import hashlib
+import logging
+import aiosmtplib
+from email.message import Message
+from typing import Optional, List, Dict, Any
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Errores que indican que la conexión quedó inservible y hay que reconectar
+RECONNECT_ERRORS = (
+    aiosmtplib.SMTPServerDisconnected,
+    aiosmtplib.SMTPConnectError,
+    aiosmtplib.SMTPTimeoutError,
+    ConnectionError,
+    OSError
+)
+
+class PooledSMTPConnection:
+    def __init__(self, client: aiosmtplib.SMTP):
+        self.client = client
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+class SMTPConnectionPool:
+    """Pool de sesiones SMTP autenticadas para un mailbox"""
+
+    def __init__(self, hostname: str, port: int, username: str, password: str,
+                 start_tls: bool = True, max_size: Optional[int] = None):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self._password = password
+        self.start_tls = start_tls
+        self.max_size = max_size or settings.SMTP_POOL_MAX_CONNECTIONS
+        self._idle: List[PooledSMTPConnection] = []
+        self._semaphore = asyncio.Semaphore(self.max_size)
+        self.in_use = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.reconnects = 0
+        self.health_check_failures = 0
+        self.messages_sent = 0
+
+    async def _connect(self) -> PooledSMTPConnection:
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=self.port == 465,
+            start_tls=self.start_tls if self.port != 465 else False,
+            timeout=settings.SMTP_TIMEOUT
+        )
+        await client.connect()
+        try:
+            await client.login(self.username, self._password)
+        except Exception:
+            client.close()
+            raise
+        self.connections_created += 1
+        logger.info(f"🔌 Nueva sesión SMTP {self.hostname}:{self.port} ({self.username})")
+        return PooledSMTPConnection(client)
+
+    async def _close(self, conn: PooledSMTPConnection):
+        try:
+            await conn.client.quit()
+        except Exception:
+            conn.client.close()
+
+    def _expired(self, conn: PooledSMTPConnection, now: float) -> bool:
+        return (
+            now - conn.last_used > settings.SMTP_POOL_IDLE_TIMEOUT
+            or conn.messages_sent >= settings.SMTP_POOL_MAX_MESSAGES_PER_CONNECTION
+            or not conn.client.is_connected
+        )
+
+    async def _healthy(self, conn: PooledSMTPConnection, now: float) -> bool:
+        if now - conn.last_used < settings.SMTP_POOL_HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            await conn.client.noop()
+            return True
+        except Exception:
+            self.health_check_failures += 1
+            return False
+
+    async def acquire(self) -> PooledSMTPConnection:
+        await self._semaphore.acquire()
+        try:
+            while self._idle:
+                conn = self._idle.pop()
+                now = time.monotonic()
+                if self._expired(conn, now) or not await self._healthy(conn, now):
+                    await self._close(conn)
+                    continue
+                self.connections_reused += 1
+                self.in_use += 1
+                return conn
+            conn = await self._connect()
+            self.in_use += 1
+            return conn
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    async def release(self, conn: PooledSMTPConnection, discard: bool = False):
+        self.in_use -= 1
+        try:
+            conn.last_used = time.monotonic()
+            if discard or self._expired(conn, conn.last_used):
+                await self._close(conn)
+            else:
+                self._idle.append(conn)
+        finally:
+            self._semaphore.release()
+
+    async def _send(self, send):
+        """Enviar con una sesión del pool, reconectando una vez si la sesión se cayó"""
+        for attempt in range(2):
+            conn = await self.acquire()
+            try:
+                result = await send(conn.client)
+            except RECONNECT_ERRORS:
+                await self.release(conn, discard=True)
+                if attempt == 0:
+                    self.reconnects += 1
+                    logger.warning(f"🔄 Sesión SMTP {self.hostname} caída, reconectando...")
+                    continue
+                raise
+            except Exception:
+                # Tras un rechazo el estado de la transacción es incierto
+                await self.release(conn, discard=True)
+                raise
+            conn.messages_sent += 1
+            self.messages_sent += 1
+            await self.release(conn)
+            return result
+
+    async def send_message(self, message: Message, recipients: List[str]):
+        return await self._send(lambda client: client.send_message(message, recipients=recipients))
+
+    async def send_raw(self, sender: str, recipients: List[str], data: bytes):
+        """Enviar un mensaje ya serializado (mensajes compilados de campaña)"""
+        return await self._send(lambda client: client.sendmail(sender, recipients, data))
+
+    async def prune(self):
+        """Cerrar sesiones ociosas que superaron el idle timeout"""
+        # Separar sin ceder el event loop: durante los QUIT otros acquire() y
+        # release() pueden tocar _idle
+        now = time.monotonic()
+        idle, self._idle = self._idle, []
+        expired = []
+        for conn in idle:
+            (expired if self._expired(conn, now) else self._idle).append(conn)
+        for conn in expired:
+            await self._close(conn)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self._close(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "host": f"{self.hostname}:{self.port}",
+            "username": self.username,
+            "max_size": self.max_size,
+            "idle": len(self._idle),
+            "in_use": self.in_use,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reconnects": self.reconnects,
+            "health_check_failures": self.health_check_failures,
+            "messages_sent": self.messages_sent
+        }
+
+class SMTPPoolManager:
+    def __init__(self):
+        self.pools: Dict[int, SMTPConnectionPool] = {}
+        self._signatures: Dict[int, str] = {}
+        self._last_prune = time.monotonic()
+
+    @staticmethod
+    def _signature(hostname: str, port: int, username: str, password: str, start_tls: bool) -> str:
+        raw = f"{hostname}|{port}|{username}|{password}|{start_tls}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_pool(self, mailbox_id: int, hostname: str, port: int,
+                       username: str, password: str, start_tls: bool = True) -> SMTPConnectionPool:
+        if time.monotonic() - self._last_prune > settings.SMTP_POOL_IDLE_TIMEOUT:
+            await self.prune()
+        signature = self._signature(hostname, port, username, password, start_tls)
+        pool = self.pools.get(mailbox_id)
+        if pool is not None and self._signatures.get(mailbox_id) == signature:
+            return pool
+        if pool is not None:
+            # Cambiaron las credenciales del mailbox: descartar sesiones viejas
+            await pool.close()
+        pool = SMTPConnectionPool(hostname, port, username, password, start_tls)
+        self.pools[mailbox_id] = pool
+        self._signatures[mailbox_id] = signature
+        return pool
+
+    async def prune(self):
+        self._last_prune = time.monotonic()
+        for pool in list(self.pools.values()):
+            await pool.prune()
+
+    async def close_all(self):
+        pools, self.pools = self.pools, {}
+        self._signatures = {}
+        for pool in pools.values():
+            await pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {str(mailbox_id): pool.stats() for mailbox_id, pool in self.pools.items()}
+
+smtp_pools = SMTPPoolManager()
+
+async def close_smtp_pools():
+    """Cerrar todas las sesiones SMTP del pool"""
+    await smtp_pools.close_all()
+    print("❌ Pools SMTP cerrados")
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindBuffer:
+    """
+    Cola en memoria acotada con un flusher que guarda los eventos en lotes:
+    cada `flush_interval` segundos o cada `flush_batch` eventos, lo que llegue
+    antes. Las subclases implementan flush().
+    """
+
+    name = "eventos"
+
+    def __init__(self, max_pending: int, flush_interval: float, flush_batch: int):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        # Eventos ya sacados de la cola que todavía no se guardaron
+        self.batch: List[Dict[str, Any]] = []
+        self.flushing: Optional[asyncio.Future] = None
+        self.recorded = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    def add(self, event: Dict[str, Any]) -> bool:
+        if self.queue is None:
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            # Memoria acotada: bajo una tormenta se pierden eventos, no respuestas
+            self.dropped += 1
+            return False
+
+    async def flush(self, events: List[Dict[str, Any]]) -> int:
+        """Guardar un lote; devuelve cuántos eventos se guardaron"""
+        raise NotImplementedError
+
+    async def _flush(self, events: List[Dict[str, Any]]):
+        self.recorded += await self.flush(events)
+        self.flushes += 1
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(self.batch) < self.flush_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self.batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            batch, self.batch = self.batch, []
+            # Al cerrar no se corta un flush a medias: stop() lo espera
+            self.flushing = asyncio.ensure_future(self._flush(batch))
+            try:
+                await asyncio.shield(self.flushing)
+            except Exception as e:
+                logger.error(f"💥 Error guardando {len(batch)} {self.name}: {str(e)}")
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Detener el flusher y guardar lo que quede en memoria"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        if self.flushing is not None and not self.flushing.done():
+            await asyncio.wait([self.flushing])
+        pending, self.batch = self.batch, []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        # Respetar el tamaño de lote también en el vaciado final
+        for i in range(0, len(pending), self.flush_batch):
+            try:
+                await self._flush(pending[i:i + self.flush_batch])
+            except Exception as e:
+                logger.error(f"💥 Error guardando {self.name} al cerrar: {str(e)}")
+        self.task = None
+        self.queue = None
+        self.flushing = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": (self.queue.qsize() if self.queue else 0) + len(self.batch),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "flushes": self.flushes
+        }
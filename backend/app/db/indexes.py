@@ -0,0 +1,63 @@
+from typing import List
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Helpers para las migraciones: índices sobre tablas grandes sin bloquear
+# escrituras. Usar dentro de op.get_context().autocommit_block(), porque
+# CREATE INDEX CONCURRENTLY no corre dentro de una transacción.
+
+def _is_partitioned(bind: Connection, table: str) -> bool:
+    return bind.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {"table": table}
+    ).first() is not None
+
+def _partitions(bind: Connection, table: str) -> List[str]:
+    result = bind.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"
+        ),
+        {"table": table}
+    )
+    return [name for (name,) in result.all()]
+
+def _drop_if_invalid(bind: Connection, name: str):
+    """Un CREATE INDEX CONCURRENTLY interrumpido deja el índice inválido: rehacerlo"""
+    invalid = bind.execute(
+        text("SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:name) AND NOT indisvalid"),
+        {"name": name}
+    ).first()
+    if invalid is not None:
+        bind.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+def create_index_concurrently(bind: Connection, name: str, table: str, columns: str):
+    """
+    `columns` es el SQL de las columnas, p. ej. "mailbox_id, created_at DESC".
+    En una tabla particionada se crea el índice en el padre con ON ONLY, cada
+    partición en forma concurrente y luego se adjuntan; las particiones
+    nuevas lo heredan. Fuera de Postgres es un CREATE INDEX normal.
+    """
+    if bind.dialect.name != "postgresql":
+        bind.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+        return
+    if not _is_partitioned(bind, table):
+        _drop_if_invalid(bind, name)
+        bind.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"))
+        return
+    bind.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} ({columns})"))
+    suffix = name.removeprefix(f"ix_{table}_")
+    for partition in _partitions(bind, table):
+        child = f"{partition}_{suffix}"[:63]
+        _drop_if_invalid(bind, child)
+        bind.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {child} ON {partition} ({columns})"))
+        bind.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {child}"))
+
+def drop_index_concurrently(bind: Connection, name: str, table: str):
+    if bind.dialect.name != "postgresql":
+        bind.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    elif _is_partitioned(bind, table):
+        # Los índices particionados no admiten CONCURRENTLY; arrastra los de cada partición
+        bind.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    else:
+        bind.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
@@ -0,0 +1,43 @@
+from pathlib import Path
+from typing import Optional
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# El esquema lo manejan solo las migraciones de migrations/versions: la app
+# no crea tablas, verifica al arrancar que la base esté en la última.
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
+# Esquema que upgrade_tables.py deja en las bases anteriores a Alembic
+BASELINE_REVISION = "0001_baseline"
+
+def alembic_config() -> Config:
+    return Config(str(ALEMBIC_INI))
+
+def head_revision() -> Optional[str]:
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+def current_revision(sync_conn: Connection) -> Optional[str]:
+    return MigrationContext.configure(sync_conn).get_current_revision()
+
+async def check_schema(conn: AsyncConnection):
+    """Lanzar RuntimeError si la base no está en la última migración"""
+    current = await conn.run_sync(current_revision)
+    head = head_revision()
+    if current != head:
+        raise RuntimeError(
+            f"La base está en la migración {current or '(ninguna)'} y se espera {head}: "
+            "ejecutar `alembic upgrade head`"
+        )
+
+def upgrade_head():
+    """
+    alembic upgrade head. env.py abre su propio event loop: desde código
+    async llamar con asyncio.to_thread.
+    """
+    command.upgrade(alembic_config(), "head")
+
+def stamp_baseline():
+    command.stamp(alembic_config(), BASELINE_REVISION)
@@ -0,0 +1,91 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+from sqlalchemy import Select, func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.core.email_queue import STATUS_PENDING, STATUS_SENDING, claimable
+from app.core.email_search import parse_search, search_query
+from app.core.pagination import history_query
+from app.models.email_log import EmailLog
+from app.models.email_open_event import EmailOpenEvent
+from app.models.email_click import EmailClick
+from app.models.email_stats_hourly import EmailStatsHourly
+from app.models.mailbox import Mailbox
+
+# Consultas calientes de emails.py y de la cola, con valores de ejemplo. Cada
+# una debe poder resolverse con un índice: si el plan cae en un Seq Scan, el
+# chequeo falla.
+def _hot_queries(dialect: str) -> Dict[str, Callable[[], Select]]:
+    now = datetime.now(timezone.utc)
+    cursor = (now, 1000)
+    return {
+        "history": lambda: history_query(1, 50, cursor=cursor),
+        "history_status": lambda: history_query(1, 50, "failed", cursor),
+        "email_detail": lambda: select(EmailLog).where(EmailLog.id == 1, EmailLog.sent_by == 1),
+        "open_events": lambda: (
+            select(EmailOpenEvent).where(EmailOpenEvent.email_log_id == 1)
+            .order_by(EmailOpenEvent.opened_at.desc()).limit(100)
+        ),
+        "clicks": lambda: select(EmailClick).where(EmailClick.email_log_id == 1).limit(100),
+        "queue_claim": lambda: select(EmailLog.id).where(claimable(now)).limit(200),
+        "queue_next_retry": lambda: (
+            select(EmailLog.id, EmailLog.next_attempt_at)
+            .where(EmailLog.status == STATUS_PENDING, EmailLog.next_attempt_at > now)
+            .order_by(EmailLog.next_attempt_at).limit(1)
+        ),
+        "queue_depth": lambda: (
+            select(func.count()).where(EmailLog.status.in_([STATUS_PENDING, STATUS_SENDING]))
+        ),
+        "mailbox_logs": lambda: select(EmailLog.id).where(EmailLog.mailbox_id == 1),
+        "archive_oldest": lambda: select(func.min(EmailLog.created_at)),
+        "archive_month": lambda: select(EmailLog.id).where(
+            EmailLog.created_at >= now - timedelta(days=31), EmailLog.created_at < now
+        ),
+        "verified_mailbox": lambda: (
+            select(Mailbox).where(Mailbox.owner_id == 1, Mailbox.is_verified == True).limit(1)
+        ),
+        "stats_totals": lambda: select(func.sum(EmailStatsHourly.count)).where(EmailStatsHourly.user_id == 1),
+        "search": lambda: search_query(dialect, 1, parse_search("invoice to:@acme.com"), 50),
+    }
+
+def _literal_sql(query: Select, conn: AsyncConnection) -> str:
+    return str(query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+
+def _postgres_seq_scans(plan: Dict[str, Any]) -> List[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(f"Seq Scan en {plan.get('Relation Name')}")
+    for child in plan.get("Plans", []):
+        found += _postgres_seq_scans(child)
+    return found
+
+async def explain(conn: AsyncConnection, query: Select) -> List[str]:
+    """Recorridos completos de tabla en el plan de una consulta"""
+    sql = _literal_sql(query, conn)
+    if conn.dialect.name == "postgresql":
+        plan = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return _postgres_seq_scans(plan[0]["Plan"])
+    # SQLite: "SCAN tabla" sin índice es un recorrido completo; SEARCH usa índice
+    rows = (await conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))).all()
+    return [
+        row[-1] for row in rows
+        if row[-1].startswith("SCAN ") and "USING" not in row[-1] and "VIRTUAL TABLE" not in row[-1]
+    ]
+
+async def check_query_plans(conn: AsyncConnection) -> Dict[str, List[str]]:
+    """
+    Planear cada consulta caliente y devolver las que recorren tablas
+    completas. En Postgres se desactiva enable_seqscan dentro de la
+    transacción: con tablas chicas el planner prefiere el Seq Scan aunque el
+    índice exista, así que solo queda un Seq Scan si no hay índice utilizable.
+    """
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("SET LOCAL enable_seqscan = off"))
+    failures = {}
+    for name, build in _hot_queries(conn.dialect.name).items():
+        scans = await explain(conn, build())
+        if scans:
+            failures[name] = scans
+    return failures
@@ -1,10 +1,21 @@
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
 from app.api import domains, emails, auth, user, mailbox, files
-from app.db.base import engine, Base
+from app.db.base import engine
 from app.core.database import connect_to_mongo, close_mongo_connection
+from app.core.http_client import start_provider_client, close_provider_client
+from app.core.smtp_pool import close_smtp_pools
+from app.core.rate_limit import start_rate_limiter, close_rate_limiter
+from app.core.click_tracking import start_click_recorder, stop_click_recorder
+from app.core.open_tracking import start_open_recorder, stop_open_recorder
+from app.core.enrichment import start_enrichment, close_enrichment
+from app.core.open_classifier import start_open_classifier
+from app.db.migrations import check_schema
+from app.workers.queue_worker import start_embedded_workers, stop_embedded_workers
+from app.workers.archive_worker import start_log_archiver, stop_log_archiver
 
 # Importar modelos
 from app.models.user import User
@@ -13,6 +24,12 @@ from app.models.user_roles import user_roles
 from app.models.mailbox import Mailbox
 from app.models.outgoing_domain import OutgoingDomain
 from app.models.email_log import EmailLog
+from app.models.email_link import EmailLink
+from app.models.email_click import EmailClick
+from app.models.email_open_event import EmailOpenEvent
+from app.models.email_stats_hourly import EmailStatsHourly
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Email Platform API",
@@ -52,17 +69,42 @@ def root():
 
 @app.on_event("startup")
 async def startup_event():
+    # MongoDB solo lo usan las rutas que lo consultan: si no conecta, lo demás arranca igual
     try:
         await connect_to_mongo()
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-        print("✅ Tablas creadas/verificadas exitosamente y MongoDB conectado!")
-        print("📬 Sistema de tracking de emails activado")
-        print("🌐 CORS configurado explícitamente para frontend de producción")
-    except Exception as e:
-        print(f"❌ Error durante el startup: {e}")
+    except Exception:
+        logger.exception("❌ Error conectando a MongoDB")
+    # Sin estas piezas los emails se quedan en pending, las aperturas y los
+    # clicks se pierden y los envíos no tienen límite: si alguna falla, el
+    # startup aborta en vez de dejar la API a medias
+    # El esquema lo crean las migraciones (alembic upgrade head), no la app
+    async with engine.connect() as conn:
+        await check_schema(conn)
+    await start_provider_client()
+    await start_rate_limiter()
+    await start_enrichment()
+    try:
+        await start_open_classifier()
+    except Exception:
+        # Sin rangos IP se clasifica solo por user-agent
+        logger.exception("❌ Error cargando los rangos IP del clasificador de aperturas")
+    await start_open_recorder()
+    await start_click_recorder()
+    await start_embedded_workers()
+    await start_log_archiver()
+    print("✅ Esquema de la base verificado")
+    print("📬 Sistema de tracking de emails activado")
+    print("🌐 CORS configurado explícitamente para frontend de producción")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await stop_log_archiver()
+    await stop_embedded_workers()
+    await stop_open_recorder()
+    await stop_click_recorder()
+    await close_enrichment()
+    await close_provider_client()
+    await close_smtp_pools()
+    await close_rate_limiter()
     await close_mongo_connection()
     print("🔒 Conexión MongoDB cerrada.")
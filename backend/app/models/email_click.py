@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from app.db.base import Base
+
+class EmailClick(Base):
+    __tablename__ = "email_clicks"
+
+    id = Column(Integer, primary_key=True)
+    email_log_id = Column(Integer, ForeignKey("email_logs.id", ondelete="CASCADE"), index=True, nullable=False)
+    url_hash = Column(String(16), nullable=False)
+    clicked_at = Column(DateTime, nullable=False)
+    ip = Column(String(64), nullable=True)
+    user_agent = Column(Text, nullable=True)
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class EmailLink(Base):
+    __tablename__ = "email_links"
+
+    # Primeros 16 hex del sha256 de la URL: va en el token de cada click
+    url_hash = Column(String(16), primary_key=True)
+    url = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
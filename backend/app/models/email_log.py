@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
@@ -21,7 +21,27 @@ class EmailLog(Base):
     opened_at = Column(DateTime, nullable=True)
     open_count = Column(Integer, default=0)
     last_opened_at = Column(DateTime, nullable=True)
-    tracking_data = Column(JSON, nullable=True)  # Datos del navegador, IP, etc.
+    tracking_data = Column(JSON, nullable=True)  # Primera apertura; el resto en email_open_events
+    click_count = Column(Integer, default=0, nullable=False, server_default="0")
+    last_clicked_at = Column(DateTime, nullable=True)
+
+    # Cola persistente de envío
+    html_body = Column(Text, nullable=True)
+    send_options = Column(JSON, nullable=True)  # cc, bcc, attachments
+    attempts = Column(Integer, default=0, nullable=False, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    locked_by = Column(String(100), nullable=True)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
     
     sender = relationship("User")
     mailbox = relationship("Mailbox")
+
+    __table_args__ = (
+        Index("ix_email_logs_queue", "status", "next_attempt_at"),
+        # Historial por usuario (keyset sobre created_at, id)
+        Index("ix_email_logs_user_created", "sent_by", created_at.desc(), id.desc()),
+        Index("ix_email_logs_user_status_created", "sent_by", "status", created_at.desc(), id.desc()),
+        # Logs por mailbox y por fecha (archivado, filtros masivos)
+        Index("ix_email_logs_mailbox_created", "mailbox_id", created_at.desc()),
+        Index("ix_email_logs_created", "created_at"),
+    )
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index
+from app.db.base import Base
+
+class EmailOpenEvent(Base):
+    __tablename__ = "email_open_events"
+
+    id = Column(Integer, primary_key=True)
+    email_log_id = Column(Integer, ForeignKey("email_logs.id", ondelete="CASCADE"), nullable=False)
+    opened_at = Column(DateTime, nullable=False)
+    ip = Column(String(64), nullable=True)
+    user_agent = Column(Text, nullable=True)
+    referrer = Column(Text, nullable=True)
+    language = Column(String(100), nullable=True)
+    classification = Column(String(10), nullable=True)  # human, proxy o bot
+    data = Column(JSON, nullable=True)  # Navegador, sistema, dispositivo
+
+    __table_args__ = (
+        Index("ix_email_open_events_log_opened", "email_log_id", "opened_at"),
+    )
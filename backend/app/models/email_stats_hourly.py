@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, DateTime, PrimaryKeyConstraint
+from app.db.base import Base
+
+class EmailStatsHourly(Base):
+    """Contadores por hora, usuario, buzón y estado; se mantienen en cada transición"""
+    __tablename__ = "email_stats_hourly"
+
+    user_id = Column(Integer, nullable=False)
+    bucket = Column(DateTime, nullable=False)  # Inicio de la hora, UTC
+    mailbox_id = Column(Integer, nullable=False, default=0)  # 0: sin buzón
+    status = Column(String(20), nullable=False)  # sent, failed, opened, open_human...
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # El orden sirve a las consultas por usuario y rango de horas
+        PrimaryKeyConstraint("user_id", "bucket", "mailbox_id", "status"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
@@ -17,3 +17,8 @@ class Mailbox(Base):
 
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="mailboxes")
+
+    __table_args__ = (
+        # Mailbox verificado del usuario al enviar
+        Index("ix_mailboxes_owner_verified", "owner_id", "is_verified"),
+    )
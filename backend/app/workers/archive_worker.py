@@ -0,0 +1,114 @@
+import asyncio
+import argparse
+import logging
+from typing import Any, Dict, List, Optional
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.log_archive import ARCHIVE_LOCK_ID, archive_month, ensure_partitions, expired_months
+from app.core.response_cache import response_cache
+from app.db.base import engine
+
+logger = logging.getLogger(__name__)
+
+class LogArchiver:
+    """
+    Tarea periódica de retención: crea las particiones de los próximos meses
+    y archiva en disco los meses anteriores a LOG_RETENTION_DAYS. En Postgres
+    un advisory lock evita que dos procesos archiven a la vez.
+    """
+
+    def __init__(self, retention_days: Optional[int] = None, interval: Optional[float] = None):
+        self.retention_days = settings.LOG_RETENTION_DAYS if retention_days is None else retention_days
+        self.interval = interval or settings.LOG_ARCHIVE_INTERVAL
+        self._stopping = asyncio.Event()
+
+    async def run_once(self) -> List[Dict[str, Any]]:
+        archived = []
+        async with engine.connect() as conn:
+            postgres = conn.dialect.name == "postgresql"
+            if postgres:
+                locked = (await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": ARCHIVE_LOCK_ID})).scalar()
+                await conn.commit()
+                if not locked:
+                    logger.info("🔒 Otro proceso está archivando email_logs")
+                    return archived
+            try:
+                async with conn.begin():
+                    await ensure_partitions(conn)
+                if self.retention_days <= 0:
+                    return archived
+                async with conn.begin():
+                    months = await expired_months(conn, self.retention_days)
+                for month in months:
+                    async with conn.begin():
+                        manifest = await archive_month(conn, month)
+                    if not manifest["rows"]:
+                        continue
+                    archived.append(manifest)
+                    response_cache.invalidate_emails(int(user) for user in manifest["users"] if user != "None")
+            finally:
+                if postgres:
+                    await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ARCHIVE_LOCK_ID})
+                    await conn.commit()
+        return archived
+
+    async def run(self):
+        logger.info("🚀 Archivador de email_logs iniciado")
+        while not self._stopping.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"💥 Error archivando email_logs: {str(e)}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+        logger.info("🔒 Archivador de email_logs detenido")
+
+    def stop(self):
+        self._stopping.set()
+
+class EmbeddedArchiver:
+    archiver: Optional[LogArchiver] = None
+    task: Optional[asyncio.Task] = None
+
+embedded = EmbeddedArchiver()
+
+async def start_log_archiver():
+    """Arrancar el archivador dentro del proceso web"""
+    if not settings.LOG_ARCHIVE_EMBEDDED:
+        return
+    embedded.archiver = LogArchiver()
+    embedded.task = asyncio.create_task(embedded.archiver.run())
+    print("✅ Archivador de email_logs iniciado")
+
+async def stop_log_archiver():
+    if embedded.archiver is None:
+        return
+    embedded.archiver.stop()
+    try:
+        await asyncio.wait_for(embedded.task, timeout=settings.EMAIL_QUEUE_SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        embedded.task.cancel()
+    embedded.archiver = None
+    embedded.task = None
+    print("❌ Archivador de email_logs detenido")
+
+def main():
+    parser = argparse.ArgumentParser(description="Retención de email_logs: particiones y archivo en disco")
+    parser.add_argument("--retention-days", type=int, default=None, help="Archivar meses anteriores a N días")
+    parser.add_argument("--once", action="store_true", help="Una pasada y salir")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    archiver = LogArchiver(retention_days=args.retention_days)
+    try:
+        if args.once:
+            archived = asyncio.run(archiver.run_once())
+            print(f"🗄️ {len(archived)} meses archivados")
+        else:
+            asyncio.run(archiver.run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,98 @@
-from email.message import EmailMessage
 import asyncio
-import aiosmtplib
+import logging
+from typing import List, Optional
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 celery_app = Celery(
     "email_worker",
-    broker="redis://localhost:6379/0",
+    broker=settings.CELERY_BROKER_URL,
+)
+
+# Envíos I/O-bound: se confirma la tarea al terminar (acks_late) y cada
+# proceso reserva de a una, porque cada tarea ya trae un chunk de emails
+celery_app.conf.update(
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=settings.CELERY_PREFETCH_MULTIPLIER,
+    task_serializer="json",
+    accept_content=["json"],
+    task_ignore_result=True,
+    broker_connection_retry_on_startup=True,
 )
 
-@celery_app.task
-def send_email_task(recipient: str, subject: str, body: str, sender: str):
-    loop = asyncio.get_event_loop()
-
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = sender
-    msg["To"] = recipient
-    msg.set_content("Este correo requiere un cliente compatible con HTML.")  # Texto plano alternativo
-    msg.add_alternative(body, subtype="html")  # Aquí va el HTML!
-
-    loop.run_until_complete(aiosmtplib.send(
-        msg,
-        hostname="smtp.mailgun.org",
-        port=587,
-        username=sender,
-        password="MAIL_PASSWORD"
-    ))
-    return True
+class WorkerLoop:
+    loop: Optional[asyncio.AbstractEventLoop] = None
+
+worker_loop = WorkerLoop()
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    # Un event loop por proceso: el pool SMTP, el cliente HTTP y el engine
+    # quedan ligados a él y se reutilizan entre tareas
+    if worker_loop.loop is None or worker_loop.loop.is_closed():
+        worker_loop.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(worker_loop.loop)
+    return worker_loop.loop
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    from app.db.base import engine
+    # No reutilizar conexiones heredadas del proceso padre (prefork)
+    engine.sync_engine.dispose(close=False)
+    get_worker_loop()
+    logger.info("✅ Event loop del worker de email iniciado")
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    from app.core.http_client import close_provider_client
+    from app.core.smtp_pool import close_smtp_pools
+    from app.db.base import engine
+
+    if worker_loop.loop is None or worker_loop.loop.is_closed():
+        return
+    loop = worker_loop.loop
+    loop.run_until_complete(close_smtp_pools())
+    loop.run_until_complete(close_provider_client())
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+    logger.info("❌ Event loop del worker de email cerrado")
+
+async def _send_email_logs(email_log_ids: List[int]) -> int:
+    from app.core.email_queue import claim_email_logs, default_worker_id
+    from app.db.base import AsyncSessionLocal
+    from app.workers.queue_worker import dispatch_claimed
+
+    worker_id = f"celery:{default_worker_id()}"
+    async with AsyncSessionLocal() as db:
+        # Solo se envían los que siguen pendientes: si otro worker ya los
+        # tomó (o la tarea se re-entregó) no se duplica el envío
+        jobs = await claim_email_logs(db, worker_id, len(email_log_ids), ids=email_log_ids)
+        if not jobs:
+            return 0
+        saved = await dispatch_claimed(db, worker_id, jobs, settings.EMAIL_BATCH_CONCURRENCY)
+    retries = [row for row in saved if row["next_attempt_at"] is not None]
+    if retries:
+        # Un solo reintento para el grupo, cuando todos ya estén vencidos
+        eta = max(row["next_attempt_at"] for row in retries)
+        send_email_batch_task.apply_async(args=[[row["id"] for row in retries]], eta=eta)
+    return len(jobs)
+
+@celery_app.task(name="email_worker.send_email_batch")
+def send_email_batch_task(email_log_ids: List[int]) -> int:
+    """Enviar un chunk de emails ya registrados en email_logs"""
+    return get_worker_loop().run_until_complete(_send_email_logs(email_log_ids))
+
+@celery_app.task(name="email_worker.send_email")
+def send_email_task(email_log_id: int) -> int:
+    return get_worker_loop().run_until_complete(_send_email_logs([email_log_id]))
+
+def enqueue_email_logs(email_log_ids: List[int]) -> int:
+    """Publicar los logs en Celery en chunks de CELERY_EMAIL_CHUNK_SIZE"""
+    size = settings.CELERY_EMAIL_CHUNK_SIZE
+    chunks = [email_log_ids[i:i + size] for i in range(0, len(email_log_ids), size)]
+    for chunk in chunks:
+        send_email_batch_task.apply_async(args=[chunk])
+    return len(chunks)
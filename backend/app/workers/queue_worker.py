@@ -0,0 +1,176 @@
+import asyncio
+import argparse
+import logging
+from typing import Optional, List, Dict, Any
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.email_queue import (
+    claim_email_logs, complete_email_logs, fail_expired_leases, get_next_retry,
+    default_worker_id, hold_leases
+)
+from app.core.retry import RetryTimerHeap
+from app.db.base import AsyncSessionLocal
+from app.models.mailbox import Mailbox
+
+logger = logging.getLogger(__name__)
+
+async def dispatch_claimed(db: AsyncSession, worker_id: str, jobs: List[Dict[str, Any]],
+                           concurrency: int) -> List[Dict[str, Any]]:
+    """Enviar logs ya reservados, agrupados por mailbox, y guardar los resultados"""
+    # Import diferido: app.api.emails importa la cola para encolar
+    from app.api.emails import dispatch_email_batch
+
+    by_mailbox: Dict[int, List[Dict[str, Any]]] = {}
+    for job in jobs:
+        by_mailbox.setdefault(job["mailbox_id"], []).append(job)
+    result = await db.execute(select(Mailbox).where(Mailbox.id.in_(list(by_mailbox))))
+    mailboxes = {m.id: m for m in result.scalars().all()}
+
+    async def dispatch(mailbox_id: int, mailbox_jobs: List[Dict[str, Any]]):
+        mailbox = mailboxes.get(mailbox_id)
+        if mailbox is None:
+            return [
+                {"id": job["email_log_id"], "status": "failed",
+                 "error_message": f"Mailbox {mailbox_id} no existe", "retryable": False}
+                for job in mailbox_jobs
+            ]
+        return await dispatch_email_batch(mailbox, mailbox_jobs, concurrency)
+
+    async with hold_leases(worker_id):
+        grouped = await asyncio.gather(*(
+            dispatch(mailbox_id, mailbox_jobs) for mailbox_id, mailbox_jobs in by_mailbox.items()
+        ))
+    outcomes = [outcome for group in grouped for outcome in group]
+    attempts = {job["email_log_id"]: job["attempts"] for job in jobs}
+    saved = await complete_email_logs(db, worker_id, outcomes, attempts)
+    sent = sum(1 for o in outcomes if o["status"] == "sent")
+    logger.info(f"💾 {sent}/{len(outcomes)} emails enviados")
+    return saved
+
+class QueueWorker:
+    """
+    Consume la cola persistente de email_logs. Se pueden correr varios en el
+    mismo proceso o en procesos distintos: el claim usa SKIP LOCKED.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None, batch_size: Optional[int] = None,
+                 concurrency: Optional[int] = None, poll_interval: Optional[float] = None,
+                 grace_seconds: float = 0):
+        self.worker_id = worker_id or default_worker_id()
+        self.batch_size = batch_size or settings.EMAIL_QUEUE_BATCH_SIZE
+        self.concurrency = concurrency or settings.EMAIL_BATCH_CONCURRENCY
+        self.poll_interval = poll_interval or settings.EMAIL_QUEUE_POLL_INTERVAL
+        self.grace_seconds = grace_seconds
+        self._stopping = asyncio.Event()
+        self.retries = RetryTimerHeap()
+
+    async def run_once(self) -> int:
+        """Reservar un lote, enviarlo y guardar los resultados"""
+        async with AsyncSessionLocal() as db:
+            jobs = await claim_email_logs(
+                db, self.worker_id, self.batch_size, grace_seconds=self.grace_seconds
+            )
+            if not jobs:
+                return 0
+            logger.info(f"📥 Worker {self.worker_id} reservó {len(jobs)} emails")
+            saved = await dispatch_claimed(db, self.worker_id, jobs, self.concurrency)
+            for row in saved:
+                if row["next_attempt_at"] is not None:
+                    self.retries.schedule(row["id"], row["next_attempt_at"])
+            return len(jobs)
+
+    async def run(self):
+        logger.info(f"🚀 Worker de cola {self.worker_id} iniciado")
+        while not self._stopping.is_set():
+            try:
+                async with AsyncSessionLocal() as db:
+                    expired = await fail_expired_leases(db)
+                if expired:
+                    logger.warning(f"⚠️ {expired} emails fallaron por lease expirado")
+                processed = await self.run_once()
+                if processed < self.batch_size and not self.grace_seconds:
+                    # Reintentos programados por otros procesos o por envíos en línea
+                    async with AsyncSessionLocal() as db:
+                        next_retry = await get_next_retry(db)
+                    if next_retry:
+                        self.retries.schedule(*next_retry)
+            except Exception as e:
+                logger.error(f"💥 Error en worker de cola: {str(e)}")
+                processed = 0
+            if processed < self.batch_size:
+                # Cola vacía o casi: dormir hasta el próximo poll o el próximo
+                # reintento programado, lo que llegue antes
+                timeout = self.poll_interval
+                next_retry = self.retries.seconds_until_next()
+                if next_retry is not None:
+                    timeout = min(timeout, next_retry)
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                due = self.retries.pop_due()
+                if due:
+                    logger.info(f"⏰ {len(due)} reintentos vencidos en worker {self.worker_id}")
+        logger.info(f"🔒 Worker de cola {self.worker_id} detenido")
+
+    def stop(self):
+        self._stopping.set()
+
+class EmbeddedWorkers:
+    workers: List[QueueWorker] = []
+    tasks: List[asyncio.Task] = []
+
+embedded = EmbeddedWorkers()
+
+async def start_embedded_workers():
+    """Arrancar workers de cola dentro del proceso web"""
+    # Con Celery los envíos van por el broker; aquí solo se rescatan huérfanos
+    grace_seconds = settings.CELERY_ORPHAN_GRACE_SECONDS if settings.EMAIL_DISPATCH_BACKEND == "celery" else 0
+    for i in range(settings.EMAIL_QUEUE_EMBEDDED_WORKERS):
+        worker = QueueWorker(worker_id=f"{default_worker_id()}:web{i}", grace_seconds=grace_seconds)
+        embedded.workers.append(worker)
+        embedded.tasks.append(asyncio.create_task(worker.run()))
+    if embedded.workers:
+        print(f"✅ {len(embedded.workers)} workers de cola embebidos iniciados")
+
+async def stop_embedded_workers():
+    """Detener los workers embebidos; lo que quede en vuelo lo retoma otro worker al vencer el lease"""
+    for worker in embedded.workers:
+        worker.stop()
+    if embedded.tasks:
+        done, pending = await asyncio.wait(embedded.tasks, timeout=settings.EMAIL_QUEUE_SHUTDOWN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        print("❌ Workers de cola embebidos detenidos")
+    embedded.workers = []
+    embedded.tasks = []
+
+async def run_workers(count: int, batch_size: Optional[int], concurrency: Optional[int]):
+    from app.core.http_client import close_provider_client
+    from app.core.smtp_pool import close_smtp_pools
+
+    workers = [
+        QueueWorker(worker_id=f"{default_worker_id()}:{i}", batch_size=batch_size, concurrency=concurrency)
+        for i in range(count)
+    ]
+    try:
+        await asyncio.gather(*(worker.run() for worker in workers))
+    finally:
+        await close_provider_client()
+        await close_smtp_pools()
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de la cola persistente de emails")
+    parser.add_argument("--workers", type=int, default=1, help="Coroutines consumidoras en este proceso")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(run_workers(args.workers, args.batch_size, args.concurrency))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Agregar la ruta del backend al path para importar módulos
+backend_path = Path(__file__).parent
+sys.path.insert(0, str(backend_path))
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.core.config import settings
+from app.core.pagination import history_query
+from app.db.migrations import check_schema
+# Todos los modelos, para que se resuelvan las relaciones de EmailLog
+from app.models.user import User
+from app.models.role import Role
+from app.models.user_roles import user_roles
+from app.models.mailbox import Mailbox
+from app.models.outgoing_domain import OutgoingDomain
+from app.models.email_log import EmailLog
+
+BENCH_USERNAME = "history-bench"
+SEED_CHUNK = 1_000_000
+
+# Una fila por segundo hacia atrás; uno de cada diez fallido. En SQLite la
+# fecha va en el formato en que SQLAlchemy guarda los DateTime (con
+# microsegundos), para que el keyset compare textos del mismo formato
+SEED_SQL = {
+    "postgresql": """
+        INSERT INTO email_logs (to_email, from_email, subject, body, status, sent_by, created_at)
+        SELECT 'dest' || n || '@bench.local', 'bench@bench.local', 'Bench ' || n, 'body',
+               CASE WHEN n % 10 = 0 THEN 'failed' ELSE 'sent' END, :user_id,
+               now() - make_interval(secs => n)
+        FROM generate_series(:start, :stop) AS n
+    """,
+    "sqlite": """
+        WITH RECURSIVE s(n) AS (SELECT :start UNION ALL SELECT n + 1 FROM s WHERE n < :stop)
+        INSERT INTO email_logs (to_email, from_email, subject, body, status, sent_by, created_at)
+        SELECT 'dest' || n || '@bench.local', 'bench@bench.local', 'Bench ' || n, 'body',
+               CASE WHEN n % 10 = 0 THEN 'failed' ELSE 'sent' END, :user_id,
+               strftime('%Y-%m-%d %H:%M:%f000', 'now', '-' || n || ' seconds')
+        FROM s
+    """,
+}
+
+async def get_bench_user(conn) -> int:
+    user_id = (await conn.execute(select(User.id).where(User.username == BENCH_USERNAME))).scalar()
+    if user_id is None:
+        result = await conn.execute(
+            User.__table__.insert()
+            .values(username=BENCH_USERNAME, email=f"{BENCH_USERNAME}@bench.local", hashed_password="-")
+            .returning(User.id)
+        )
+        user_id = result.scalar()
+    return user_id
+
+async def seed(engine, rows: int):
+    """Sembrar `rows` logs del usuario de benchmark, en bloques de SEED_CHUNK"""
+    dialect = engine.dialect.name
+    async with engine.begin() as conn:
+        await check_schema(conn)
+        user_id = await get_bench_user(conn)
+        existing = (await conn.execute(
+            select(func.count()).select_from(EmailLog.__table__).where(EmailLog.sent_by == user_id)
+        )).scalar()
+    for start in range(existing + 1, rows + 1, SEED_CHUNK):
+        stop = min(start + SEED_CHUNK - 1, rows)
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            await conn.execute(text(SEED_SQL[dialect]), {"start": start, "stop": stop, "user_id": user_id})
+        print(f"🌱 {stop:,} logs sembrados ({time.perf_counter() - started:.1f} s)")
+    async with engine.begin() as conn:
+        if dialect == "postgresql":
+            await conn.execute(text("ANALYZE email_logs"))
+    return user_id
+
+async def timed(conn, query, repeats: int) -> float:
+    """Mediana en ms de ejecutar y leer una página"""
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        (await conn.execute(query)).all()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+async def run(engine, user_id: int, limit: int, depths, status, repeats: int):
+    columns = (EmailLog.id, EmailLog.created_at, EmailLog.to_email, EmailLog.subject, EmailLog.status)
+    print(f"\n📊 Páginas de {limit} filas{f' con status={status}' if status else ''} (mediana de {repeats})")
+    print(f"{'página':>10} {'offset ms':>12} {'cursor ms':>12}")
+    async with engine.connect() as conn:
+        for page in depths:
+            offset = (page - 1) * limit
+            offset_ms = await timed(conn, history_query(user_id, limit, status, offset=offset, columns=columns), repeats)
+            # El cursor de esa página es la fila anterior a ella (sin medir)
+            cursor = None
+            if offset:
+                previous = (await conn.execute(
+                    history_query(user_id, 1, status, offset=offset - 1, columns=(EmailLog.created_at, EmailLog.id))
+                )).first()
+                if previous is None:
+                    break
+                cursor = (previous.created_at, previous.id)
+            cursor_ms = await timed(conn, history_query(user_id, limit, status, cursor, columns=columns), repeats)
+            print(f"{page:>10,} {offset_ms:>12.2f} {cursor_ms:>12.2f}")
+
+async def cleanup(engine):
+    async with engine.begin() as conn:
+        user_id = (await conn.execute(select(User.id).where(User.username == BENCH_USERNAME))).scalar()
+        if user_id is not None:
+            await conn.execute(delete(EmailLog).where(EmailLog.sent_by == user_id))
+            await conn.execute(delete(User).where(User.id == user_id))
+    print("🧹 Datos de benchmark eliminados")
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark de /emails/history: OFFSET vs cursor (created_at, id) por profundidad de página"
+    )
+    parser.add_argument("--rows", type=int, default=10_000_000, help="logs a sembrar para el usuario de benchmark")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--depths", default="1,10,100,1000,10000,50000,100000",
+                        help="páginas a medir, separadas por coma")
+    parser.add_argument("--status", default=None, help="filtrar por estado (usa el índice con status)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--cleanup", action="store_true", help="borrar los datos sembrados y salir")
+    args = parser.parse_args()
+
+    print(f"🔗 Conectando a: {settings.DATABASE_URL}")
+    engine = create_async_engine(settings.DATABASE_URL, echo=False)
+    try:
+        if args.cleanup:
+            await cleanup(engine)
+            return
+        user_id = await seed(engine, args.rows)
+        depths = [int(depth) for depth in args.depths.split(",")]
+        depths = [depth for depth in depths if (depth - 1) * args.limit < args.rows]
+        await run(engine, user_id, args.limit, depths, args.status, args.repeats)
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Agregar la ruta del backend al path para importar módulos
+backend_path = Path(__file__).parent
+sys.path.insert(0, str(backend_path))
+
+from sqlalchemy import and_, delete, func, or_, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.core.config import settings
+from app.core.email_search import SEARCH_FIELDS, parse_search, search_query
+from app.db.migrations import check_schema
+# Todos los modelos, para que se resuelvan las relaciones de EmailLog
+from app.models.user import User
+from app.models.role import Role
+from app.models.user_roles import user_roles
+from app.models.mailbox import Mailbox
+from app.models.outgoing_domain import OutgoingDomain
+from app.models.email_log import EmailLog
+
+BENCH_USERNAME = "search-bench"
+SEED_CHUNK = 1_000_000
+
+WORDS = ["invoice", "receipt", "welcome", "reminder", "newsletter", "order", "shipping", "password",
+         "report", "meeting", "offer", "survey", "renewal", "payment", "update", "alert"]
+DOMAINS = ["acme.com", "globex.com", "initech.io", "umbrella.org", "hooli.com",
+           "stark.net", "wayne.co", "wonka.biz", "tyrell.ai", "cyberdyne.dev"]
+SENDERS = ["billing", "support", "news", "noreply", "sales"]
+
+# Términos frecuentes (el LIKE con LIMIT corta pronto, el ranking ordena todas
+# las coincidencias) y selectivos (el LIKE recorre todas las filas del usuario)
+DEFAULT_QUERIES = ["invoice", "invoice to:@acme.com", "subject:pay", "from:billing renewal", "to:wonka.biz",
+                   "#123456", "to:user777@tyrell", "welcome 99999"]
+
+def pick(values, expression: str) -> str:
+    """CASE que elige un valor de la lista según una expresión entera"""
+    cases = " ".join(f"WHEN {i} THEN '{value}'" for i, value in enumerate(values))
+    return f"(CASE ({expression}) % {len(values)} {cases} END)"
+
+# Asuntos de dos palabras, 1000 destinatarios en 10 dominios, 5 remitentes;
+# una fila por segundo hacia atrás
+COLUMNS = (
+    f"{pick(WORDS, 'n')} || ' ' || {pick(WORDS, 'n / 16')} || ' #' || n, "
+    f"'user' || (n % 1000) || '@' || {pick(DOMAINS, 'n / 7')}, "
+    f"{pick(SENDERS, 'n / 3')} || '@bench.local', 'body', 'sent', :user_id"
+)
+SEED_SQL = {
+    "postgresql": f"""
+        INSERT INTO email_logs (subject, to_email, from_email, body, status, sent_by, created_at)
+        SELECT {COLUMNS}, now() - make_interval(secs => n)
+        FROM generate_series(:start, :stop) AS n
+    """,
+    "sqlite": f"""
+        WITH RECURSIVE s(n) AS (SELECT :start UNION ALL SELECT n + 1 FROM s WHERE n < :stop)
+        INSERT INTO email_logs (subject, to_email, from_email, body, status, sent_by, created_at)
+        SELECT {COLUMNS}, strftime('%Y-%m-%d %H:%M:%f000', 'now', '-' || n || ' seconds')
+        FROM s
+    """,
+}
+
+async def get_bench_user(conn) -> int:
+    user_id = (await conn.execute(select(User.id).where(User.username == BENCH_USERNAME))).scalar()
+    if user_id is None:
+        result = await conn.execute(
+            User.__table__.insert()
+            .values(username=BENCH_USERNAME, email=f"{BENCH_USERNAME}@bench.local", hashed_password="-")
+            .returning(User.id)
+        )
+        user_id = result.scalar()
+    return user_id
+
+async def seed(engine, rows: int):
+    """Sembrar `rows` logs del usuario de benchmark, en bloques de SEED_CHUNK"""
+    dialect = engine.dialect.name
+    async with engine.begin() as conn:
+        # Tablas e índices de búsqueda vienen de las migraciones
+        await check_schema(conn)
+        user_id = await get_bench_user(conn)
+        existing = (await conn.execute(
+            select(func.count()).select_from(EmailLog.__table__).where(EmailLog.sent_by == user_id)
+        )).scalar()
+    for start in range(existing + 1, rows + 1, SEED_CHUNK):
+        stop = min(start + SEED_CHUNK - 1, rows)
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            await conn.execute(text(SEED_SQL[dialect]), {"start": start, "stop": stop, "user_id": user_id})
+        print(f"🌱 {stop:,} logs sembrados ({time.perf_counter() - started:.1f} s)")
+    async with engine.begin() as conn:
+        if dialect == "postgresql":
+            await conn.execute(text("ANALYZE email_logs"))
+    return user_id
+
+def scan_query(user_id: int, q: str, limit: int):
+    """Línea base sin índice: LIKE sobre las tres columnas, por fecha"""
+    conditions = []
+    for field, term in parse_search(q):
+        names = [SEARCH_FIELDS[field]] if field else list(SEARCH_FIELDS.values())
+        conditions.append(or_(*(getattr(EmailLog, name).ilike(f"%{term}%") for name in names)))
+    return (
+        select(EmailLog.id, EmailLog.created_at)
+        .where(EmailLog.sent_by == user_id, and_(*conditions))
+        .order_by(EmailLog.created_at.desc(), EmailLog.id.desc())
+        .limit(limit)
+    )
+
+async def timed(conn, query, repeats: int):
+    """Mediana en ms de ejecutar y leer una página, y la última lectura"""
+    samples = []
+    rows = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        rows = (await conn.execute(query)).all()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), rows
+
+async def run(engine, user_id: int, queries, limit: int, pages: int, repeats: int):
+    dialect = engine.dialect.name
+    print(f"\n📊 Páginas de {limit} filas (mediana de {repeats}); página {pages} por cursor")
+    print(f"{'consulta':<26} {'scan ms':>10} {'índice ms':>10} {f'pág {pages} ms':>12}")
+    async with engine.connect() as conn:
+        for q in queries:
+            terms = parse_search(q)
+            scan_ms, _ = await timed(conn, scan_query(user_id, q, limit), repeats)
+            first_ms, rows = await timed(conn, search_query(dialect, user_id, terms, limit), repeats)
+            # Recorrer hasta la página pedida con el cursor (sin medir)
+            deep = "-"
+            for _ in range(pages - 1):
+                if len(rows) < limit:
+                    break
+                last = rows[-1]
+                query = search_query(dialect, user_id, terms, limit, (last.rank, last.created_at, last.id))
+                deep_ms, rows = await timed(conn, query, 1)
+                deep = f"{deep_ms:.2f}"
+            print(f"{q:<26} {scan_ms:>10.2f} {first_ms:>10.2f} {deep:>12}")
+
+async def cleanup(engine):
+    async with engine.begin() as conn:
+        user_id = (await conn.execute(select(User.id).where(User.username == BENCH_USERNAME))).scalar()
+        if user_id is not None:
+            await conn.execute(delete(EmailLog).where(EmailLog.sent_by == user_id))
+            await conn.execute(delete(User).where(User.id == user_id))
+    print("🧹 Datos de benchmark eliminados")
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark de /emails/search: índice (tsvector/trigramas o FTS5) vs LIKE sin índice"
+    )
+    parser.add_argument("--rows", type=int, default=5_000_000, help="logs a sembrar para el usuario de benchmark")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=20, help="página a medir recorriendo con el cursor")
+    parser.add_argument("--query", action="append", help="búsqueda a medir (repetible)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--cleanup", action="store_true", help="borrar los datos sembrados y salir")
+    args = parser.parse_args()
+
+    print(f"🔗 Conectando a: {settings.DATABASE_URL}")
+    engine = create_async_engine(settings.DATABASE_URL, echo=False)
+    try:
+        if args.cleanup:
+            await cleanup(engine)
+            return
+        user_id = await seed(engine, args.rows)
+        await run(engine, user_id, args.query or DEFAULT_QUERIES, args.limit, args.pages, args.repeats)
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
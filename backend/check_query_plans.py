@@ -0,0 +1,39 @@
+import asyncio
+import sys
+from pathlib import Path
+
+# Agregar la ruta del backend al path para importar módulos
+backend_path = Path(__file__).parent
+sys.path.insert(0, str(backend_path))
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.core.config import settings
+from app.db.query_plans import check_query_plans
+# Todos los modelos, para que se resuelvan las relaciones de EmailLog
+from app.models.user import User
+from app.models.role import Role
+from app.models.user_roles import user_roles
+from app.models.mailbox import Mailbox
+from app.models.outgoing_domain import OutgoingDomain
+from app.models.email_log import EmailLog
+
+async def main() -> int:
+    """Sale con 1 si alguna consulta caliente recorre una tabla completa"""
+    print(f"🔗 Conectando a: {settings.DATABASE_URL}")
+    engine = create_async_engine(settings.DATABASE_URL, echo=False)
+    try:
+        async with engine.connect() as conn:
+            async with conn.begin():
+                failures = await check_query_plans(conn)
+    finally:
+        await engine.dispose()
+    for name, scans in failures.items():
+        print(f"❌ {name}: {'; '.join(scans)}")
+    if failures:
+        print(f"💥 {len(failures)} consultas calientes sin índice utilizable")
+        return 1
+    print("✅ Todas las consultas calientes usan índices")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -12,7 +12,8 @@ sys.path.insert(0,str(backend_path))
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy import text
 from app.core.config import settings
-from app.db.base import Base, AsyncSessionLocal
+from app.db.base import AsyncSessionLocal
+from app.db.migrations import upgrade_head
 from app.models.user import User
 from app.models.role import Role
 from app.models.mailbox import Mailbox
@@ -41,12 +42,10 @@ async def create_database_if_not_exists():
     await engine.dispose()
 
 async def create_tables():
-    """Crear todas las tablas del modelo"""
+    """Crear el esquema con las migraciones versionadas (alembic upgrade head)"""
     print("Creating database tables...")
-    engine = create_async_engine(settings.DATABASE_URL, echo=False)
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    await engine.dispose()
+    # env.py de Alembic abre su propio event loop: se corre en un hilo
+    await asyncio.to_thread(upgrade_head)
     print("✅ All tables created successfully")
 
 async def create_initial_roles():
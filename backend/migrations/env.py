@@ -0,0 +1,64 @@
+import asyncio
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import pool
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.core.config import settings
+from app.db.base import Base
+# Todos los modelos, para que Base.metadata tenga el esquema completo
+from app.models.user import User
+from app.models.role import Role
+from app.models.user_roles import user_roles
+from app.models.mailbox import Mailbox
+from app.models.outgoing_domain import OutgoingDomain
+from app.models.email_log import EmailLog
+from app.models.email_link import EmailLink
+from app.models.email_click import EmailClick
+from app.models.email_open_event import EmailOpenEvent
+from app.models.email_stats_hourly import EmailStatsHourly
+from app.models.message import Message
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+def database_url() -> str:
+    return config.get_main_option("sqlalchemy.url") or settings.DATABASE_URL
+
+def run_migrations_offline():
+    """Generar el SQL sin conectarse (alembic upgrade head --sql)"""
+    context.configure(
+        url=database_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def do_run_migrations(connection):
+    # Una transacción por migración: las que crean índices CONCURRENTLY
+    # salen de ella con autocommit_block()
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        transaction_per_migration=True
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+async def run_migrations_online():
+    engine = create_async_engine(database_url(), poolclass=pool.NullPool)
+    try:
+        async with engine.connect() as connection:
+            await connection.run_sync(do_run_migrations)
+    finally:
+        await engine.dispose()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_migrations_online())
@@ -0,0 +1,205 @@
+"""Esquema de partida: tablas e índices anteriores a las migraciones versionadas
+
+Congelado: no depende de los modelos actuales. Las bases creadas antes de
+Alembic quedan en este esquema con upgrade_tables.py, que las marca en esta
+revisión y corre las siguientes.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Búsqueda por asunto (tsvector) y direcciones (trigramas)
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_email_logs_subject_tsv ON email_logs USING GIN (to_tsvector('simple', subject))",
+    "CREATE INDEX IF NOT EXISTS ix_email_logs_to_trgm ON email_logs USING GIN (to_email gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_email_logs_from_trgm ON email_logs USING GIN (from_email gin_trgm_ops)",
+]
+
+# SQLite: tabla FTS5 de contenido externo, sincronizada con triggers
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS email_logs_fts USING fts5("
+    "subject, to_email, from_email, content='email_logs', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS email_logs_fts_ai AFTER INSERT ON email_logs BEGIN "
+    "INSERT INTO email_logs_fts(rowid, subject, to_email, from_email) "
+    "VALUES (new.id, new.subject, new.to_email, new.from_email); END",
+    "CREATE TRIGGER IF NOT EXISTS email_logs_fts_ad AFTER DELETE ON email_logs BEGIN "
+    "INSERT INTO email_logs_fts(email_logs_fts, rowid, subject, to_email, from_email) "
+    "VALUES ('delete', old.id, old.subject, old.to_email, old.from_email); END",
+    "CREATE TRIGGER IF NOT EXISTS email_logs_fts_au AFTER UPDATE OF subject, to_email, from_email ON email_logs BEGIN "
+    "INSERT INTO email_logs_fts(email_logs_fts, rowid, subject, to_email, from_email) "
+    "VALUES ('delete', old.id, old.subject, old.to_email, old.from_email); "
+    "INSERT INTO email_logs_fts(rowid, subject, to_email, from_email) "
+    "VALUES (new.id, new.subject, new.to_email, new.from_email); END",
+]
+
+TABLES = [
+    "email_open_events",
+    "email_clicks",
+    "messages",
+    "email_logs",
+    "user_roles",
+    "outgoing_domains",
+    "mailboxes",
+    "users",
+    "roles",
+    "email_stats_hourly",
+    "email_links",
+]
+
+def upgrade():
+    op.create_table('email_links',
+        sa.Column('url_hash', sa.String(length=16), nullable=False),
+        sa.Column('url', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('url_hash')
+    )
+    op.create_table('email_stats_hourly',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('mailbox_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('user_id', 'bucket', 'mailbox_id', 'status')
+    )
+    op.create_table('roles',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_roles_name'), 'roles', ['name'], unique=True)
+    op.create_table('users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('full_name', sa.String(), nullable=True),
+        sa.Column('hashed_password', sa.String(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
+    op.create_table('mailboxes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('provider', sa.String(), nullable=False),
+        sa.Column('auth_type', sa.String(), nullable=False),
+        sa.Column('settings', sa.String(), nullable=True),
+        sa.Column('is_verified', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column('owner_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('outgoing_domains',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('domain', sa.String(length=255), nullable=False),
+        sa.Column('smtp_host', sa.String(length=255), nullable=True),
+        sa.Column('smtp_port', sa.Integer(), nullable=True),
+        sa.Column('smtp_user', sa.String(length=255), nullable=True),
+        sa.Column('smtp_password', sa.String(length=255), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('domain')
+    )
+    op.create_table('user_roles',
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('role_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['role_id'], ['roles.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], )
+    )
+    op.create_table('email_logs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('to_email', sa.String(length=255), nullable=False),
+        sa.Column('from_email', sa.String(length=255), nullable=False),
+        sa.Column('subject', sa.String(length=500), nullable=False),
+        sa.Column('body', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('sent_by', sa.Integer(), nullable=True),
+        sa.Column('mailbox_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column('opened_at', sa.DateTime(), nullable=True),
+        sa.Column('open_count', sa.Integer(), nullable=True),
+        sa.Column('last_opened_at', sa.DateTime(), nullable=True),
+        sa.Column('tracking_data', sa.JSON(), nullable=True),
+        sa.Column('click_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('last_clicked_at', sa.DateTime(), nullable=True),
+        sa.Column('html_body', sa.Text(), nullable=True),
+        sa.Column('send_options', sa.JSON(), nullable=True),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('locked_by', sa.String(length=100), nullable=True),
+        sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['mailbox_id'], ['mailboxes.id'], ),
+        sa.ForeignKeyConstraint(['sent_by'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_email_logs_queue', 'email_logs', ['status', 'next_attempt_at'], unique=False)
+    op.create_index('ix_email_logs_user_created', 'email_logs', ['sent_by', sa.text('created_at DESC'), sa.text('id DESC')], unique=False)
+    op.create_index('ix_email_logs_user_status_created', 'email_logs', ['sent_by', 'status', sa.text('created_at DESC'), sa.text('id DESC')], unique=False)
+    op.create_table('messages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('subject', sa.String(), nullable=True),
+        sa.Column('body', sa.Text(), nullable=True),
+        sa.Column('sender', sa.String(), nullable=True),
+        sa.Column('recipient', sa.String(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column('mailbox_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['mailbox_id'], ['mailboxes.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('email_clicks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email_log_id', sa.Integer(), nullable=False),
+        sa.Column('url_hash', sa.String(length=16), nullable=False),
+        sa.Column('clicked_at', sa.DateTime(), nullable=False),
+        sa.Column('ip', sa.String(length=64), nullable=True),
+        sa.Column('user_agent', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['email_log_id'], ['email_logs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_email_clicks_email_log_id'), 'email_clicks', ['email_log_id'], unique=False)
+    op.create_table('email_open_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email_log_id', sa.Integer(), nullable=False),
+        sa.Column('opened_at', sa.DateTime(), nullable=False),
+        sa.Column('ip', sa.String(length=64), nullable=True),
+        sa.Column('user_agent', sa.Text(), nullable=True),
+        sa.Column('referrer', sa.Text(), nullable=True),
+        sa.Column('language', sa.String(length=100), nullable=True),
+        sa.Column('classification', sa.String(length=10), nullable=True),
+        sa.Column('data', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['email_log_id'], ['email_logs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_email_open_events_log_opened', 'email_open_events', ['email_log_id', 'opened_at'], unique=False)
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        for statement in POSTGRES_SEARCH_DDL:
+            op.execute(statement)
+    elif dialect == "sqlite":
+        for statement in SQLITE_SEARCH_DDL:
+            op.execute(statement)
+
+def downgrade():
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute("DROP TABLE IF EXISTS email_logs_fts")
+    # Las tablas se borran con sus índices, en orden inverso a las FK
+    for table in TABLES:
+        op.drop_table(table)
@@ -0,0 +1,38 @@
+"""Índices de las consultas calientes, creados sin bloquear escrituras
+
+Revision ID: 0002_performance_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-18
+"""
+from alembic import op
+from app.db.indexes import create_index_concurrently, drop_index_concurrently
+
+revision = "0002_performance_indexes"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+# (nombre, tabla, columnas). sent_by y status ya van como prefijo de los
+# índices de historial y de cola; se listan para bases creadas sin ellos.
+INDEXES = [
+    ("ix_email_logs_user_created", "email_logs", "sent_by, created_at DESC, id DESC"),
+    ("ix_email_logs_user_status_created", "email_logs", "sent_by, status, created_at DESC, id DESC"),
+    ("ix_email_logs_queue", "email_logs", "status, next_attempt_at"),
+    ("ix_email_logs_mailbox_created", "email_logs", "mailbox_id, created_at DESC"),
+    ("ix_email_logs_created", "email_logs", "created_at"),
+    ("ix_mailboxes_owner_verified", "mailboxes", "owner_id, is_verified"),
+]
+
+# Los que agrega esta migración (los otros ya están en 0001_baseline)
+NEW_INDEXES = {"ix_email_logs_mailbox_created", "ix_email_logs_created", "ix_mailboxes_owner_verified"}
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            create_index_concurrently(op.get_bind(), name, table, columns)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            if name in NEW_INDEXES:
+                drop_index_concurrently(op.get_bind(), name, table)
@@ -0,0 +1,298 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Agregar la ruta del backend al path para importar módulos
+backend_path = Path(__file__).parent
+sys.path.insert(0, str(backend_path))
+
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import JSON, bindparam, exists, func, insert, literal, literal_column, select, text, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.core.config import settings
+from app.core.open_tracking import open_event_row
+from app.core.open_classifier import open_classifier
+from app.core.email_search import POSTGRES_SEARCH_DDL
+from app.core.log_archive import create_partition, ensure_partitions, is_partitioned, month_start, next_month
+from app.db.migrations import BASELINE_REVISION, current_revision, stamp_baseline, upgrade_head
+# Todos los modelos, para que se resuelvan las relaciones de EmailLog
+from app.models.user import User
+from app.models.role import Role
+from app.models.user_roles import user_roles
+from app.models.mailbox import Mailbox
+from app.models.outgoing_domain import OutgoingDomain
+from app.models.email_log import EmailLog
+from app.models.email_link import EmailLink
+from app.models.email_click import EmailClick
+from app.models.email_open_event import EmailOpenEvent
+from app.models.message import Message
+from app.models.email_stats_hourly import EmailStatsHourly
+
+# Puesta al día de bases anteriores a las migraciones versionadas: las deja
+# en el esquema de 0001_baseline, las marca en esa revisión y corre
+# `alembic upgrade head`. Los cambios de esquema nuevos van en
+# migrations/versions. Todas las sentencias son idempotentes (IF NOT EXISTS).
+UPGRADES = [
+    # Cola persistente de envío
+    "ALTER TABLE email_logs ADD COLUMN IF NOT EXISTS html_body TEXT",
+    "ALTER TABLE email_logs ADD COLUMN IF NOT EXISTS send_options JSON",
+    "ALTER TABLE email_logs ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE email_logs ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE email_logs ADD COLUMN IF NOT EXISTS locked_by VARCHAR(100)",
+    "ALTER TABLE email_logs ADD COLUMN IF NOT EXISTS locked_until TIMESTAMP WITH TIME ZONE",
+    "CREATE INDEX IF NOT EXISTS ix_email_logs_queue ON email_logs (status, next_attempt_at)",
+    # Historial paginado por cursor
+    "CREATE INDEX IF NOT EXISTS ix_email_logs_user_created ON email_logs (sent_by, created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_email_logs_user_status_created ON email_logs (sent_by, status, created_at DESC, id DESC)",
+    # Tracking de clicks (las tablas email_links y email_clicks las crea create_new_tables)
+    "ALTER TABLE email_logs ADD COLUMN IF NOT EXISTS click_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE email_logs ADD COLUMN IF NOT EXISTS last_clicked_at TIMESTAMP WITHOUT TIME ZONE",
+    # Búsqueda por asunto (tsvector) y direcciones (trigramas)
+    *POSTGRES_SEARCH_DDL,
+]
+
+async def create_new_tables(conn):
+    """Tablas nuevas (con su esquema actual) antes de los ALTER sobre ellas"""
+    tables = (
+        Message.__table__, EmailLink.__table__, EmailClick.__table__,
+        EmailOpenEvent.__table__, EmailStatsHourly.__table__
+    )
+    for table in tables:
+        await conn.run_sync(lambda sync_conn: table.create(sync_conn, checkfirst=True))
+
+# Cambios sobre tablas que crea create_new_tables
+TABLE_UPGRADES = [
+    # Clasificación de aperturas
+    "ALTER TABLE email_open_events ADD COLUMN IF NOT EXISTS classification VARCHAR(10)",
+]
+
+def parse_opened_at(data, fallback):
+    try:
+        return datetime.fromisoformat(data["opened_at"])
+    except Exception:
+        return fallback
+
+async def migrate_open_events(conn, chunk_size: int = 500):
+    """
+    Pasar los arrays tracking_data["opens"] a email_open_events. La primera
+    apertura queda como resumen en tracking_data y también como evento.
+    Idempotente: solo toma logs con tracking_data y sin eventos, así que
+    debe correr antes de que el pixel nuevo registre aperturas.
+    """
+    last_id = 0
+    migrated = 0
+    while True:
+        result = await conn.execute(
+            select(EmailLog.id, EmailLog.opened_at, EmailLog.last_opened_at, EmailLog.tracking_data)
+            .where(
+                EmailLog.id > last_id,
+                EmailLog.tracking_data.is_not(None),
+                ~exists().where(EmailOpenEvent.email_log_id == EmailLog.id)
+            )
+            .order_by(EmailLog.id)
+            .limit(chunk_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        events = []
+        summaries = []
+        for row in rows:
+            data = row.tracking_data
+            if isinstance(data, str):
+                try:
+                    data = json.loads(data)
+                except Exception:
+                    continue
+            if not isinstance(data, dict):
+                continue
+            opens = data.get("opens") or []
+            first = {key: value for key, value in data.items() if key != "opens"}
+            if first:
+                first["classification"] = open_classifier.classify_event(first)
+                events.append(open_event_row(row.id, parse_opened_at(first, row.opened_at or row.last_opened_at), first))
+            for repeat in opens:
+                repeat["classification"] = open_classifier.classify_event(repeat)
+                events.append(open_event_row(row.id, parse_opened_at(repeat, row.last_opened_at or row.opened_at), repeat))
+            if "opens" in data:
+                first.pop("classification", None)
+                summaries.append({"b_id": row.id, "b_data": first or None})
+        events = [event for event in events if event["opened_at"] is not None]
+        if events:
+            await conn.execute(insert(EmailOpenEvent), events)
+        if summaries:
+            table = EmailLog.__table__
+            await conn.execute(
+                update(table).where(table.c.id == bindparam("b_id")).values(tracking_data=bindparam("b_data", type_=JSON)),
+                summaries
+            )
+        migrated += len(events)
+        last_id = rows[-1].id
+    print(f"📦 {migrated} aperturas movidas a email_open_events")
+
+async def classify_open_events(conn, chunk_size: int = 1000):
+    """Etiquetar como human/proxy/bot las aperturas guardadas antes del clasificador"""
+    last_id = 0
+    classified = 0
+    while True:
+        result = await conn.execute(
+            select(EmailOpenEvent.id, EmailOpenEvent.ip, EmailOpenEvent.user_agent, EmailOpenEvent.data)
+            .where(EmailOpenEvent.id > last_id, EmailOpenEvent.classification.is_(None))
+            .order_by(EmailOpenEvent.id)
+            .limit(chunk_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        table = EmailOpenEvent.__table__
+        await conn.execute(
+            update(table).where(table.c.id == bindparam("b_id")).values(classification=bindparam("b_class")),
+            [
+                {
+                    "b_id": row.id,
+                    "b_class": open_classifier.classify(
+                        row.ip, row.user_agent, bool((row.data or {}).get("is_bot"))
+                    )
+                } for row in rows
+            ]
+        )
+        classified += len(rows)
+        last_id = rows[-1].id
+    print(f"🛡️ {classified} aperturas clasificadas")
+
+async def build_email_stats(conn):
+    """
+    Llenar email_stats_hourly desde el historial. Solo corre con el rollup
+    vacío: después lo mantienen las transiciones de estado.
+    """
+    if (await conn.execute(select(EmailStatsHourly.user_id).limit(1))).first() is not None:
+        print("📊 email_stats_hourly ya tiene datos")
+        return
+    logs = EmailLog.__table__
+    events = EmailOpenEvent.__table__
+    # Constantes literales: Postgres no iguala parámetros entre SELECT y GROUP BY
+    hour = lambda column: func.date_trunc(literal_column("'hour'"), column)
+    created_hour = hour(func.timezone(literal_column("'UTC'"), logs.c.created_at))
+    mailbox = func.coalesce(logs.c.mailbox_id, literal_column("0"))
+    classification = func.coalesce(events.c.classification, literal_column("'human'"))
+    sources = [
+        # sent/failed por hora de creación, como en get_email_stats
+        select(logs.c.sent_by, created_hour, mailbox, logs.c.status, func.count())
+        .where(logs.c.sent_by.is_not(None), logs.c.status.in_(["sent", "failed"]))
+        .group_by(logs.c.sent_by, created_hour, mailbox, logs.c.status),
+        # Emails abiertos, por hora de la primera apertura
+        select(logs.c.sent_by, hour(logs.c.opened_at), mailbox, literal("opened"), func.count())
+        .where(logs.c.sent_by.is_not(None), logs.c.opened_at.is_not(None))
+        .group_by(logs.c.sent_by, hour(logs.c.opened_at), mailbox),
+        # Eventos de apertura por origen
+        select(logs.c.sent_by, hour(events.c.opened_at), mailbox, literal("open_") + classification, func.count())
+        .select_from(events.join(logs, logs.c.id == events.c.email_log_id))
+        .where(logs.c.sent_by.is_not(None))
+        .group_by(logs.c.sent_by, hour(events.c.opened_at), mailbox, classification),
+    ]
+    for source in sources:
+        await conn.execute(
+            insert(EmailStatsHourly).from_select(["user_id", "bucket", "mailbox_id", "status", "count"], source)
+        )
+    print("📊 email_stats_hourly generada desde email_logs")
+
+async def partition_email_logs(conn):
+    """
+    Convertir email_logs en una tabla particionada por mes de created_at
+    (una sola vez; después solo se crean las particiones de los próximos
+    meses). La clave primaria pasa a (id, created_at) y las FK de
+    email_open_events y email_clicks hacia email_logs se quitan: Postgres no
+    admite FK hacia una tabla particionada sin la columna de partición, y los
+    borrados de eventos los hace la aplicación.
+    """
+    if await is_partitioned(conn):
+        await ensure_partitions(conn)
+        print("🗂️ email_logs ya está particionada")
+        return
+    await conn.execute(text("UPDATE email_logs SET created_at = now() WHERE created_at IS NULL"))
+    await conn.execute(text("ALTER TABLE email_logs RENAME TO email_logs_legacy"))
+    await conn.execute(text(
+        "CREATE TABLE email_logs (LIKE email_logs_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"
+    ))
+    oldest = (await conn.execute(text("SELECT min(created_at) FROM email_logs_legacy"))).scalar()
+    month = month_start(oldest or datetime.utcnow())
+    while month <= month_start(datetime.utcnow()):
+        await create_partition(conn, month)
+        month = next_month(month)
+    await ensure_partitions(conn)
+    # Lo que quede fuera de los meses creados (fechas futuras, relojes corridos)
+    await conn.execute(text("CREATE TABLE IF NOT EXISTS email_logs_default PARTITION OF email_logs DEFAULT"))
+    copied = (await conn.execute(text("INSERT INTO email_logs SELECT * FROM email_logs_legacy"))).rowcount
+    indexes = (await conn.execute(text(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = 'email_logs_legacy' "
+        "AND indexname <> 'email_logs_pkey'"
+    ))).scalars().all()
+    sequence = (await conn.execute(text("SELECT pg_get_serial_sequence('email_logs_legacy', 'id')"))).scalar()
+    if sequence:
+        await conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY email_logs.id"))
+    for table in ("email_open_events", "email_clicks"):
+        await conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_email_log_id_fkey"))
+    await conn.execute(text("DROP TABLE email_logs_legacy"))
+    # Con la tabla vieja borrada, los nombres de índices quedan libres
+    await conn.execute(text("ALTER TABLE email_logs ADD PRIMARY KEY (id, created_at)"))
+    await conn.execute(text("ALTER TABLE email_logs ADD FOREIGN KEY (sent_by) REFERENCES users (id)"))
+    await conn.execute(text("ALTER TABLE email_logs ADD FOREIGN KEY (mailbox_id) REFERENCES mailboxes (id)"))
+    # Los mismos índices que tenía la tabla, ahora sobre la particionada
+    for indexdef in indexes:
+        await conn.execute(text(indexdef.replace(" ON public.email_logs_legacy ", " ON email_logs ")))
+    print(f"🗂️ email_logs particionada por mes ({copied} logs copiados)")
+
+# Migraciones de datos, después de los cambios de esquema
+DATA_MIGRATIONS = [
+    migrate_open_events,
+    classify_open_events,
+    build_email_stats,
+]
+
+async def upgrade_tables() -> bool:
+    print(f"🔗 Conectando a: {settings.DATABASE_URL}")
+    engine = create_async_engine(settings.DATABASE_URL, echo=False)
+    try:
+        async with engine.begin() as conn:
+            for statement in UPGRADES:
+                print(f"🔄 {statement}")
+                await conn.execute(text(statement))
+            await create_new_tables(conn)
+            for statement in TABLE_UPGRADES:
+                print(f"🔄 {statement}")
+                await conn.execute(text(statement))
+            await partition_email_logs(conn)
+            open_classifier.load(settings.OPEN_CLASSIFIER_CIDR_DIR)
+            for migration in DATA_MIGRATIONS:
+                print(f"🔄 {migration.__name__}")
+                await migration(conn)
+        print("✅ ¡Tablas actualizadas exitosamente!")
+        return True
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return False
+    finally:
+        await engine.dispose()
+
+async def schema_revision() -> Optional[str]:
+    engine = create_async_engine(settings.DATABASE_URL, echo=False)
+    try:
+        async with engine.connect() as conn:
+            return await conn.run_sync(current_revision)
+    finally:
+        await engine.dispose()
+
+def run_migrations():
+    """Migraciones versionadas pendientes (alembic upgrade head)"""
+    if asyncio.run(schema_revision()) is None:
+        # Base anterior a Alembic, ya en el esquema de partida
+        stamp_baseline()
+        print(f"🏷️ Base marcada en la migración {BASELINE_REVISION}")
+    upgrade_head()
+    print("✅ Migraciones aplicadas")
+
+if __name__ == "__main__":
+    if asyncio.run(upgrade_tables()):
+        run_migrations()